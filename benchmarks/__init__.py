@@ -0,0 +1,3 @@
+"""
+Benchmarks of the chart generation. Run the modules from the repository root, e.g. python -m benchmarks.memory
+"""
@@ -0,0 +1,42 @@
+"""
+Benchmark of the memory used by the shape object model of a chart.
+
+Usage: python -m benchmarks.memory [number of bars]
+"""
+from __future__ import print_function
+import gc
+import sys
+import types
+import numpy
+from kmlChart.chart import Bar3D
+
+
+_excludedTypes = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType)
+
+
+def deepSizeOf(root):
+    """Return the number of bytes of all objects reachable from root, ignoring classes, modules and functions.
+    """
+    seen = set()
+    pending = [root]
+    size = 0
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _excludedTypes):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def main(num=100000):
+    chart = Bar3D('MemoryBenchmark')
+    chart.add(numpy.full(num, 10.0), numpy.linspace(50, 51, num), numpy.arange(num, dtype=float), radius=1e-5)
+    size = deepSizeOf(chart.kml)
+    print('%d bars: %.1f MB object model, %d bytes per bar' % (num, size / 1e6, size // num))
+    return size
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,256 @@
+"""
+Benchmark suite measuring throughput, output size and peak memory of the chart generation.
+
+Every case runs in a process of its own, so the peak memory of one case does not affect the others. The memory of
+the measured phase, without the setup of its data, is measured as peak of the memory allocated by Python with
+tracemalloc if available (Python 3). Otherwise, e.g. on Python 2, it is the growth of the resident set size of the
+process, sampled every few milliseconds on Linux or taken from the maximum resident set size elsewhere, which is
+coarser and includes memory reused from the setup. The method is recorded in the results and the output.
+
+Usage: python -m benchmarks.suite [--sizes 1000 10000 ...] [--cases Bar3D.add ...] [--output results.json]
+                                  [--compare old_results.json] [--timeout 600]
+"""
+from __future__ import print_function
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from Queue import Empty
+from collections import OrderedDict
+import numpy
+from kmlChart.chart import Bar3D, Surface
+from kmlChart.legend import pngLegend
+from kmlChart.colorBars import jet
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+    import resource
+
+if tracemalloc is not None:
+    MEMORY = 'tracemalloc peak'
+elif os.path.exists('/proc/self/statm'):
+    MEMORY = 'sampled RSS growth'
+else:
+    MEMORY = 'maxrss growth'
+
+
+def _barData(size):
+    side = int(numpy.ceil(numpy.sqrt(size)))
+    lon, lat = numpy.meshgrid(10 + numpy.arange(side) * 1e-3, 50 + numpy.arange(side) * 1e-3)
+    return lon.ravel()[:size], lat.ravel()[:size], numpy.random.RandomState(0).rand(size) * 1000
+
+
+def _barChart(size):
+    chart = Bar3D('Benchmark')
+    chart.add(*_barData(size), radius=4e-4)
+    return chart
+
+
+def _surfaceData(size):
+    lon, lat, values = _barData(size)
+    square = numpy.array(((-5e-4, -5e-4), (5e-4, -5e-4), (5e-4, 5e-4), (-5e-4, 5e-4), (-5e-4, -5e-4)))
+    return numpy.column_stack((lon, lat))[:, None, :] + square[None, :, :], values
+
+
+def _setupBar3D(size):
+    data = _barData(size)
+    def run():
+        Bar3D('Benchmark').add(*data, radius=4e-4)
+        return size, 0
+    return run
+
+
+def _setupSurface(size):
+    corners, values = _surfaceData(size)
+    def run():
+        Surface('Benchmark').add(corners, values)
+        return size, 0
+    return run
+
+
+def _setupGetAsString(size):
+    chart = _barChart(size)
+    def run():
+        return size, len(chart.kml.getAsString())
+    return run
+
+
+def _setupSave(size):
+    chart = _barChart(size)
+    def run():
+        handle, filename = tempfile.mkstemp(suffix='.kml')
+        os.close(handle)
+        try:
+            chart.save(filename, streaming=True)
+            return size, os.path.getsize(filename)
+        finally:
+            os.remove(filename)
+    return run
+
+
+def _setupLegend(size):
+    num = max(1, size // 1000)    # one legend per thousand elements
+    def run():
+        handle, filename = tempfile.mkstemp(suffix='.png')
+        os.close(handle)
+        try:
+            for i in xrange(num):
+                pngLegend((0, 1000 + i), jet).save(filename)
+            return num, os.path.getsize(filename) * num
+        finally:
+            os.remove(filename)
+    return run
+
+
+CASES = OrderedDict((
+    ('Bar3D.add', _setupBar3D),
+    ('Surface.add', _setupSurface),
+    ('KMLdata.getAsString', _setupGetAsString),
+    ('chart.save', _setupSave),
+    ('pngLegend', _setupLegend),
+))
+
+
+def _measure(case, size, queue):
+    try:
+        queue.put(_measureCase(case, size))
+    except BaseException:
+        queue.put({'error': traceback.format_exc()})
+
+
+def _residentBytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _sampleResident(peak, stop, interval=0.005):
+    """Keep the largest resident set size in peak[0], sampled every interval seconds until the event stop is set.
+    """
+    while not stop.is_set():
+        peak[0] = max(peak[0], _residentBytes())
+        stop.wait(interval)
+
+
+def _measureCase(case, size):
+    run = CASES[case](size)
+    if MEMORY == 'tracemalloc peak':
+        tracemalloc.start()
+    elif MEMORY == 'sampled RSS growth':
+        baseline = _residentBytes()
+        samples, stop = [baseline], threading.Event()
+        sampler = threading.Thread(target=_sampleResident, args=(samples, stop))
+        sampler.daemon = True
+        sampler.start()
+    else:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss    # including the setup
+    start = time.time()
+    elements, outputBytes = run()
+    seconds = time.time() - start
+    if MEMORY == 'tracemalloc peak':
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    elif MEMORY == 'sampled RSS growth':
+        stop.set()
+        sampler.join()
+        peak = max(samples[0], _residentBytes()) - baseline
+    else:
+        peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) * 1024     # kilobytes on Linux
+    return OrderedDict((
+        ('case', case),
+        ('size', size),
+        ('seconds', seconds),
+        ('elementsPerSecond', elements / seconds if seconds > 0 else None),
+        ('outputBytes', outputBytes),
+        ('peakMemoryBytes', peak),
+    ))
+
+
+def runCase(case, size, timeout=None):
+    """Run the benchmark case with size elements in a process of its own and return its result dictionary. Raises
+    a RuntimeError with the traceback of the process if the case fails, the process dies or it takes longer than
+    timeout seconds.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_measure, args=(case, size, queue))
+    process.start()
+    start = time.time()
+    while True:
+        try:
+            result = queue.get(timeout=1)
+            break
+        except Empty:
+            if process.exitcode is not None:
+                raise RuntimeError('Process of %s exited with code %d.' % (case, process.exitcode))
+            if timeout is not None and time.time() - start > timeout:
+                process.terminate()
+                process.join()
+                raise RuntimeError('%s did not finish within %g seconds.' % (case, timeout))
+    process.join()
+    if 'error' in result:
+        raise RuntimeError('%s failed:\n%s' % (case, result['error']))
+    return result
+
+
+def compare(results, reference):
+    """Print the relative change of the time and peak memory of results compared to the reference results.
+    """
+    if reference.get('peakMemory') != results['peakMemory']:
+        print('Memory measured as %s, the reference as %s.' % (results['peakMemory'], reference.get('peakMemory')),
+              file=sys.stderr)
+    old = dict(((r['case'], r['size']), r) for r in reference['results'])
+    for result in results['results']:
+        ref = old.get((result['case'], result['size']))
+        if ref is None:
+            continue
+        print('%-20s %8d  time %+7.1f%%  memory %+7.1f%%' % (
+            result['case'], result['size'],
+            100.0 * (result['seconds'] / ref['seconds'] - 1) if ref['seconds'] else 0,
+            100.0 * (float(result['peakMemoryBytes']) / ref['peakMemoryBytes'] - 1) if ref['peakMemoryBytes'] else 0,
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the chart generation.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10**3, 10**4, 10**5, 10**6])
+    parser.add_argument('--cases', nargs='+', choices=CASES.keys(), default=CASES.keys())
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--timeout', type=float, help='seconds after which a case is stopped')
+    args = parser.parse_args(argv)
+
+    results = OrderedDict((
+        ('python', sys.version.split()[0]),
+        ('platform', platform.platform()),
+        ('peakMemory', MEMORY),
+        ('results', []),
+    ))
+    for case in args.cases:
+        for size in args.sizes:
+            try:
+                result = runCase(case, size, args.timeout)
+            except RuntimeError as e:
+                print('%-20s %8d  %s' % (case, size, e), file=sys.stderr)
+                continue
+            results['results'].append(result)
+            print('%-20s %8d  %8.3f s  %12.0f elements/s  %12d bytes  %8.1f MB %s' % (
+                case, size, result['seconds'], result['elementsPerSecond'] or 0, result['outputBytes'],
+                result['peakMemoryBytes'] / 1e6, MEMORY))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return results
+
+
+if __name__ == '__main__':
+    main()
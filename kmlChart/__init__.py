@@ -5,4 +5,6 @@ This module may be used to create charts and save them in KML files to
 display the chart inside Google Earth.
 """
 
-from .chart import Bar3D, Surface
+from .chart import Bar3D, Surface, TimeSeries
+from .colorMap import ColorMap
+from .stats import Stats
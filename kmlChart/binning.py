@@ -0,0 +1,97 @@
+"""
+Module to aggregate scattered points into bins of a hexagonal or regular grid, e.g. to chart millions of samples as a
+few thousand bars.
+"""
+from __future__ import absolute_import
+import numpy
+
+_SQRT3 = numpy.sqrt(3.0)
+REDUCERS = ('mean', 'median', 'min', 'max', 'sum', 'count')
+
+
+def gridBins(x, y, cellSize):
+    """Return the (column, row) indices of the square cells of size cellSize containing the points (x, y) and the
+    centers of these cells as arrays x and y.
+    """
+    column = numpy.floor(x / cellSize).astype(numpy.int64)
+    row = numpy.floor(y / cellSize).astype(numpy.int64)
+    return column, row, (column + 0.5) * cellSize, (row + 0.5) * cellSize
+
+
+def hexBins(x, y, cellSize):
+    """Return the (column, row) indices of the hexagons with pointy tops containing the points (x, y) and the centers
+    of these hexagons as arrays x and y. cellSize is the distance of the centers of neighbouring hexagons. The
+    hexagons of odd rows are shifted by half a cell to the right.
+    """
+    # The centers form two rectangular lattices, the even and the odd rows; every point belongs to the nearest center
+    # of the four surrounding ones of either lattice
+    u, v = x / cellSize, y / (_SQRT3 * cellSize)
+    evenColumn, evenRow = numpy.round(u), numpy.round(v)
+    oddColumn, oddRow = numpy.floor(u), numpy.floor(v)
+    odd = (u - oddColumn - 0.5) ** 2 + 3 * (v - oddRow - 0.5) ** 2 < (u - evenColumn) ** 2 + 3 * (v - evenRow) ** 2
+    column = numpy.where(odd, oddColumn, evenColumn).astype(numpy.int64)
+    row = numpy.where(odd, 2 * oddRow + 1, 2 * evenRow).astype(numpy.int64)
+    return column, row, (column + 0.5 * (row % 2)) * cellSize, row * (0.5 * _SQRT3 * cellSize)
+
+
+def aggregate(groups, values, reducer='mean'):
+    """Reduce the values per group. groups are the group numbers 0 to G-1 of the values, every group having at least
+    one value. reducer is one of REDUCERS or a number q from 0 to 100 for the q-th percentile. Returns an array of the
+    G reduced values.
+    """
+    counts = numpy.bincount(groups)
+    if reducer == 'count':
+        return counts
+    if reducer == 'sum':
+        return numpy.bincount(groups, values, len(counts))
+    if reducer == 'mean':
+        return numpy.bincount(groups, values, len(counts)) / counts
+    # Other reducers pick from the values sorted by group and value
+    if reducer == 'median':
+        reducer = 50
+    elif reducer == 'min':
+        reducer = 0
+    elif reducer == 'max':
+        reducer = 100
+    elif isinstance(reducer, basestring) or not 0 <= reducer <= 100:
+        raise ValueError('Reducer must be one of %s or a percentile from 0 to 100.' % ', '.join(REDUCERS))
+    ordered = values[numpy.lexsort((values, groups))]
+    starts = numpy.concatenate(((0,), numpy.cumsum(counts)[:-1]))
+    positions = starts + reducer / 100.0 * (counts - 1)
+    lower = numpy.floor(positions).astype(numpy.int64)
+    upper = numpy.minimum(lower + 1, starts + counts - 1)
+    return ordered[lower] + (positions - lower) * (ordered[upper] - ordered[lower])
+
+
+def binPoints(lon, lat, values=None, cellSize=0.01, shape='hex', reducer='mean'):
+    """Aggregate the values at the points (lon, lat) into bins of the shape 'hex' or 'grid' with the size cellSize
+    in degrees of latitude, see hexBins and gridBins. The longitudes are scaled by the cosine of the mean latitude,
+    so the bins are about as wide as high. reducer is applied to the values of every bin, see aggregate; values may
+    be None to count the points. Points or values that are None or NaN are skipped. Returns the arrays of the
+    longitudes and latitudes of the centers of all bins containing points, their reduced values and point counts.
+    """
+    lon = numpy.asarray(lon, dtype=float)
+    lat = numpy.asarray(lat, dtype=float)
+    valid = numpy.isfinite(lon) & numpy.isfinite(lat)
+    if values is not None:
+        values = numpy.asarray(values, dtype=float)
+        valid &= numpy.isfinite(values)
+        values = values[valid]
+    elif reducer != 'count':
+        raise ValueError('Values are needed to apply the reducer %r.' % (reducer,))
+    lon, lat = lon[valid], lat[valid]
+    if len(lon) == 0:
+        empty = numpy.empty(0)
+        return empty, empty, empty, numpy.empty(0, dtype=numpy.int64)
+    scale = numpy.cos(numpy.radians(lat.mean()))
+    if shape == 'hex':
+        column, row, x, y = hexBins(lon * scale, lat, cellSize)
+    elif shape == 'grid':
+        column, row, x, y = gridBins(lon * scale, lat, cellSize)
+    else:
+        raise ValueError('Shape must be either hex or grid.')
+    keys = (row - row.min()) * (column.max() - column.min() + 1) + (column - column.min())
+    keys, first, groups = numpy.unique(keys, return_index=True, return_inverse=True)
+    counts = numpy.bincount(groups)
+    binValues = counts if values is None else aggregate(groups, values, reducer)
+    return x[first] / scale, y[first], binValues, counts
@@ -2,10 +2,27 @@
 Module to create charts.
 """
 from __future__ import absolute_import
-from .kmlInterface import KMLdata, Placemark, Polygon
+from .kmlInterface import KMLdata, Placemark, Polygon, Fragment, LazyFolder, NetworkLink, ScreenOverlay, \
+    GroundOverlay, region, timeSpan, _styleValues
+from collections import OrderedDict
+from inspect import getcallargs
+from itertools import islice
 from math import cos, pi, sin
+import hashlib
+import json
+import multiprocessing
+import os
+import numpy
 from .colorBars import jet
-from kmlChart.kmlInterface import PolyStyle, LineStyle, Folder
+from .colorMap import ColorMap
+from .tiling import saveTiled
+from .binning import binPoints
+from .geometry import isobands, mergeCells, simplifyRings
+from .kmz import KMZWriter
+from .legend import legendPNG
+from .raster import pixelGrid, colorImage, pngString, pyramid
+from .stats import lapTimer
+from kmlChart.kmlInterface import PolyStyle, LineStyle, BalloonStyle, Folder, MultiGeometry
 
 
 def diff(aList):
@@ -27,115 +44,782 @@ def circle(corners=32, center=(0,0), radius=(1,1)):
     return circle
 
 
+_unitCircles = {}
+
+
+def _unitCircle(corners):
+    """Helper function returning the cached sine and cosine tables of a closed unit circle with N corners.
+    """
+    table = _unitCircles.get(corners)
+    if table is None:
+        angles = 2.0 * numpy.arange(corners + 1) / corners * pi
+        angles[-1] = 0.0    # close circle
+        table = _unitCircles[corners] = (numpy.sin(angles), numpy.cos(angles))
+    return table
+
+
+def circles(lon, lat, radius_lon, radius_lat, corners=32):
+    """Vectorized version of circle. Computes the outlines of N circles or ellipses at once and returns an array of
+    shape (N, corners + 1, 2) with the closed (lon, lat) outlines. All arguments may be arrays of length N or scalars.
+    """
+    sin_table, cos_table = _unitCircle(corners)
+    outlines = numpy.empty((len(lon), corners + 1, 2))
+    outlines[:, :, 0] = numpy.asarray(lon, dtype=float)[:, None] + numpy.outer(radius_lon, sin_table)
+    outlines[:, :, 1] = numpy.asarray(lat, dtype=float)[:, None] + numpy.outer(radius_lat, cos_table)
+    return outlines
+
+
+def cornerCount(radius, resolution, minimum=6, maximum=32):
+    """Helper function returning the number of corners of a circle with radius radius, whose outline deviates at most
+    half of resolution from the true circle, e.g. half a pixel if resolution is the size of a pixel in the same unit.
+    The number is limited to the range minimum to maximum.
+    """
+    if resolution >= radius:
+        return minimum
+    corners = int(numpy.ceil(pi / numpy.arccos(1 - 0.5 * resolution / radius)))
+    return max(minimum, min(maximum, corners))
+
+
 class chart(object):
     """Abstract base class for charts.
     """
-    def __init__(self, title=None, description=None):
-        self.kml = KMLdata(name=title, description=description)
+    def __init__(self, title=None, description=None, precision=None, stats=None, cache=False, cache_dir=None):
+        """Create a chart with the given title and description. precision is the number of decimals of the
+        coordinates in the KML output, None meaning full precision. If a Stats instance stats is given, the time and
+        element counts of all phases of building and rendering the chart are recorded per series.
+        If cache is True, the rendered XML of every series is kept, so saving the chart again only renders the series
+        modified since, which are found by comparing the coordinates and styles of all series. If a directory cache_dir is given, the rendered series are also stored there, keyed by a hash
+        of the arguments of add, and reused by later runs adding a series with the same data.
+        """
+        self.kml = KMLdata(name=title, description=description, precision=precision, stats=stats,
+                           cache=cache or cache_dir is not None)
         self.title = title
+        self.stats = stats
+        self.cache_dir = cache_dir
+        self._styleNames = {}
+        self.colormap = None    # of the last series added
+        self.resources = OrderedDict()  # files referenced by the document, relative path -> content
 
-    def save(self, filename):
-        """Save the chart as KML file with filename filename.
+    def _style(self, styles, shared):
+        """Return the list of styles styles for a placemark. If shared is True, the styles are registered once as
+        named style of the KML document and the URL of this style is returned instead.
         """
+        if not shared:
+            return styles
+        key = _styleValues(styles)
+        name = self._styleNames.get(key)
+        if name is None:
+            # The name is derived from the style itself, so it is the same in series loaded from cache_dir
+            name = self._styleNames[key] = 'style' + hashlib.sha1(repr(key)).hexdigest()[:10]
+            self.kml.styles.addStyle(name, styles)
+        return '#' + name
+
+    def _cacheKey(self, *args):
+        """Return the hash identifying a series by the arguments args of add.
+        """
+        digest = hashlib.sha1(repr((self.__class__.__name__, self.kml.precision)))
+        for arg in args:
+            if isinstance(arg, numpy.ndarray):
+                digest.update(repr((arg.dtype.str, arg.shape)))
+                digest.update(numpy.ascontiguousarray(arg).tostring())
+            else:
+                digest.update(repr(arg))
+        return digest.hexdigest()
+
+    def _loadCached(self, key):
+        """Add the series stored in cache_dir under key and return True, or return False if there is none. The
+        color map of the series becomes the one of the last series added, as if it had been added anew.
+        """
+        if self.cache_dir is None:
+            return False
+        filename = os.path.join(self.cache_dir, key)
+        if not (os.path.isfile(filename + '.kml.part') and os.path.isfile(filename + '.json')):
+            return False
+        with open(filename + '.json') as f:
+            series = json.load(f)
+            for name, styleKey in series['styles']:
+                styleKey = tuple((str(cls), tuple((str(field), str(value) if isinstance(value, unicode) else value)
+                                                  for field, value in fields)) for cls, fields in styleKey)
+                if styleKey not in self._styleNames:
+                    self._styleNames[styleKey] = name
+                    self.kml.styles.addStyle(name, [
+                        _styleClasses[cls].shared(**dict((field, value) for field, value in fields if value is not None))
+                        for cls, fields in styleKey])
+        colorbar, caxis, scale, breakpoints = series['colormap']
+        self.colormap = ColorMap([tuple(color) for color in colorbar], caxis, str(scale), breakpoints)
+        # The byte ranges and bounds of the placemarks allow saveTiled to split the series
+        parts = [(offset, length, None if bounds is None else tuple(bounds)) for offset, length, bounds in series['parts']]
+        self.kml.add(Fragment(filename + '.kml.part', parts=parts))
+        return True
+
+    def _storeCached(self, folder, key, styles):
+        """Store the series folder just added with the shared style URLs styles, the current color map and the
+        byte ranges and bounds of its placemarks in cache_dir under key. It is stored right away, so the cache is
+        filled however the chart is output later.
+        """
+        if self.cache_dir is None:
+            return
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        styleKeys = dict(('#' + name, key) for key, name in self._styleNames.iteritems())
+        filename = os.path.join(self.cache_dir, key)
+        colormap = self.colormap
+        breakpoints = None if colormap.breakpoints is None else colormap.breakpoints.tolist()
+        with open(filename + '.kml.part.tmp', 'wb') as f:
+            parts = folder.streamParts(f, self.kml.precision)     # keeps the XML for rendering the document
+        with open(filename + '.json.tmp', 'w') as f:
+            json.dump({
+                'styles': [(url[1:], styleKeys[url]) for url in sorted(set(style for style in styles
+                                                                           if isinstance(style, str)))],
+                'colormap': (colormap.colorbar, [float(value) for value in colormap.caxis], colormap.scale,
+                             breakpoints),
+                'parts': parts,
+            }, f)
+        # Rename at last, so an interrupted run does not leave a partial series in the cache
+        os.rename(filename + '.json.tmp', filename + '.json')
+        os.rename(filename + '.kml.part.tmp', filename + '.kml.part')
+
+    def add_legend(self, colorbar=None, caxis=None, href='legend.png', screen_xy=(0.01, 0.05), size=(200, 400)):
+        """Add a legend image of the color bar or ColorMap colorbar with the color axis caxis, both defaulting to the
+        colors of the last series added. The legend is shown in the lower left corner of the screen, at the fractions
+        screen_xy of the width and height, with size (width, height) pixels. The image is embedded into KMZ files or
+        saved as href next to KML files.
+        """
+        if colorbar is None:
+            colorbar = jet if self.colormap is None else self.colormap
+        if caxis is None and not (isinstance(colorbar, ColorMap) and colorbar.caxis is not None):
+            if self.colormap is None:
+                raise ValueError('Color axis cannot be determined, please specify one.')
+            caxis = self.colormap.caxis
+        colormap = _colormap(colorbar, caxis, ())
+        self.resources[href] = legendPNG(colormap.caxis, colormap.colors, size, colormap.scale, colormap.breakpoints)
+        self.kml.add(ScreenOverlay(href, name='Legend', screenXY=screen_xy))
+
+    def save(self, filename, streaming=False, tile_size=None, processes=None, compresslevel=6):
+        """Save the chart as KML file with filename filename. If streaming is True, the shapes are written to the file
+        one after another instead of building the whole document in memory first. If tile_size is given, the
+        placemarks are split into a quadtree of tiles with at most tile_size placemarks, which are saved in a
+        directory next to filename and loaded by Google Earth only when they are in view. If processes is given, the
+        shapes are rendered by a pool of processes worker processes and streamed into the file.
+        If filename ends with .kmz, the document is streamed into a compressed KMZ archive together with the files it
+        references, e.g. the legend. compresslevel is the compression level from 0 (none) to 9 (best). Saving a
+        document of 4 GB or more as KMZ file raises a ValueError.
+        """
+        if filename.lower().endswith('.kmz'):
+            if tile_size is not None:
+                raise ValueError('Tiled charts cannot be saved as KMZ file.')
+            with open(filename, 'wb') as f:
+                archive = KMZWriter(f, compresslevel)
+                document = archive.open('doc.kml')
+                self.kml.write(document, processes)
+                document.close()
+                for name, data in self.resources.iteritems():
+                    archive.writestr(name, data)
+                archive.close()
+            return
+        for name, data in self.resources.iteritems():
+            path = os.path.join(os.path.dirname(filename), name)
+            if not os.path.isdir(os.path.dirname(path) or '.'):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'wb') as f:
+                f.write(data)
+        if tile_size is not None:
+            saveTiled(self.kml, filename, tile_size)
+            return
         with open(filename, 'w') as f:
-            f.write(self.kml.getAsString())
+            if streaming or processes is not None:
+                self.kml.write(f, processes)
+            else:
+                f.write(self.kml.getAsString())
 
 
 class Bar3D(chart):
     """Generate a three-dimensional bar graph.
     """
+    VALUES = 'z_list'   # argument of add with the values to color
+
     def add(self, lon_list, lat_list, z_list, label=None, description=None, colorbar=jet, radius=None,
-            relativeToGround=False, display_name='MeasSeries', visibility=True):
+            relativeToGround=False, display_name='MeasSeries', visibility=True, shared_styles=False, caxis=None,
+            batch=False, corners=32, view_resolution=None):
         """Add a measurement series to the bar graph. lon_list is a list with N longitudes, lat_list a list with N latitudes,
-        and z_list a list of N altitudes. You may specify a custom cylinder radius of radius longitude degrees.
+        and z_list a list of N altitudes. The lists may also be NumPy arrays; None or NaN values are skipped. You may
+        specify a custom cylinder radius of radius longitude degrees.
+        colorbar is either a color bar or a ColorMap. The color axis caxis defaults to the range of z_list.
+        If shared_styles is True, one named style per color of the color bar is added to the document and referenced
+        by the placemarks instead of giving every placemark its own inline style.
+        If batch is True, all bars of the same color are put into a single placemark with a MultiGeometry, which
+        reduces the size of the file and the loading time considerably. Only bars with an own label or description in
+        the lists label or description are kept as placemarks of their own.
+        corners is the number of corners of the bars. If the expected size of a screen pixel view_resolution in meters
+        is given, the number of corners is reduced as far as the bars still look round at this scale, down to six.
         """
+        lap = lapTimer(self.stats, display_name)
+        lon_list = numpy.array(lon_list, dtype=float)     # None becomes NaN
+        lat_list = numpy.array(lat_list, dtype=float)
+        z_list = numpy.array(z_list, dtype=float)
+        if self.cache_dir is not None:
+            key = self._cacheKey(lon_list, lat_list, z_list, label, description, colorbar, radius, relativeToGround,
+                                 display_name, visibility, shared_styles, caxis, batch, corners, view_resolution)
+            if self._loadCached(key):
+                lap('cache', count=len(z_list))
+                return
         folder = Folder(name=display_name, visibility=visibility)
         self.kml.add(folder)
+        valid = numpy.isfinite(lon_list) & numpy.isfinite(lat_list) & numpy.isfinite(z_list)
         if radius is None:
-            try:
-                radius = 0.8 * min(filter(lambda x: x > 0, diff(lon_list)))
-            except ValueError:
+            lon_diff = numpy.diff(lon_list)
+            lon_diff = lon_diff[lon_diff > 0]
+            if len(lon_diff) == 0:
                 raise Exception('Radius cannot be determined, please specify one.')
-        z_list_noNone = filter(lambda x: x is not None, z_list)
-        zaxis = (min(z_list_noNone), max(z_list_noNone))
-        for i in xrange(len(lon_list)):
-            lat = lat_list[i]
-            lon = lon_list[i]
-            z   = z_list[i]
-            if z is None:
-                continue    # equal to NaN, skip this value
-            col = _colorbar_color(colorbar, zaxis, z)
-            c = circle(center=(lon, lat), radius=(radius / cos(lat), radius))
-            if isinstance(label, (list, tuple)): pname = label[i]
+            radius = 0.8 * lon_diff.min()
+        lap('validation', count=len(z_list))
+        colormap = self.colormap = _colormap(colorbar, caxis, z_list[valid])
+        colors = colormap.kmlColors()
+        colorIndices = colormap.indices(z_list)
+        lap('colors', count=len(z_list))
+        binStyles = {}
+        indices = numpy.flatnonzero(valid)
+        if view_resolution is not None:
+            corners = cornerCount(radius * _METERS_PER_DEGREE, view_resolution, maximum=corners)
+        outlines = self._outlines(lon_list[indices], lat_list[indices], z_list[indices], radius, corners)
+        lap('geometry', count=len(indices))
+        altitudeMode = 'relativeToGround' if relativeToGround else 'absolute'
+        labels = isinstance(label, (list, tuple))
+        descriptions = isinstance(description, (list, tuple))
+        batches = {}
+        for i, outline in zip(indices, outlines):
+            col = colorIndices[i]
+            styles = binStyles.get(col)
+            if styles is None:
+                styles = binStyles[col] = self._style([PolyStyle.shared(color=colors[col], outline=0)], shared_styles)
+            if labels: pname = label[i]
             else: pname = label
-            if isinstance(description, (list, tuple)): pdesc = description[i]
+            if descriptions: pdesc = description[i]
             else: pdesc = description
+            polygon = Polygon(outline, extrude=True, altitudeMode=altitudeMode)
+            if batch and not (labels and pname is not None) and not (descriptions and pdesc is not None):
+                multiGeometry = batches.get(col)
+                if multiGeometry is None:
+                    multiGeometry = batches[col] = MultiGeometry()
+                    folder.add(
+                        Placemark(
+                            name=None if labels else label,
+                            description=None if descriptions else description,
+                            style=styles).add(multiGeometry)
+                        )
+                multiGeometry.add(polygon)
+                continue
             folder.add(
                 Placemark(
                     name=pname,
                     description=pdesc,
-                    style=[
-                        PolyStyle(
-                            color='ff%02x%02x%02x' % (col[2], col[1], col[0]),    # attention, color format aabbggrr (alpha, blue, green, red)
-                            outline=0,
-                        )
-                    ]).add(
-                        Polygon((i + (z,) for i in c), extrude=True, altitudeMode='relativeToGround' if relativeToGround else 'absolute')
+                    style=styles).add(
+                        polygon
                     )
                 )
+        lap('construction', count=len(indices))
+        if self.cache_dir is not None:
+            self._storeCached(folder, key, binStyles.values())
+
+    def add_stream(self, records, caxis=None, radius=None, description=None, colorbar=jet, relativeToGround=False,
+                   display_name='MeasSeries', visibility=True, shared_styles=False, corners=32, view_resolution=None,
+                   chunk_size=10000):
+        """Add a measurement series given as iterable of records (lon, lat, z) or (lon, lat, z, label), e.g. the rows
+        of a CSV reader or a database cursor. The bars are only created while the chart is saved, chunk_size records
+        at a time, so a series of any length needs constant memory if the chart is saved with streaming=True.
+        Unless both the color axis caxis and the radius are given, they are determined by a first pass over the
+        records, which therefore must be iterable twice, e.g. a list. Iterators such as files, CSV readers or cursors
+        are iterated once per save, so they need caxis and radius and can only be saved once.
+        The other arguments are the same as for add.
+        """
+        lap = lapTimer(self.stats, display_name)
+        scale = colorbar.scale if isinstance(colorbar, ColorMap) else 'linear'
+        fitAxis = caxis is None and (not isinstance(colorbar, ColorMap) or colorbar.caxis is None)
+        if fitAxis or radius is None:
+            if iter(records) is records:
+                raise ValueError('Records can be iterated only once, please specify caxis and radius.')
+            low, high, lon_diff = _recordRanges(records, chunk_size, scale)
+            if fitAxis:
+                caxis = (low, high)
+            if radius is None:
+                if lon_diff is None:
+                    raise Exception('Radius cannot be determined, please specify one.')
+                radius = 0.8 * lon_diff
+            lap('validation')
+        colormap = self.colormap = _colormap(colorbar, caxis, ())
+        styles = [self._style([PolyStyle.shared(color=color, outline=0)], shared_styles)
+                  for color in colormap.kmlColors()]
+        if view_resolution is not None:
+            corners = cornerCount(radius * _METERS_PER_DEGREE, view_resolution, maximum=corners)
+        altitudeMode = 'relativeToGround' if relativeToGround else 'absolute'
+
+        def placemarks():
+            for chunk in _chunks(records, chunk_size):
+                lon, lat, z = (numpy.array([record[i] for record in chunk], dtype=float) for i in xrange(3))
+                indices = numpy.flatnonzero(numpy.isfinite(lon) & numpy.isfinite(lat) & numpy.isfinite(z))
+                colorIndices = colormap.indices(z[indices])
+                outlines = self._outlines(lon[indices], lat[indices], z[indices], radius, corners)
+                for i, col, outline in zip(indices, colorIndices, outlines):
+                    yield Placemark(
+                        name=chunk[i][3] if len(chunk[i]) > 3 else None,
+                        description=description,
+                        style=styles[col]).add(
+                            Polygon(outline, extrude=True, altitudeMode=altitudeMode)
+                        )
+
+        self.kml.add(LazyFolder(placemarks, name=display_name, visibility=visibility))
+
+    def add_binned(self, lon_list, lat_list, z_list, cell_size, shape='hex', reducer='mean', radius=None,
+                   description=None, colorbar=jet, relativeToGround=False, display_name='MeasSeries', visibility=True,
+                   shared_styles=False, caxis=None, batch=False, corners=32, view_resolution=None):
+        """Add a measurement series of scattered samples aggregated into bins, with one bar per bin. The samples are
+        binned into hexagons (shape='hex') or squares (shape='grid') of the size cell_size in degrees of latitude and
+        the values z_list of every bin are reduced by reducer: 'mean', 'median', 'min', 'max', 'sum', 'count' or a
+        number q from 0 to 100 for the q-th percentile. z_list may be None to count the samples. The radius of the
+        bars defaults to nearly half of cell_size, so neighbouring bars do not overlap. The other arguments are the
+        same as for add.
+        """
+        lap = lapTimer(self.stats, display_name)
+        lon, lat, values = binPoints(lon_list, lat_list, z_list, cell_size, shape, reducer)[:3]
+        lap('binning', count=len(values))
+        if radius is None:
+            radius = 0.45 * cell_size
+        self.add(lon, lat, values, None, description, colorbar, radius, relativeToGround, display_name, visibility,
+                 shared_styles, caxis, batch, corners, view_resolution)
+
+    @staticmethod
+    def _outlines(lon, lat, z, radius, corners):
+        """Return the outlines of bars at the altitudes z as array of shape (N, corners + 1, 3).
+        """
+        outlines2D = circles(lon, lat, radius / numpy.cos(numpy.radians(lat)), radius, corners)
+        outlines = numpy.empty(outlines2D.shape[:2] + (3,))
+        outlines[:, :, :2] = outlines2D
+        outlines[:, :, 2] = z[:, None]
+        return outlines
 
 
 class Surface(chart):
     """Generate a surface plot.
     """
+    VALUES = 'value_list'   # argument of add with the values to color
+
     def add(self, corner_point_tuple_list, value_list, label=None, description=None, colorbar=jet, border_color=None,
-            border_width=1, opacity=0xff, border_opacity=None, display_name='MeasSeries', visibility=True):
+            border_width=1, opacity=0xff, border_opacity=None, display_name='MeasSeries', visibility=True,
+            shared_styles=False, caxis=None, simplify=None, simplify_unit='degrees'):
         """Add a measurement series to the surface plot. corner_point_tuple_list is a list of polygon corner points of the form
         ((lon1, lat1), (lon2, lat2), ...) with N elements (meaning a list with N polygons described by M points (tuples), consisting
         of two coordinates (lon, lat). Example: [((poly1_lon1, poly1_lat1), (poly1_lon2, poly1_lon2), (poly1_lon3, poly1_lon3)),
         ((poly2_lon1, ...))])
+        corner_point_tuple_list may also be a NumPy array of shape (N, M, 2) and value_list a (masked) array of N values.
+        Polygons with a masked, None or NaN value or NaN coordinates are skipped.
+        colorbar is either a color bar or a ColorMap. The color axis caxis defaults to the range of value_list.
+        If shared_styles is True, one named style per color of the color bar is added to the document and referenced
+        by the placemarks instead of giving every placemark its own inline style.
+        If simplify is given, the polygons are simplified by the algorithm of Douglas and Peucker, leaving out corners
+        which are closer than simplify to the remaining outline, in the simplify_unit 'degrees' or 'meters'. Edges
+        shared by neighbouring polygons are simplified alike, so no gaps open between them. The number of left out
+        corners is recorded as count of the phase 'simplify' in the stats.
         """
-        folder = Folder(name=display_name, visibility=visibility)
-        self.kml.add(folder)
+        lap = lapTimer(self.stats, display_name)
+        if simplify_unit not in ('degrees', 'meters'):
+            raise ValueError('Unit of simplify must be either degrees or meters.')
         if border_opacity is None:
             border_opacity = opacity
-        value_noNone = filter(lambda x: x is not None, value_list)
-        zaxis = (min(value_noNone), max(value_noNone))
-        for i in xrange(len(value_list)):
-            coordinates = corner_point_tuple_list[i]
-            z   = value_list[i]
-            if z is None:
-                continue    # equal to NaN, skip this value
-            col = _colorbar_color(colorbar, zaxis, z)
-            styles = [
-                PolyStyle(
-                    color='%02x%02x%02x%02x' % (opacity, col[2], col[1], col[0]),    # attention, color format aabbggrr (alpha, blue, green, red)
-                    outline=1 if border_color is not None else 0,
-                )
-            ]
-            if border_color is not None:
-                styles.append(
-                    LineStyle(
-                        color='%02x%02x%02x%02x' % (border_opacity, border_color[2], border_color[1], border_color[0]),
-                        width=border_width,
-                    )
-                )
+        values = numpy.ma.masked_invalid(numpy.ma.array(value_list, dtype=float))     # None becomes NaN
+        if self.cache_dir is not None:
+            key = self._cacheKey(corner_point_tuple_list, numpy.ma.getdata(values), numpy.ma.getmaskarray(values),
+                                 label, description, colorbar, border_color, border_width, opacity, border_opacity,
+                                 display_name, visibility, shared_styles, caxis, simplify, simplify_unit)
+            if self._loadCached(key):
+                lap('cache', count=len(values))
+                return
+        folder = Folder(name=display_name, visibility=visibility)
+        self.kml.add(folder)
+        valid = ~numpy.ma.getmaskarray(values)
+        isArray = isinstance(corner_point_tuple_list, numpy.ndarray)
+        if isArray:
+            corners = corner_point_tuple_list
+            if corners.ndim != 3 or corners.shape[2] not in (2, 3):
+                raise ValueError('Corner point array must be of shape (N, M, 2) or (N, M, 3).')
+            if corners.shape[0] != len(values):
+                raise ValueError('Corner point array and value list differ in length.')
+            valid &= ~numpy.ma.getmaskarray(numpy.ma.masked_invalid(corners)).any(axis=2).any(axis=1)
+            corners = numpy.ma.getdata(corners).astype(float)
+        lap('validation', count=len(values))
+        colormap = self.colormap = _colormap(colorbar, caxis, values[valid])
+        colors = colormap.kmlColors(opacity)
+        colorIndices = colormap.indices(numpy.ma.getdata(values))
+        lap('colors', count=len(values))
+        if simplify is not None:
+            rings = [corners[i] if isArray else numpy.array(corner_point_tuple_list[i], dtype=float)
+                     for i in numpy.flatnonzero(valid)]
+            simplified = dict(zip(numpy.flatnonzero(valid), self._simplify(rings, simplify, simplify_unit, lap)))
+        binStyles = {}
+        for i in numpy.flatnonzero(valid):
+            col = colorIndices[i]
+            styles = binStyles.get(col)
+            if styles is None:
+                styles = binStyles[col] = self._style(self._surfaceStyles(colors[col], border_color, border_width,
+                                                                          border_opacity), shared_styles)
             if isinstance(label, (list, tuple)): pname = label[i]
             else: pname = label
             if isinstance(description, (list, tuple)): pdesc = description[i]
             else: pdesc = description
+            if simplify is not None:
+                polygon = Polygon(simplified[i], validate=False)
+            elif isArray:
+                polygon = Polygon(corners[i], validate=False)
+            else:
+                polygon = Polygon(corner_point_tuple_list[i])
             folder.add(
-                Placemark(style=styles, name=pname, description=pdesc).add(
-                        Polygon(coordinates)
-                    )
+                Placemark(style=styles, name=pname, description=pdesc).add(polygon)
+            )
+        lap('construction', count=len(folder.shapes))
+        if self.cache_dir is not None:
+            self._storeCached(folder, key, binStyles.values())
+
+    def add_grid(self, lon_edges, lat_edges, values, label=None, description=None, colorbar=jet, border_color=None,
+                 border_width=1, opacity=0xff, border_opacity=None, display_name='MeasSeries', visibility=True,
+                 shared_styles=False, caxis=None, merge=False, simplify=None, simplify_unit='degrees'):
+        """Add a measurement series on a regular grid to the surface plot. lon_edges are the C+1 longitudes and
+        lat_edges the R+1 latitudes of the cell edges, values is a (masked) array of shape (R, C) with the value of
+        every cell. Cells with a masked, None or NaN value are skipped.
+        If merge is True, neighbouring cells with the same color are merged into one polygon, with holes where cells
+        of other colors are enclosed. This reduces the number of placemarks of smooth fields by orders of magnitude.
+        label and description are then used for all polygons. The other arguments are the same as for add; simplify
+        works best on merged cells, whose staircase outlines it smooths.
+        """
+        lon_edges = numpy.asarray(lon_edges, dtype=float)
+        lat_edges = numpy.asarray(lat_edges, dtype=float)
+        values = numpy.ma.masked_invalid(numpy.ma.array(values, dtype=float))
+        if values.ndim != 2 or values.shape != (len(lat_edges) - 1, len(lon_edges) - 1):
+            raise ValueError('Values must be of shape (len(lat_edges) - 1, len(lon_edges) - 1).')
+        if not merge:
+            lon, lat = numpy.meshgrid(lon_edges, lat_edges)
+            corners = numpy.empty(values.shape + (5, 2))
+            for i, (row, column) in enumerate(((0, 0), (0, 1), (1, 1), (1, 0), (0, 0))):
+                corners[:, :, i, 0] = lon[row:row + values.shape[0], column:column + values.shape[1]]
+                corners[:, :, i, 1] = lat[row:row + values.shape[0], column:column + values.shape[1]]
+            return self.add(corners.reshape((-1, 5, 2)), values.ravel(), label, description, colorbar, border_color,
+                            border_width, opacity, border_opacity, display_name, visibility, shared_styles, caxis,
+                            simplify, simplify_unit)
+
+        lap = lapTimer(self.stats, display_name)
+        if simplify_unit not in ('degrees', 'meters'):
+            raise ValueError('Unit of simplify must be either degrees or meters.')
+        if border_opacity is None:
+            border_opacity = opacity
+        if self.cache_dir is not None:
+            key = self._cacheKey('add_grid', lon_edges, lat_edges, numpy.ma.getdata(values),
+                                 numpy.ma.getmaskarray(values), label, description, colorbar, border_color,
+                                 border_width, opacity, border_opacity, display_name, visibility, shared_styles, caxis,
+                                 simplify, simplify_unit)
+            if self._loadCached(key):
+                lap('cache', count=values.size)
+                return
+        folder = Folder(name=display_name, visibility=visibility)
+        self.kml.add(folder)
+        valid = ~numpy.ma.getmaskarray(values)
+        lap('validation', count=values.size)
+        colormap = self.colormap = _colormap(colorbar, caxis, values[valid])
+        colors = colormap.kmlColors(opacity)
+        bins = colormap.indices(numpy.ma.getdata(values))
+        bins[~valid] = -1
+        lap('colors', count=values.size)
+        regions = mergeCells(bins)
+        lap('geometry', count=len(regions))
+        regions = self._simplifyRegions([(col, numpy.column_stack((lon_edges[outer[:, 0]], lat_edges[outer[:, 1]])),
+                                          [numpy.column_stack((lon_edges[hole[:, 0]], lat_edges[hole[:, 1]]))
+                                           for hole in holes]) for col, outer, holes in regions],
+                                        simplify, simplify_unit, lap)
+        binStyles = {}
+        for col, outer, holes in regions:
+            styles = binStyles.get(col)
+            if styles is None:
+                styles = binStyles[col] = self._style(self._surfaceStyles(colors[col], border_color, border_width,
+                                                                          border_opacity), shared_styles)
+            polygon = Polygon(outer, validate=False)
+            for hole in holes:
+                polygon.addInnerBoundary(hole, validate=False)
+            folder.add(
+                Placemark(style=styles, name=label, description=description).add(polygon)
+            )
+        lap('construction', count=len(folder.shapes))
+        if self.cache_dir is not None:
+            self._storeCached(folder, key, binStyles.values())
+
+    def add_contours(self, lon, lat, values, levels=None, label=None, description=None, colorbar=jet,
+                     border_color=None, border_width=1, opacity=0xff, border_opacity=None, display_name='MeasSeries',
+                     visibility=True, shared_styles=False, caxis=None, simplify=None, simplify_unit='degrees'):
+        """Add a measurement series on a regular grid to the surface plot as filled contour bands, one polygon with
+        holes per connected area of a band. lon are the C longitudes and lat the R latitudes of the grid points,
+        values is a (masked) array of shape (R, C) with the values at the grid points, which are interpolated
+        linearly in between. Masked, None or NaN values leave gaps. By default there is one band per color of the
+        color bar; the values below and above the color axis are added to the first and last band. Alternatively,
+        the increasing list of levels bounds the bands, which get their colors spread over the color bar, and values
+        outside of the levels are left out. The other arguments are the same as for add.
+        """
+        lap = lapTimer(self.stats, display_name)
+        if simplify_unit not in ('degrees', 'meters'):
+            raise ValueError('Unit of simplify must be either degrees or meters.')
+        if border_opacity is None:
+            border_opacity = opacity
+        lon = numpy.asarray(lon, dtype=float)
+        lat = numpy.asarray(lat, dtype=float)
+        values = numpy.ma.masked_invalid(numpy.ma.array(values, dtype=float))
+        if values.ndim != 2 or values.shape != (len(lat), len(lon)):
+            raise ValueError('Values must be of shape (len(lat), len(lon)).')
+        if self.cache_dir is not None:
+            key = self._cacheKey('add_contours', lon, lat, numpy.ma.getdata(values), numpy.ma.getmaskarray(values),
+                                 levels, label, description, colorbar, border_color, border_width, opacity,
+                                 border_opacity, display_name, visibility, shared_styles, caxis, simplify,
+                                 simplify_unit)
+            if self._loadCached(key):
+                lap('cache', count=values.size)
+                return
+        folder = Folder(name=display_name, visibility=visibility)
+        self.kml.add(folder)
+        lap('validation', count=values.size)
+        if levels is None:
+            colormap = self.colormap = _colormap(colorbar, caxis, values.compressed())
+            levels = colormap.edges()
+            levels[0], levels[-1] = -numpy.inf, numpy.inf
+        else:
+            colormap = self.colormap = ColorMap(colorbar.colorbar if isinstance(colorbar, ColorMap) else colorbar,
+                                                breakpoints=levels)
+            levels = colormap.edges()
+        colors = colormap.kmlColors(opacity)
+        lap('colors', count=values.size)
+        bands = isobands(values, levels)
+        lap('geometry', count=len(bands))
+        gridIndices = (numpy.arange(len(lon)), numpy.arange(len(lat)))
+
+        def coordinates(ring):
+            return numpy.column_stack((numpy.interp(ring[:, 0], gridIndices[0], lon),
+                                       numpy.interp(ring[:, 1], gridIndices[1], lat)))
+
+        bands = self._simplifyRegions([(col, coordinates(outer), [coordinates(hole) for hole in holes])
+                                       for col, outer, holes in bands], simplify, simplify_unit, lap)
+        binStyles = {}
+        for col, outer, holes in bands:
+            styles = binStyles.get(col)
+            if styles is None:
+                styles = binStyles[col] = self._style(self._surfaceStyles(colors[col], border_color, border_width,
+                                                                          border_opacity), shared_styles)
+            polygon = Polygon(outer, validate=False)
+            for hole in holes:
+                polygon.addInnerBoundary(hole, validate=False)
+            folder.add(
+                Placemark(style=styles, name=label, description=description).add(polygon)
+            )
+        lap('construction', count=len(folder.shapes))
+        if self.cache_dir is not None:
+            self._storeCached(folder, key, binStyles.values())
+
+    @staticmethod
+    def _simplify(rings, simplify, simplify_unit, lap):
+        """Return the rings simplified with the tolerance simplify in simplify_unit, see add.
+        """
+        scale = 1.0
+        if simplify_unit == 'meters':
+            lat = numpy.concatenate([ring[:, 1] for ring in rings]) if rings else numpy.zeros(1)
+            scale, simplify = numpy.cos(numpy.radians(lat.mean())), simplify / _METERS_PER_DEGREE
+        simplified = simplifyRings(rings, simplify, scale)
+        # The simplified rings are closed, the given ones may be open
+        lap('simplify', count=sum(len(ring) - (ring[0, :2] == ring[-1, :2]).all() for ring in rings)
+            - sum(len(ring) - 1 for ring in simplified))
+        return simplified
+
+    def _simplifyRegions(self, regions, simplify, simplify_unit, lap):
+        """Return the list of regions (color index, outer ring, holes) with all rings simplified together, see add.
+        """
+        if simplify is None:
+            return regions
+        rings = [ring for col, outer, holes in regions for ring in [outer] + holes]
+        simplified = iter(self._simplify(rings, simplify, simplify_unit, lap))
+        return [(col, next(simplified), [next(simplified) for hole in holes]) for col, outer, holes in regions]
+
+    def add_raster(self, lon_edges, lat_edges, values, colorbar=jet, opacity=0xff, display_name='MeasSeries',
+                   visibility=True, caxis=None, tile_size=None, href=None):
+        """Add a measurement series on a regular grid to the surface plot as image instead of polygons, which is
+        much smaller and faster to display for dense grids. lon_edges, lat_edges and values are the same as for
+        add_grid; cells with a masked, None or NaN value are transparent. The image is drawn as GroundOverlay and
+        embedded into KMZ files or saved next to KML files as href, which defaults to a name derived from the position
+        of the series. If tile_size is given, the image is split into a pyramid of tiles of at most tile_size pixels
+        square, which Google Earth loads by level of detail. href is then the directory of the tiles.
+        """
+        lap = lapTimer(self.stats, display_name)
+        values = numpy.ma.masked_invalid(numpy.ma.array(values, dtype=float))
+        if href is None:
+            href = 'raster%d' % len(self.kml.shapes) + ('.png' if tile_size is None else '')
+        valid = ~numpy.ma.getmaskarray(values)
+        lap('validation', count=values.size)
+        colormap = self.colormap = _colormap(colorbar, caxis, values[valid])
+        bins = colormap.indices(numpy.ma.getdata(values))
+        bins[~valid] = -1
+        pixels, box = pixelGrid(lon_edges, lat_edges, bins)
+        lap('colors', count=pixels.size)
+        folder = Folder(name=display_name, visibility=visibility)
+        self.kml.add(folder)
+        if tile_size is None:
+            self.resources[href] = pngString(colorImage(pixels, colormap.colors, opacity))
+            folder.add(GroundOverlay(href, box))
+        else:
+            for level, row, column, tile, tileBox, leaf in pyramid(pixels, box, tile_size):
+                tileHref = '%s/%d_%d_%d.png' % (href, level, row, column)
+                self.resources[tileHref] = pngString(colorImage(tile, colormap.colors, opacity))
+                # Tiles are replaced by the four of the next level when shown larger than twice their size
+                tileRegion = region(*tileBox, minLodPixels=tile_size // 2 if level else 0,
+                                    maxLodPixels=-1 if leaf else 2 * tile_size)
+                folder.add(GroundOverlay(tileHref, tileBox, drawOrder=level, region=tileRegion))
+        lap('raster', count=len(folder.shapes), bytes=sum(len(self.resources[overlay.href])
+                                                          for overlay in folder.shapes))
+
+    @staticmethod
+    def _surfaceStyles(color, border_color, border_width, border_opacity):
+        styles = [
+            PolyStyle.shared(
+                color=color,
+                outline=1 if border_color is not None else 0,
+            )
+        ]
+        if border_color is not None:
+            styles.append(
+                LineStyle.shared(
+                    color='%02x%02x%02x%02x' % (border_opacity, border_color[2], border_color[1], border_color[0]),
+                    width=border_width,
                 )
+            )
+        return styles
+
 
+_METERS_PER_DEGREE = 111320.0     # of latitude
 
-def _colorbar_color(colorbar, caxis, c):
-    caxis = (min(caxis), max(caxis))
-    col = int(len(colorbar) * (float(c) - caxis[0]) / (caxis[1] - caxis[0])) if caxis[1] > caxis[0] else 0
-    if col < 0:
-        col = 0
-    if col >= len(colorbar):
-        col = len(colorbar) - 1
-    return colorbar[col]
+_styleClasses = dict((cls.__name__, cls) for cls in (PolyStyle, LineStyle, BalloonStyle))
+
+
+class TimeSeries(chart):
+    """Generate an animated chart, e.g. of the same sensors at hourly intervals, to be played with the time slider of
+    Google Earth. Every frame is a chart of the class chart_class of its own (Bar3D or Surface) saved in a separate
+    file, which is linked from the root document by a NetworkLink with the time span of the frame.
+    """
+    def __init__(self, title=None, description=None, chart_class=Bar3D, caxis=None, precision=None, stats=None):
+        """Create an animated chart of frames of the class chart_class. All frames share the color axis caxis, which
+        defaults to the range of the values of all frames.
+        """
+        chart.__init__(self, title, description, precision, stats)
+        self.chart_class = chart_class
+        self.caxis = caxis
+        self.frames = []
+
+    def add_frame(self, begin, end, *args, **kwargs):
+        """Add a frame shown from begin to end, see timeSpan for the format. The other arguments are passed to the
+        add method of the chart class, e.g. lon_list, lat_list and z_list of Bar3D.
+        """
+        self.frames.append((begin, end, args, kwargs))
+
+    def save(self, filename, processes=None):
+        """Save the root document as filename and the frames in a directory next to it. If processes is given, the
+        frames are generated by a pool of processes worker processes.
+        """
+        lap = lapTimer(self.stats)
+        directory = os.path.splitext(filename)[0] + '_frames'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        caxis = self.caxis if self.caxis is not None else self._sharedAxis()
+        lap('colors', count=len(self.frames))
+        jobs = []
+        self.kml.shapes = []
+        for number, (begin, end, args, kwargs) in enumerate(self.frames):
+            name = 'frame%05d.kml' % number
+            span = timeSpan(begin, end)
+            kwargs = dict(kwargs, caxis=caxis)
+            jobs.append((self.chart_class, name, self.kml.precision, span, args, kwargs, os.path.join(directory, name)))
+            link = NetworkLink(os.path.basename(directory) + '/' + name, name=span['begin'])
+            link.settings['TimeSpan'] = span
+            self.kml.add(link)
+        if processes is None:
+            for job in jobs:
+                _saveFrame(job)
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                for _ in pool.imap_unordered(_saveFrame, jobs):
+                    pass
+            finally:
+                pool.terminate()
+                pool.join()
+        lap('frames', count=len(jobs))
+        with open(filename, 'w') as f:
+            self.kml.write(f)
+
+    def _sharedAxis(self):
+        """Return the color axis spanning the values of all frames.
+        """
+        low, high = numpy.inf, -numpy.inf
+        for begin, end, args, kwargs in self.frames:
+            arguments = getcallargs(self.chart_class.add, None, *args, **kwargs)
+            colorbar = arguments.get('colorbar', jet)
+            values = numpy.ma.masked_invalid(numpy.ma.array(arguments[self.chart_class.VALUES], dtype=float))
+            if values.count() == 0:
+                continue
+            frameAxis = _colormap(colorbar, arguments.get('caxis'), values.compressed()).caxis
+            low, high = min(low, frameAxis[0]), max(high, frameAxis[1])
+        if low > high:
+            raise ValueError('Frames contain no valid values.')
+        return low, high
+
+
+def _saveFrame(args):
+    """Create and save a frame of a TimeSeries. Used by the worker processes.
+    """
+    chartClass, name, precision, span, args, kwargs, filename = args
+    frame = chartClass(name, precision=precision)
+    frame.kml.settings['TimeSpan'] = span
+    frame.add(*args, **kwargs)
+    frame.save(filename, streaming=True)
+
+
+def _chunks(records, size):
+    """Generator of lists of up to size records.
+    """
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _recordRanges(records, chunk_size, scale='linear'):
+    """Return the range (low, high) of the valid altitudes of the records (lon, lat, z[, label]), only positive ones
+    on a log scale, and the smallest positive difference of consecutive longitudes or None.
+    """
+    low, high, lon_diff, last = numpy.inf, -numpy.inf, numpy.inf, ()
+    for chunk in _chunks(records, chunk_size):
+        lon, lat, z = (numpy.array([record[i] for record in chunk], dtype=float) for i in xrange(3))
+        z = z[numpy.isfinite(lon) & numpy.isfinite(lat) & numpy.isfinite(z)]
+        if scale == 'log':
+            z = z[z > 0]
+        if len(z):
+            low, high = min(low, z.min()), max(high, z.max())
+        diffs = numpy.diff(numpy.concatenate((last, lon)))    # from the last longitude of the previous chunk
+        diffs = diffs[numpy.isfinite(diffs)]
+        diffs = diffs[diffs > 0]
+        if len(diffs):
+            lon_diff = min(lon_diff, diffs.min())
+        last = lon[-1:]
+    if low > high:
+        raise ValueError('Records contain no valid values.')
+    return low, high, lon_diff if numpy.isfinite(lon_diff) else None
+
+
+def _colormap(colorbar, caxis, values):
+    """Helper function returning the color map for a color bar or ColorMap colorbar, fitted to the values unless a
+    color axis caxis is given.
+    """
+    if isinstance(colorbar, ColorMap):
+        if caxis is not None:
+            colorbar = ColorMap(colorbar.colorbar, caxis, colorbar.scale, colorbar.breakpoints)
+        return colorbar.fit(values)
+    return ColorMap(colorbar, caxis).fit(values)
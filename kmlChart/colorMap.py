@@ -0,0 +1,91 @@
+"""
+Module to map values to the colors of a color bar.
+"""
+from __future__ import absolute_import
+import numpy
+from .colorBars import jet
+
+
+class ColorMap(object):
+    """Maps values to the colors of a color bar. The color axis caxis may be scaled linearly (scale='linear') or
+    logarithmically (scale='log'). Alternatively, a sorted list of K+1 breakpoints may be given, defining K bins
+    with colors taken evenly from the color bar. Values outside the color axis get the first or last color.
+    """
+    def __init__(self, colorbar=jet, caxis=None, scale='linear', breakpoints=None):
+        if scale not in ('linear', 'log'):
+            raise ValueError('Scale must be either linear or log.')
+        self.colorbar = colorbar
+        self.scale = scale
+        self.caxis = None if caxis is None else (min(caxis), max(caxis))
+        self.breakpoints = None
+        if breakpoints is not None:
+            self.breakpoints = numpy.array(breakpoints, dtype=float)
+            if len(self.breakpoints) < 2 or (numpy.diff(self.breakpoints) <= 0).any():
+                raise ValueError('Breakpoints must be a strictly increasing list of at least two values.')
+            self.caxis = (self.breakpoints[0], self.breakpoints[-1])
+            numBins = len(self.breakpoints) - 1
+            step = float(len(colorbar) - 1) / (numBins - 1) if numBins > 1 else 0
+            self.colors = [colorbar[int(round(i * step))] for i in xrange(numBins)]
+        else:
+            self.colors = list(colorbar)
+        if (scale == 'log') and (self.caxis is not None) and (self.caxis[0] <= 0):
+            raise ValueError('Color axis of a logarithmic scale must be positive.')
+        self._kmlColors = {}
+
+    def __repr__(self):
+        return 'ColorMap(%r, %r, %r, %r)' % (self.colorbar, self.caxis, self.scale,
+                                             None if self.breakpoints is None else list(self.breakpoints))
+
+    def fit(self, values):
+        """Return a color map with the color axis spanning the valid values if no color axis has been given yet,
+        otherwise the color map itself.
+        """
+        if self.caxis is not None:
+            return self
+        values = numpy.ma.masked_invalid(numpy.ma.array(values, dtype=float)).compressed()
+        if self.scale == 'log':
+            values = values[values > 0]
+        return ColorMap(self.colorbar, (values.min(), values.max()), self.scale)
+
+    def indices(self, values):
+        """Return the indices of the colors of all values at once. Invalid values get index 0.
+        """
+        values = numpy.asarray(values, dtype=float)
+        if self.caxis is None:
+            raise ValueError('Color axis is not defined, use fit() first.')
+        if self.breakpoints is not None:
+            indices = numpy.searchsorted(self.breakpoints, values, side='right') - 1
+            indices[numpy.isnan(values)] = 0
+            return numpy.clip(indices, 0, len(self.colors) - 1)
+        low, high = self.caxis
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            if self.scale == 'log':
+                values = numpy.log10(values)
+                low, high = numpy.log10(low), numpy.log10(high)
+            if high > low:
+                scaled = len(self.colors) * (values - low) / (high - low)
+                indices = numpy.nan_to_num(numpy.clip(scaled, -1, len(self.colors))).astype(int)
+            else:
+                indices = numpy.zeros(values.shape, dtype=int)
+        return numpy.clip(indices, 0, len(self.colors) - 1)
+
+    def edges(self):
+        """Return the K+1 values bounding the K colors, color i being used for values from edge i up to edge i + 1.
+        """
+        if self.caxis is None:
+            raise ValueError('Color axis is not defined, use fit() first.')
+        if self.breakpoints is not None:
+            return self.breakpoints.copy()
+        low, high = self.caxis
+        if self.scale == 'log':
+            return 10 ** numpy.linspace(numpy.log10(low), numpy.log10(high), len(self.colors) + 1)
+        return numpy.linspace(low, high, len(self.colors) + 1)
+
+    def kmlColors(self, opacity=0xff):
+        """Return the list of colors in KML format aabbggrr (alpha, blue, green, red) with the given opacity.
+        """
+        table = self._kmlColors.get(opacity)
+        if table is None:
+            table = self._kmlColors[opacity] = ['%02x%02x%02x%02x' % (opacity, col[2], col[1], col[0])
+                                                for col in self.colors]
+        return table
@@ -0,0 +1,412 @@
+"""
+Module with geometric helper functions for charts on regular grids.
+"""
+from __future__ import absolute_import
+import numpy
+
+# Directions of the boundary edges: right, up, left, down
+_STEPS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+def labelRegions(bins):
+    """Label the connected regions of grid cells with equal bins. bins is an integer array of shape (rows, columns),
+    negative values mark cells without bin. Cells are connected to their four direct neighbours only. Returns an array
+    of the same shape with the region number of every cell, -1 for cells without bin.
+    """
+    bins = numpy.asarray(bins)
+    rows, columns = bins.shape
+    # Runs of equal bins in each row are labelled first, then runs of neighbouring rows are united
+    starts = numpy.ones(bins.shape, dtype=bool)
+    starts[:, 1:] = bins[:, 1:] != bins[:, :-1]
+    runs = numpy.cumsum(starts.ravel()).reshape(bins.shape) - 1
+    connected = (bins[1:] == bins[:-1]) & (bins[1:] >= 0)
+    pairs = numpy.unique(runs[:-1][connected] * (runs[-1, -1] + 1) + runs[1:][connected])
+    parents = range(runs[-1, -1] + 1)
+
+    def find(run):
+        while parents[run] != run:
+            parents[run] = parents[parents[run]]
+            run = parents[run]
+        return run
+
+    for pair in pairs.tolist():
+        a, b = find(pair // (runs[-1, -1] + 1)), find(pair % (runs[-1, -1] + 1))
+        if a != b:
+            parents[max(a, b)] = min(a, b)
+    roots = numpy.array([find(run) for run in xrange(len(parents))])
+    labels = numpy.full(bins.shape, -1, dtype=int)
+    valid = bins >= 0
+    labels[valid] = numpy.unique(roots[runs[valid]], return_inverse=True)[1]
+    return labels
+
+
+def regionBoundaries(labels):
+    """Trace the boundaries of the regions of a label array as returned by labelRegions. Returns a list of
+    (label, ring) tuples, with ring being a closed array of shape (K, 2) with the (column, row) indices of the grid
+    vertices, cell (row, column) spanning the vertices column to column + 1 and row to row + 1. Outer boundaries run
+    counter-clockwise, boundaries of holes clockwise, and only the corners of the boundaries are included.
+    """
+    rows, columns = labels.shape
+    padded = numpy.full((rows + 2, columns + 2), -1, dtype=labels.dtype)
+    padded[1:-1, 1:-1] = labels
+    edges = {}  # (column, row, label) -> directions of the boundary edges starting at this vertex
+
+    def addEdges(owners, differs, direction, x, y):
+        for label, column, row in zip(owners[differs].tolist(), x[differs].tolist(), y[differs].tolist()):
+            edges.setdefault((column, row, label), []).append(direction)
+
+    # Horizontal edges between the cells below and above of vertex row j
+    below, above = padded[:-1, 1:-1], padded[1:, 1:-1]
+    differs = below != above
+    row, column = numpy.mgrid[0:rows + 1, 0:columns]
+    addEdges(below, differs & (below >= 0), 2, column + 1, row)     # top side of the cell below, leftwards
+    addEdges(above, differs & (above >= 0), 0, column, row)         # bottom side of the cell above, rightwards
+    # Vertical edges between the cells left and right of vertex column i
+    left, right = padded[1:-1, :-1], padded[1:-1, 1:]
+    differs = left != right
+    row, column = numpy.mgrid[0:rows, 0:columns + 1]
+    addEdges(left, differs & (left >= 0), 1, column, row)           # right side of the cell left, upwards
+    addEdges(right, differs & (right >= 0), 3, column, row + 1)     # left side of the cell right, downwards
+
+    rings = []
+    for key in sorted(edges):     # sorted to trace identical rings in every run
+        while key in edges:     # two rings may start at a corner touched by two parts of a region
+            x, y, label = key
+            start, startDirection = (x, y), edges[key][0]
+            ring = [start]
+            direction = startDirection
+            while True:
+                if direction != startDirection or (x, y) != start:
+                    directions = edges[(x, y, label)]
+                    directions.remove(direction)
+                    if not directions:
+                        del edges[(x, y, label)]
+                x, y = x + _STEPS[direction][0], y + _STEPS[direction][1]
+                candidates = edges.get((x, y, label), ())
+                # Prefer left turns to keep regions touching at a corner apart
+                for turn in (1, 0, 3):
+                    nextDirection = (direction + turn) % 4
+                    if nextDirection in candidates:
+                        break
+                if nextDirection != direction:
+                    ring.append((x, y))
+                if (x, y) == start and nextDirection == startDirection:
+                    directions = edges[(x, y, label)]
+                    directions.remove(startDirection)
+                    if not directions:
+                        del edges[(x, y, label)]
+                    break
+                direction = nextDirection
+            if ring[-1] != start:
+                ring = ring[1:] + ring[1:2]     # start lies within a straight edge
+            rings.append((label, numpy.array(ring)))
+    return rings
+
+
+def ringArea(ring):
+    """Return the signed area of the closed ring of shape (K, 2), positive if it runs counter-clockwise.
+    """
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * (numpy.dot(x[:-1], y[1:]) - numpy.dot(x[1:], y[:-1]))
+
+
+def pointInRing(point, ring):
+    """Return whether point lies inside the closed ring of shape (K, 2).
+    """
+    x, y = ring[:-1, 0], ring[:-1, 1]
+    nextX, nextY = ring[1:, 0], ring[1:, 1]
+    crosses = (y > point[1]) != (nextY > point[1])
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        intersection = x + (point[1] - y) * (nextX - x) / (nextY - y)
+    return bool(numpy.count_nonzero(crosses & (point[0] < intersection)) % 2)
+
+
+def mergeCells(bins):
+    """Merge the connected cells of equal bins of a grid into polygons. bins is an integer array of shape
+    (rows, columns), negative values mark cells to be left out. Returns a list of (bin, outer, holes) tuples, with the
+    rings outer and holes given as closed arrays of (column, row) grid vertex indices, see regionBoundaries.
+    """
+    bins = numpy.asarray(bins)
+    labels = labelRegions(bins)
+    regions = _nestRings(regionBoundaries(labels))
+    regionBins = numpy.zeros(labels.max() + 1, dtype=bins.dtype)
+    regionBins[labels[labels >= 0]] = bins[labels >= 0]
+    return [(regionBins[label], outer, holes) for label, outer, holes in regions]
+
+
+def isobands(values, levels):
+    """Compute the filled contour bands of a grid of values. values is a (masked) array of shape (rows, columns)
+    with the values at the grid points, NaN or masked values leaving gaps. levels are the B+1 increasing bounds of
+    the B bands, band b holding the values v with levels[b] <= v < levels[b + 1]; the outer bounds may be infinite.
+    Returns a list of (band, outer, holes) tuples like mergeCells, the vertices being fractional (column, row)
+    indices of the grid points.
+    Every grid cell is split into two triangles, in which the values are interpolated linearly, so the bands of
+    saddle cells are unambiguous. The pieces of a band in all triangles are computed at once, and the edges shared by
+    two pieces cancel out, leaving the boundaries of the band.
+    """
+    values = numpy.ma.filled(numpy.ma.masked_invalid(numpy.ma.array(values, dtype=float)), numpy.nan)
+    levels = numpy.asarray(levels, dtype=float)
+    rows, columns = values.shape
+    row, column = (index.ravel() for index in numpy.mgrid[0:rows - 1, 0:columns - 1])
+    # Grid points are numbered row by row, edges are numbered horizontal, vertical and diagonal ones
+    horizontal, vertical = rows * (columns - 1), (rows - 1) * columns
+    points = (row * columns + column, row * columns + column + 1, (row + 1) * columns + column + 1,
+              (row + 1) * columns + column)
+    edges = (row * (columns - 1) + column, horizontal + row * columns + column + 1,
+             horizontal + vertical + row * (columns - 1) + column, (row + 1) * (columns - 1) + column,
+             horizontal + row * columns + column)
+    # Counter-clockwise triangles (lower left, lower right, upper right) and (lower left, upper right, upper left)
+    corners = numpy.concatenate((numpy.column_stack(points[:3]), numpy.column_stack((points[0], points[2], points[3]))))
+    sides = numpy.concatenate((numpy.column_stack(edges[:3]), numpy.column_stack(edges[2:])))
+    cornerValues = values.ravel()[corners]
+    valid = numpy.isfinite(cornerValues).all(axis=1)
+    corners, sides, cornerValues = corners[valid], sides[valid], cornerValues[valid]
+    # Bands of the lowest and highest corner of every triangle
+    lowBand = numpy.searchsorted(levels, cornerValues.min(axis=1), side='right') - 1
+    highBand = numpy.searchsorted(levels, cornerValues.max(axis=1), side='right') - 1
+    firstCrossing = rows * columns     # number of the first crossing of an edge and a level
+    sideCount = horizontal + vertical + (rows - 1) * (columns - 1)
+    vertexCount = firstCrossing + sideCount * len(levels)
+
+    # Triangles inside a band and those crossing levels, once for every band they overlap, sorted by band
+    insideTriangles = numpy.flatnonzero(lowBand == highBand)
+    insideTriangles = insideTriangles[numpy.argsort(lowBand[insideTriangles], kind='mergesort')]
+    insideBounds = numpy.searchsorted(lowBand[insideTriangles], numpy.arange(len(levels)))
+    crossingTriangles = numpy.flatnonzero(lowBand != highBand)
+    spans = highBand[crossingTriangles] - lowBand[crossingTriangles] + 1
+    offsets = numpy.repeat(numpy.cumsum(spans) - spans, spans)
+    crossingBands = numpy.repeat(lowBand[crossingTriangles], spans) + numpy.arange(spans.sum()) - offsets
+    order = numpy.argsort(crossingBands, kind='mergesort')
+    crossingTriangles, crossingBands = numpy.repeat(crossingTriangles, spans)[order], crossingBands[order]
+    crossingBounds = numpy.searchsorted(crossingBands, numpy.arange(len(levels)))
+
+    bands = []
+    for band in xrange(len(levels) - 1):
+        selected = crossingTriangles[crossingBounds[band]:crossingBounds[band + 1]]
+        inside = insideTriangles[insideBounds[band]:insideBounds[band + 1]]
+        if len(selected) == 0 and len(inside) == 0:
+            continue
+        start = corners[selected]
+        end = numpy.roll(start, -1, axis=1)
+        startValues = cornerValues[selected]
+        endValues = numpy.roll(startValues, -1, axis=1)
+        # Crossings are interpolated from the lower numbered grid point of a side, so both triangles of a side get
+        # the same coordinates
+        swap = start > end
+        first, second = numpy.where(swap, end, start), numpy.where(swap, start, end)
+        firstValues = numpy.where(swap, endValues, startValues)
+        secondValues = numpy.where(swap, startValues, endValues)
+        firstPoints = numpy.dstack((first % columns, first // columns)).astype(float)
+        secondPoints = numpy.dstack((second % columns, second // columns))
+        crossings = []
+        for index in (band, band + 1):
+            level = levels[index]
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                fraction = (level - firstValues) / (secondValues - firstValues)
+                crossings.append((firstCrossing + sides[selected] * len(levels) + index,
+                                  (startValues < level) != (endValues < level),
+                                  firstPoints + fraction[:, :, None] * (secondPoints - firstPoints)))
+        # Every side contributes its start if it is in the band and its crossings in their order along the side
+        ascending = startValues < endValues
+        vertices = numpy.empty(start.shape + (3,), dtype=numpy.int64)
+        inBand = numpy.empty(vertices.shape, dtype=bool)
+        coordinates = numpy.empty(vertices.shape + (2,))
+        vertices[:, :, 0] = start
+        inBand[:, :, 0] = (startValues >= levels[band]) & (startValues < levels[band + 1])
+        coordinates[:, :, 0] = numpy.dstack((start % columns, start // columns))
+        for slot, (lower, upper) in ((1, crossings), (2, crossings[::-1])):
+            vertices[:, :, slot] = numpy.where(ascending, lower[0], upper[0])
+            inBand[:, :, slot] = numpy.where(ascending, lower[1], upper[1])
+            coordinates[:, :, slot] = numpy.where(ascending[:, :, None], lower[2], upper[2])
+        # Directed edges of the pieces, from every vertex in the band to the next one of the same triangle
+        used = numpy.flatnonzero(inBand.ravel())
+        vertices, coordinates = vertices.ravel(), coordinates.reshape((-1, 2))
+        triangles = used // 9
+        following = numpy.roll(used, -1)
+        pieceStarts = numpy.flatnonzero(numpy.diff(numpy.append(-1, triangles)))
+        pieceEnds = numpy.flatnonzero(numpy.diff(numpy.append(triangles, -1)))
+        following[pieceEnds] = used[pieceStarts]
+        vertexIDs, firstUse = numpy.unique(vertices[used], return_index=True)
+        vertexCoordinates = coordinates[used[firstUse]]
+        # Triangles inside the band add their sides as is, except for those between two of them, which cancel out
+        outer = numpy.bincount(sides[inside].ravel(), minlength=sideCount)[sides[inside]] < 2
+        starts = numpy.concatenate((vertices[used], corners[inside][outer]))
+        ends = numpy.concatenate((vertices[following], numpy.roll(corners[inside], -1, axis=1)[outer]))
+        # Edges used in both directions lie between two pieces
+        keys = numpy.minimum(starts, ends) * vertexCount + numpy.maximum(starts, ends)
+        order = numpy.argsort(keys)
+        shared = numpy.zeros(len(keys), dtype=bool)
+        pairs = numpy.flatnonzero(keys[order][1:] == keys[order][:-1])
+        shared[order[pairs]] = shared[order[pairs + 1]] = True
+        for ring in _traceEdges(starts[~shared], ends[~shared]):
+            ringCoordinates = numpy.empty((len(ring), 2))
+            points = ring < firstCrossing
+            ringCoordinates[points, 0], ringCoordinates[points, 1] = ring[points] % columns, ring[points] // columns
+            ringCoordinates[~points] = vertexCoordinates[numpy.searchsorted(vertexIDs, ring[~points])]
+            ring = _cleanRing(ringCoordinates)
+            if ring is not None:
+                bands.append((band, ring))
+    return _nestRings(bands)
+
+
+def simplifyLine(points, tolerance):
+    """Simplify the line through the points of shape (K, 2) by the algorithm of Douglas and Peucker. Returns the
+    boolean mask of the points to keep, so no left out point is farther than tolerance from the simplified line. The
+    first and the last point are always kept.
+    """
+    keep = numpy.zeros(len(points), dtype=bool)
+    keep[[0, -1]] = True
+    segments = [(0, len(points) - 1)]
+    while segments:
+        first, last = segments.pop()
+        if last - first < 2:
+            continue
+        direction = points[last] - points[first]
+        offsets = points[first + 1:last] - points[first]
+        length = numpy.hypot(direction[0], direction[1])
+        if length > 0:
+            distances = numpy.abs(direction[0] * offsets[:, 1] - direction[1] * offsets[:, 0]) / length
+        else:   # closed line
+            distances = numpy.hypot(offsets[:, 0], offsets[:, 1])
+        farthest = numpy.argmax(distances)
+        if distances[farthest] > tolerance:
+            farthest += first + 1
+            keep[farthest] = True
+            segments.extend(((first, farthest), (farthest, last)))
+    return keep
+
+
+def simplifyRings(rings, tolerance, scale=1.0):
+    """Simplify the rings, arrays of shape (K, 2) or (K, 3), by the algorithm of Douglas and Peucker, see
+    simplifyLine, with the x coordinates multiplied by scale for measuring the distances. Rings sharing a part of
+    their boundary, e.g. neighbouring polygons, keep sharing it: the rings are split into arcs at the vertices where
+    they meet, and equal arcs are simplified alike. The arcs of rings which would collapse are not simplified at
+    all, neither for their neighbours. Returns the list of simplified rings, which are closed even if the given
+    ones are not.
+    """
+    if not rings:
+        return []
+    # Leave out the closing vertices and number the distinct vertices of all rings by their coordinates
+    rings = [ring[:-1] if len(ring) > 1 and (ring[0, :2] == ring[-1, :2]).all() else ring for ring in rings]
+    lengths = numpy.array([len(ring) for ring in rings])
+    points = numpy.concatenate([ring[:, :2] for ring in rings]).astype(float)
+    rowView = numpy.ascontiguousarray(points).view([('x', float), ('y', float)]).ravel()
+    vertexIDs, ids = numpy.unique(rowView, return_inverse=True)
+    # Vertices with other than two distinct neighbours are where rings meet
+    ringStarts = numpy.cumsum(lengths) - lengths
+    following = numpy.arange(len(ids)) + 1
+    following[ringStarts + lengths - 1] = ringStarts
+    edges = numpy.unique(numpy.minimum(ids, ids[following]) * len(vertexIDs) + numpy.maximum(ids, ids[following]))
+    degrees = numpy.bincount(numpy.concatenate((edges // len(vertexIDs), edges % len(vertexIDs))),
+                             minlength=len(vertexIDs))
+    isNode = degrees != 2
+    scaled = points * (scale, 1.0)
+    arcs = {}   # arc as tuple of vertex numbers -> mask of the kept vertices
+    ringArcs = []   # per ring the order of its vertices from the first node and its arcs (first, last, key, reverse)
+    for start, length in zip(ringStarts.tolist(), lengths.tolist()):
+        ringIDs = ids[start:start + length]
+        nodes = numpy.flatnonzero(isNode[ringIDs])
+        if len(nodes) == 0:
+            nodes = numpy.array([numpy.argmin(ringIDs)])   # the same for all rings with these vertices
+        # Rotate the ring to start at a node and split it into arcs from node to node
+        order = numpy.roll(numpy.arange(length), -nodes[0])
+        nodes = numpy.append(nodes - nodes[0], length)
+        pieces = []
+        for first, last in zip(nodes[:-1].tolist(), nodes[1:].tolist()):
+            indices = order[numpy.arange(first, last + 1) % length]
+            arc = tuple(ringIDs[indices].tolist())
+            reverse = arc[-1] < arc[0] or (arc[-1] == arc[0] and len(arc) > 2 and arc[-2] < arc[1])
+            key = arc[::-1] if reverse else arc
+            if key not in arcs:
+                arcs[key] = simplifyLine(scaled[start + (indices[::-1] if reverse else indices)], tolerance)
+            pieces.append((first, last, key, reverse))
+        ringArcs.append((order, pieces))
+
+    def kept(order, pieces):
+        keep = numpy.zeros(len(order) + 1, dtype=bool)
+        for first, last, key, reverse in pieces:
+            keep[first:last + 1] |= arcs[key][::-1] if reverse else arcs[key]
+        return order[numpy.flatnonzero(keep[:-1])]
+
+    # Keeping all vertices of the arcs of collapsing rings only adds vertices to the other rings
+    for order, pieces in ringArcs:
+        if len(kept(order, pieces)) < 3:
+            for first, last, key, reverse in pieces:
+                arcs[key][:] = True
+    simplified = []
+    for ring, (order, pieces) in zip(rings, ringArcs):
+        indices = kept(order, pieces)
+        simplified.append(ring[numpy.append(indices, indices[0])])
+    return simplified
+
+
+def _traceEdges(starts, ends):
+    """Return the list of closed rings of vertex numbers formed by the directed edges from starts to ends. Every
+    vertex must have as many incoming as outgoing edges.
+    """
+    count = len(starts)
+    if count == 0:
+        return []
+    # Link every edge to an edge starting at its end, pairing the edges of a vertex in arbitrary order
+    successors = numpy.empty(count, dtype=numpy.int64)
+    outgoing, incoming = numpy.argsort(starts, kind='mergesort'), numpy.argsort(ends, kind='mergesort')
+    if (starts[outgoing] != ends[incoming]).any():
+        raise ValueError('Edges do not form closed rings.')
+    successors[incoming] = outgoing
+    # Every ring is labelled by its lowest edge by doubling the steps along the ring
+    labels, jumps = numpy.arange(count), successors
+    for _ in xrange(int(numpy.ceil(numpy.log2(count))) + 1):
+        labels = numpy.minimum(labels, labels[jumps])
+        jumps = jumps[jumps]
+    # Distance of every edge from the lowest one of its ring by doubling as well
+    predecessors = numpy.empty(count, dtype=numpy.int64)
+    predecessors[successors] = numpy.arange(count)
+    lowest = labels == numpy.arange(count)
+    predecessors[lowest] = numpy.flatnonzero(lowest)
+    distances = (~lowest).astype(numpy.int64)
+    for _ in xrange(int(numpy.ceil(numpy.log2(count))) + 1):
+        distances = distances + distances[predecessors]
+        predecessors = predecessors[predecessors]
+    order = numpy.lexsort((distances, labels))
+    ringStarts = numpy.flatnonzero(lowest)    # the rings are sorted by their lowest edge
+    # The edges of every ring are sorted by label, so ring i occupies the i-th block of the order
+    blockStarts = numpy.searchsorted(labels[order], ringStarts)
+    blockEnds = numpy.append(blockStarts[1:], count)
+    vertices = starts[order]
+    return [numpy.append(vertices[begin:end], vertices[begin]) for begin, end in zip(blockStarts, blockEnds)]
+
+
+def _cleanRing(ring):
+    """Return the closed ring of shape (K, 2) without repeated and collinear vertices, or None if it has no area.
+    """
+    ring = ring[numpy.concatenate(((True,), (ring[1:] != ring[:-1]).any(axis=1)))]
+    if len(ring) < 4:
+        return None
+    # Cross product of the edges before and after every vertex, the first one being also the last one
+    before, after = ring[:-1] - numpy.roll(ring[:-1], 1, axis=0), ring[1:] - ring[:-1]
+    corners = numpy.flatnonzero(numpy.abs(before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]) > 1e-12)
+    if len(corners) < 3:
+        return None
+    return ring[numpy.append(corners, corners[0])]
+
+
+def _nestRings(rings):
+    """Sort the list of (label, ring) tuples into outer boundaries, which run counter-clockwise, and holes. Returns a
+    list of (label, outer, holes) tuples sorted by label, every hole belonging to the smallest outer boundary of the
+    same label containing it.
+    """
+    outers, holes = {}, []
+    for label, ring in rings:
+        if ringArea(ring) > 0:
+            outers.setdefault(label, []).append((ring, []))
+        else:
+            holes.append((label, ring))
+    for label, ring in holes:
+        candidates = outers[label]
+        if len(candidates) > 1:
+            # The middle of an edge of a hole never lies on another boundary of its label
+            point = (ring[0] + ring[1]) / 2.0
+            candidates = sorted((candidate for candidate in candidates if pointInRing(point, candidate[0])),
+                                key=lambda candidate: ringArea(candidate[0])) or candidates
+        candidates[0][1].append(ring)
+    return [(label, outer, inner) for label in sorted(outers) for outer, inner in outers[label]]
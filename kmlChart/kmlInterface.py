@@ -4,6 +4,13 @@ Interface to produce files.
 
 from xml.etree import ElementTree
 from argparse import ArgumentTypeError
+from array import array
+from collections import OrderedDict
+import hashlib
+import multiprocessing
+import os.path
+import re
+from .stats import lapTimer
 
 
 # Register XML name spaces
@@ -17,6 +24,9 @@ namespaces = {
 for prefix, namespace in namespaces.iteritems():
     ElementTree.register_namespace(prefix, namespace)
 
+# Tag of the element marking the position of the children when a shape is streamed
+_PLACEHOLDER = 'kmlChartPlaceholder'
+
 
 def prefixedTag(tag):
     prefix = ''
@@ -35,7 +45,7 @@ class StyleData(object):
         self.styles[name] = listOfStyles
 
     def renderStyles(self, documentNode):
-        for name, listOfStyles in self.styles.iteritems():
+        for name, listOfStyles in sorted(self.styles.iteritems()):     # sorted to render identical documents
             if not isinstance(listOfStyles, (list, tuple)):
                 listOfStyles = [listOfStyles]
             xmlStyle = ElementTree.SubElement(documentNode, 'Style', id=name)
@@ -44,8 +54,22 @@ class StyleData(object):
 
 
 class ShapeInterface(object):
+    __slots__ = ('_shapes',)
+
     def __init__(self):
-        self.shapes = []
+        self._shapes = None     # the list is created when the first shape is added or shapes is accessed
+
+    @property
+    def shapes(self):
+        """List of the child shapes.
+        """
+        if self._shapes is None:
+            self._shapes = []
+        return self._shapes
+
+    @shapes.setter
+    def shapes(self, shapes):
+        self._shapes = shapes
 
     def mayBeAddedTo(self, instance):
         return True
@@ -55,140 +79,568 @@ class ShapeInterface(object):
             raise TypeError('Can only add elements of type ShapeInterface.')
         if not shapeElement.mayBeAddedTo(self):
             raise ValueError('This shape does not accept to be added to this instance.');
-        self.shapes.append(shapeElement)
+        if self._shapes is None:
+            self._shapes = [shapeElement]
+        else:
+            self._shapes.append(shapeElement)
+        self._invalidate()
         return self     # enable chaining
 
-    def render(self, xmlParent):
-        for shape in self.shapes:
-            shape.render(xmlParent)
+    def _invalidate(self):
+        """Drop the cached XML of this shape after a modification of its settings, style or children.
+        """
+        pass
+
+    def render(self, xmlParent, precision=None):
+        for shape in self._shapes or ():
+            shape.render(xmlParent, precision)
+
+    def stream(self, write, precision=None):
+        """Serialize the children one after another and pass the XML chunks to the callable write.
+        """
+        for shape in self._shapes or ():
+            shape.stream(write, precision)
+
+    def streamCached(self, write, precision=None):
+        """Like stream, but reuse the XML of placemarks and folders cached by a previous call as long as neither
+        they nor their styles and geometries have been modified since. Changes of geometries are found by comparing
+        their content, so the check costs time proportional to the number of coordinates on every call, but saves
+        building and serializing the elements.
+        """
+        for shape in self._shapes or ():
+            shape.streamCached(write, precision)
+
+    def getBounds(self):
+        """Return the bounding box (west, south, east, north) of all coordinates of this shape and its children or
+        None if there are no coordinates.
+        """
+        return _unionBounds(shape.getBounds() for shape in self._shapes or ())
 
 
 class AbstractShape(ShapeInterface):
     TAG = 'ABSTRACT'
+    SETTINGS = ()   # keys of the settings, whose values are kept in _settingValues until settings is accessed
+    __slots__ = ('_shapeID', '_style', '_settings', '_settingValues')
 
-    def __init__(self, shapeID=None, style=None, settings={}):
+    def __init__(self, shapeID=None, style=None, settings=None):
         ShapeInterface.__init__(self)
-        self.shapeID = shapeID
-        self.style = style
-        self.settings = settings
+        self._shapeID = shapeID
+        self._style = style
+        self._settings = None if settings is None else _SettingsDict(self, settings)
+        self._settingValues = ()
+
+    @property
+    def shapeID(self):
+        return self._shapeID
+
+    @shapeID.setter
+    def shapeID(self, shapeID):
+        self._shapeID = shapeID
+        self._invalidate()
+
+    @property
+    def style(self):
+        """Either the URL of a named style or a list of styles.
+        """
+        return self._style
+
+    @style.setter
+    def style(self, style):
+        self._style = style
+        self._invalidate()
+
+    @property
+    def settings(self):
+        """Dictionary of the settings rendered as child elements. It is only created when accessed.
+        """
+        if self._settings is None:
+            self._settings = _SettingsDict(self, zip(self.SETTINGS, self._settingValues))
+        return self._settings
 
-    def renderNode(self, xml):
+    @settings.setter
+    def settings(self, settings):
+        self._settings = _SettingsDict(self, settings)
+        self._invalidate()
+
+    def renderNode(self, xml, precision=None):
         pass
 
-    def render(self, xmlParent):
-        xml = ElementTree.SubElement(xmlParent, self.TAG)
-        if self.shapeID is not None:
-            xml.attrib['id'] = self.shapeID
-        if isinstance(self.style, (str, unicode)):
-            ElementTree.SubElement(xml, 'styleUrl').text = self.styleURL
-        if isinstance(self.style, (list, tuple)):
+    def renderElement(self, precision=None):
+        """Render this shape without its children and return the XML element. precision is the default number of
+        decimals of coordinates, None meaning full precision.
+        """
+        xml = ElementTree.Element(self.TAG)
+        if self._shapeID is not None:
+            xml.attrib['id'] = self._shapeID
+        if isinstance(self._style, (str, unicode)):
+            ElementTree.SubElement(xml, 'styleUrl').text = self._style
+        if isinstance(self._style, (list, tuple)):
             styleXml = ElementTree.SubElement(xml, 'Style')
-            for style in self.style:
+            for style in self._style:
                 _styleRenderer(styleXml, style)
-        _renderDict(xml, self.settings)
-        self.renderNode(xml)
-        ShapeInterface.render(self, xml)
+        if self._settings is None:
+            _renderDict(xml, dict(zip(self.SETTINGS, self._settingValues)))
+        else:
+            _renderDict(xml, self._settings)
+        self.renderNode(xml, precision)
+        return xml
+
+    def render(self, xmlParent, precision=None):
+        xml = self.renderElement(precision)
+        xmlParent.append(xml)
+        ShapeInterface.render(self, xml, precision)
+
+    def stream(self, write, precision=None):
+        xml = self.renderElement(precision)
+        if not self._shapes:
+            write(ElementTree.tostring(xml, encoding='utf-8'))
+            return
+        head, tail = _splitAtPlaceholder(xml)
+        write(head)
+        ShapeInterface.stream(self, write, precision)
+        write(tail)
+
+    def streamCached(self, write, precision=None):
+        self.stream(write, precision)
+
+    def contentKey(self):
+        """Return a hashable summary of everything rendered for this shape and its children, which tells whether the
+        XML cached by a placemark is still valid.
+        """
+        settings = self._settingValues if self._settings is None else repr(sorted(self._settings.iteritems()))
+        return (self.TAG, self._shapeID, _styleKey(self._style), settings,
+                tuple(shape.contentKey() for shape in self._shapes or ()))
+
+    def toString(self, precision=None):
+        """Return the XML of this shape including its children.
+        """
+        xml = self.renderElement(precision)
+        ShapeInterface.render(self, xml, precision)
+        return ElementTree.tostring(xml, encoding='utf-8')
 
 
 class LineString(AbstractShape):
     TAG = 'LineString'
-
-    def __init__(self, coordinateTuples, tessellate=True, shapeID=None):
+    SETTINGS = ('tessellate',)
+    __slots__ = ('_coordinates', '_dimensions', 'precision')
+
+    def __init__(self, coordinateTuples, tessellate=True, shapeID=None, validate=True, precision=None):
+        """Line through the points of coordinateTuples, given as (lon, lat) or (lon, lat, alt) tuples or as NumPy
+        array of shape (M, 2) or (M, 3). Pass validate=False if the coordinates have already been checked by the
+        caller, e.g. as a whole array. precision is the number of decimals of the coordinates and overrides the one of
+        the document.
+        """
         AbstractShape.__init__(self, shapeID=shapeID)
-        self.settings = {
-            'tessellate': 1 if tessellate else 0,
-        }
-        self.coordinates = []
-        for tup in coordinateTuples:
-            if isinstance(tup, (tuple, list)) and len(tup) in (2, 3):
-                self.coordinates.append(tup)
+        self._settingValues = _intern((1 if tessellate else 0,))
+        self.precision = precision
+        self._setCoordinates(coordinateTuples, validate)
+
+    def _setCoordinates(self, coordinateTuples, validate=True):
+        # Points of equal dimension are stored in a flat array of doubles or integers, others as list of tuples
+        if hasattr(coordinateTuples, 'ndim'):
+            if coordinateTuples.ndim != 2 or coordinateTuples.shape[1] not in (2, 3):
+                raise ValueError('Coordinate array must be of shape (M, 2) or (M, 3).')
+            self._dimensions = coordinateTuples.shape[1]
+            if coordinateTuples.dtype.kind in 'iu':
+                self._coordinates = array('l', coordinateTuples.ravel().tolist())
             else:
-                raise ValueError('Tuple %s is no valid coordinate tuple.' % str(tup))
+                self._coordinates = array('d', coordinateTuples.astype(float).tostring())
+            return
+        if validate:
+            coordinates = []
+            for tup in coordinateTuples:
+                if isinstance(tup, (tuple, list)) and len(tup) in (2, 3):
+                    coordinates.append(tup)
+                else:
+                    raise ValueError('Tuple %s is no valid coordinate tuple.' % str(tup))
+        else:
+            coordinates = list(coordinateTuples)
+        dimensions = set(len(tup) for tup in coordinates)
+        values = [value for tup in coordinates for value in tup]
+        typecode = _typecode(values) if len(dimensions) == 1 else None
+        if typecode is not None:
+            self._dimensions = dimensions.pop()
+            self._coordinates = array(typecode, values)
+        else:
+            self._dimensions = None
+            self._coordinates = coordinates
+
+    @property
+    def coordinates(self):
+        """List of the coordinate tuples.
+        """
+        if self._dimensions is None:
+            return self._coordinates
+        return zip(*[iter(self._coordinates)] * self._dimensions)
+
+    @coordinates.setter
+    def coordinates(self, coordinateTuples):
+        self._setCoordinates(coordinateTuples)
+
+    def contentKey(self):
+        if self._dimensions is None:
+            coordinates = tuple(self._coordinates)
+        else:
+            coordinates = (self._coordinates.typecode, self._coordinates.tostring())
+        return AbstractShape.contentKey(self) + (self._dimensions, coordinates, self.precision)
 
     def mayBeAddedTo(self, instance):
-        return (instance.__class__ == MultiGeometry) or ((instance.__class__ == Placemark) and len(instance.shapes) < 1)
+        return (instance.__class__ == MultiGeometry) or ((instance.__class__ == Placemark) and not instance._shapes)
+
+    def getBounds(self):
+        if self._dimensions is None:
+            coordinates = self._coordinates
+            if len(coordinates) == 0:
+                return None
+            lon = [tup[0] for tup in coordinates]
+            lat = [tup[1] for tup in coordinates]
+        else:
+            if len(self._coordinates) == 0:
+                return None
+            lon = self._coordinates[0::self._dimensions]
+            lat = self._coordinates[1::self._dimensions]
+        return (min(lon), min(lat), max(lon), max(lat))
 
-    def renderNode(self, xml):
+    def renderNode(self, xml, precision=None):
         #xml = ElementTree.SubElement(xmlParent, self.TAG)
-        ElementTree.SubElement(xml, 'coordinates').text = ' '.join([','.join((str(value) for value in tup)) for tup in self.coordinates])
+        if self.precision is not None:
+            precision = self.precision
+        if self._dimensions is None:
+            text = encodeCoordinates(self._coordinates, precision)
+        else:
+            text = encodeFlatCoordinates(self._coordinates, self._dimensions, precision)
+        ElementTree.SubElement(xml, 'coordinates').text = text
 
 
 class LinearRing(LineString):
     TAG = 'LinearRing'
+    __slots__ = ()
 
 
 class Polygon(AbstractShape):
     TAG = 'Polygon'
+    SETTINGS = ('altitudeMode', 'extrude')
+    __slots__ = ('outerBoundaryIs', '_innerBoundaryIs', 'precision')
 
-    def __init__(self, coordinateTuples, altitudeMode=None, extrude=False, shapeID=None):
+    def __init__(self, coordinateTuples, altitudeMode=None, extrude=False, shapeID=None, validate=True,
+                 precision=None):
         AbstractShape.__init__(self, shapeID=shapeID)
         if altitudeMode is not None:
             _validators['altitudeModeEnum'](altitudeMode)
-        self.settings = {
-            'altitudeMode': altitudeMode,
-            #'tesselate': 1 if tesselate else 0,    ignored by Polygon tag
-            'extrude': 1 if extrude else 0,
-        }
-        self.outerBoundaryIs = LinearRing(coordinateTuples)
-        self.innerBoundaryIs = []
+        self._settingValues = _intern((
+            altitudeMode,
+            #1 if tesselate else 0,    ignored by Polygon tag
+            1 if extrude else 0,
+        ))
+        self.outerBoundaryIs = LinearRing(coordinateTuples, validate=validate, precision=precision)
+        self._innerBoundaryIs = None    # the list is created when the first inner boundary is added or accessed
+        self.precision = precision
+
+    @property
+    def innerBoundaryIs(self):
+        """List of the inner boundaries as LinearRing.
+        """
+        if self._innerBoundaryIs is None:
+            self._innerBoundaryIs = []
+        return self._innerBoundaryIs
+
+    @innerBoundaryIs.setter
+    def innerBoundaryIs(self, rings):
+        self._innerBoundaryIs = rings
 
     def mayBeAddedTo(self, instance):
-        return (instance.__class__ == MultiGeometry) or ((instance.__class__ == Placemark) and len(instance.shapes) < 1)
+        return (instance.__class__ == MultiGeometry) or ((instance.__class__ == Placemark) and not instance._shapes)
+
+    def addInnerBoundary(self, coordinateTuples, validate=True):
+        self.innerBoundaryIs.append(LinearRing(coordinateTuples, validate=validate, precision=self.precision))
+
+    def getBounds(self):
+        return self.outerBoundaryIs.getBounds()
 
-    def addInnerBoundary(self, coordinateTuples):
-        self.innerBoundaryIs.append(LinearRing(coordinateTuples))
+    def contentKey(self):
+        return AbstractShape.contentKey(self) + (self.outerBoundaryIs.contentKey(),
+                                                 tuple(ring.contentKey() for ring in self._innerBoundaryIs or ()))
 
-    def renderNode(self, xml):
-        self.outerBoundaryIs.render(ElementTree.SubElement(xml, 'outerBoundaryIs'))
-        for item in self.innerBoundaryIs:
-            item.render(ElementTree.SubElement(xml, 'innerBoundaryIs'))
+    def renderNode(self, xml, precision=None):
+        self.outerBoundaryIs.render(ElementTree.SubElement(xml, 'outerBoundaryIs'), precision)
+        for item in self._innerBoundaryIs or ():
+            item.render(ElementTree.SubElement(xml, 'innerBoundaryIs'), precision)
 
 
 class MultiGeometry(AbstractShape):
     TAG = 'MultiGeometry'
+    __slots__ = ()
 
     def mayBeAddedTo(self, instance):
-        return (instance.__class__ == MultiGeometry) or ((instance.__class__ == Placemark) and len(instance.shapes) < 1)
+        return (instance.__class__ == MultiGeometry) or ((instance.__class__ == Placemark) and not instance._shapes)
 
 
 class Placemark(AbstractShape):
     TAG = 'Placemark'
+    SETTINGS = ('name', 'visibility', 'open', 'description')
+    __slots__ = ('_fragment',)
 
     def __init__(self, name=None, visibility=True, open=False, description=None, shapeID=None, style=None):
         AbstractShape.__init__(self, shapeID=shapeID, style=style)
-        self.settings = {
-            'name': name,
-            'visibility': 1 if visibility else 0,
-            'open': 1 if open else 0,
-            'description': description,
-        }
+        self._settingValues = (
+            name,
+            1 if visibility else 0,
+            1 if open else 0,
+            description,
+        )
+        self._fragment = None   # cached XML as (precision, SHA-1 digest of the styles and geometries, XML)
+
+    def _invalidate(self):
+        self._fragment = None
 
     def mayBeAddedTo(self, instance):
         return instance.__class__ in (KMLdata, Folder)
 
+    def streamCached(self, write, precision=None):
+        # Geometries do not know their placemark, so their changes are detected by comparing their content
+        key = _digest((_styleKey(self._style), tuple(shape.contentKey() for shape in self._shapes or ())))
+        if self._fragment is None or self._fragment[:2] != (precision, key):
+            self._fragment = (precision, key, self.toString(precision))
+        write(self._fragment[2])
+
 
 class Folder(Placemark):
     TAG = 'Folder'
+    __slots__ = ()
 
     def mayBeAddedTo(self, instance):
         return instance.__class__ == KMLdata
 
+    def streamCached(self, write, precision=None):
+        # Only the own start and end tags are cached, the children cache their XML themselves
+        if not self._shapes:
+            return Placemark.streamCached(self, write, precision)
+        head, tail = self._cachedTags(precision)
+        write(head)
+        ShapeInterface.streamCached(self, write, precision)
+        write(tail)
+
+    def streamParts(self, fileobj, precision=None):
+        """Like streamCached, but write into the file object fileobj and return (offset, length, bounds) of every
+        child in the file, which allows to split a Fragment of the folder into its children.
+        """
+        head, tail = self._cachedTags(precision)
+        fileobj.write(head)
+        parts = []
+        for shape in self._shapes or ():
+            offset = fileobj.tell()
+            shape.streamCached(fileobj.write, precision)
+            parts.append((offset, fileobj.tell() - offset, shape.getBounds()))
+        fileobj.write(tail)
+        return parts
+
+    def _cachedTags(self, precision):
+        key = _styleKey(self._style)
+        if self._fragment is None or self._fragment[:2] != (precision, key):
+            self._fragment = (precision, key) + _splitAtPlaceholder(self.renderElement(precision))
+        return self._fragment[2:]
+
+
+class LazyFolder(Folder):
+    """Folder, whose children are created by the callable factory returning an iterable of shapes whenever the folder
+    is rendered. When streamed, only one child exists at a time, so folders of any size can be written with constant
+    memory.
+    """
+    __slots__ = ('factory',)
+
+    def __init__(self, factory, name=None, visibility=True, open=False, description=None, shapeID=None, style=None):
+        Folder.__init__(self, name=name, visibility=visibility, open=open, description=description, shapeID=shapeID,
+                        style=style)
+        self.factory = factory
+
+    def add(self, shapeElement):
+        raise TypeError('The children of a LazyFolder are created by its factory.')
+
+    def render(self, xmlParent, precision=None):
+        xml = self.renderElement(precision)
+        xmlParent.append(xml)
+        for shape in self.factory():
+            shape.render(xml, precision)
+
+    def toString(self, precision=None):
+        return ''.join(self.fragments(precision))
+
+    def fragments(self, precision=None):
+        """Generator of the XML of the start tag, every child and the end tag.
+        """
+        head, tail = _splitAtPlaceholder(self.renderElement(precision))
+        yield head
+        for shape in self.factory():
+            yield shape.toString(precision)
+        yield tail
+
+    def stream(self, write, precision=None):
+        for fragment in self.fragments(precision):
+            write(fragment)
+
+    def streamCached(self, write, precision=None):
+        self.stream(write, precision)
+
+
+class Fragment(AbstractShape):
+    """XML of a placemark or folder rendered before and stored in the file filename, e.g. by a previous run. The XML
+    is the whole file or the concatenation of its byte ranges given as (offset, length). bounds is the bounding box
+    of the coordinates. For a folder written by Folder.streamParts, parts are its (offset, length, bounds), which
+    make the children available as fragments of their own.
+    """
+    __slots__ = ('filename', 'ranges', 'bounds', 'children')
+
+    def __init__(self, filename, ranges=None, bounds=None, parts=None):
+        AbstractShape.__init__(self)
+        self.filename = filename
+        self.ranges = ranges
+        self.bounds = bounds
+        self.children = None if parts is None else [Fragment(filename, [(offset, length)], childBounds)
+                                                    for offset, length, childBounds in parts]
+
+    def mayBeAddedTo(self, instance):
+        return instance.__class__ in (KMLdata, Folder)
+
+    def getBounds(self):
+        if self.children is not None:
+            return _unionBounds(child.getBounds() for child in self.children)
+        return self.bounds
+
+    def subset(self, children):
+        """Return the fragment of the folder with only the given ones of its children.
+        """
+        first, last = self.children[0].ranges[0], self.children[-1].ranges[0]
+        end = last[0] + last[1]
+        return Fragment(self.filename, [(0, first[0])] + [child.ranges[0] for child in children] +
+                        [(end, os.path.getsize(self.filename) - end)])
+
+    def toString(self, precision=None):
+        return ''.join(self._chunks())
+
+    def render(self, xmlParent, precision=None):
+        xmlParent.append(ElementTree.fromstring(self.toString()))
+
+    def stream(self, write, precision=None):
+        for chunk in self._chunks():
+            write(chunk)
+
+    def _chunks(self):
+        with open(self.filename, 'rb') as f:
+            if self.ranges is None:
+                for chunk in iter(lambda: f.read(1 << 16), ''):
+                    yield chunk
+                return
+            for offset, length in self.ranges:
+                f.seek(offset)
+                while length > 0:
+                    chunk = f.read(min(length, 1 << 16))
+                    length -= len(chunk)
+                    yield chunk
+
+
+class NetworkLink(Placemark):
+    TAG = 'NetworkLink'
+    __slots__ = ('href', 'region')
+
+    def __init__(self, href, name=None, visibility=True, open=False, description=None, region=None, shapeID=None,
+                 style=None):
+        """Link to another KML file href, which is loaded when the dictionary region made by the function region is
+        active or always if region is None.
+        """
+        Placemark.__init__(self, name=name, visibility=visibility, open=open, description=description,
+                           shapeID=shapeID, style=style)
+        self.href = href
+        self.region = region
+
+    def mayBeAddedTo(self, instance):
+        return instance.__class__ in (KMLdata, Folder)
+
+    def renderNode(self, xml, precision=None):
+        link = OrderedDict((('href', self.href),))
+        if self.region is not None:
+            _renderDict(xml, {'Region': self.region})
+            link['viewRefreshMode'] = 'onRegion'
+        _renderDict(xml, {'Link': link})
+
 
 class ScreenOverlay(AbstractShape):
-    def __init__(self, href, name=None, description=None, shapeID=None):
+    TAG = 'ScreenOverlay'
+    SETTINGS = ('name', 'description')
+    __slots__ = ('href', 'overlayXY', 'screenXY', 'size')
+
+    def __init__(self, href, name=None, description=None, shapeID=None, overlayXY=(0, 0), screenXY=(0, 0),
+                 size=None):
+        """Image href fixed on the screen, e.g. a legend. The point overlayXY of the image is placed at the point
+        screenXY of the screen, both given as fractions (x, y) of the width and height from the lower left corner.
+        size is the size (width, height) of the image in pixels, None meaning its original size.
+        """
         AbstractShape.__init__(self, shapeID=shapeID)
-        self.settings = {
-            'name': name,
-            'description': description,
-        }
+        self._settingValues = (name, description)
+        self.href = href
+        self.overlayXY = overlayXY
+        self.screenXY = screenXY
+        self.size = size
+
+    def mayBeAddedTo(self, instance):
+        return instance.__class__ in (KMLdata, Folder)
+
+    def renderNode(self, xml, precision=None):
+        _renderDict(xml, {'Icon': {'href': self.href}})
+        for tag, (x, y) in (('overlayXY', self.overlayXY), ('screenXY', self.screenXY)):
+            ElementTree.SubElement(xml, tag, x=str(x), y=str(y), xunits='fraction', yunits='fraction')
+        if self.size is not None:
+            ElementTree.SubElement(xml, 'size', x=str(self.size[0]), y=str(self.size[1]), xunits='pixels',
+                                   yunits='pixels')
+
+
+class GroundOverlay(AbstractShape):
+    TAG = 'GroundOverlay'
+    SETTINGS = ('name', 'description')
+    __slots__ = ('href', 'box', 'drawOrder', 'region')
+
+    def __init__(self, href, box, name=None, description=None, shapeID=None, drawOrder=None, region=None):
+        """Image href draped onto the ground, stretched over the box (west, south, east, north). Overlays with a
+        higher drawOrder are drawn on top. The overlay is only shown while the dictionary region made by the function
+        region is active or always if region is None.
+        """
+        AbstractShape.__init__(self, shapeID=shapeID)
+        self._settingValues = (name, description)
+        self.href = href
+        self.box = tuple(box)
+        self.drawOrder = drawOrder
+        self.region = region
+
+    def mayBeAddedTo(self, instance):
+        return instance.__class__ in (KMLdata, Folder)
+
+    def getBounds(self):
+        return self.box
+
+    def renderNode(self, xml, precision=None):
+        west, south, east, north = self.box
+        if self.region is not None:
+            _renderDict(xml, {'Region': self.region})
+        _renderDict(xml, OrderedDict((
+            ('drawOrder', self.drawOrder),
+            ('Icon', {'href': self.href}),
+            ('LatLonBox', OrderedDict((('north', north), ('south', south), ('east', east), ('west', west)))),
+        )))
 
 
 class KMLdata(ShapeInterface):
-    def __init__(self, styles=None, name=None, description=None, visibility=True):
-        """Class to produce the actual KML output.
+    def __init__(self, styles=None, name=None, description=None, visibility=True, precision=None, stats=None,
+                 cache=False):
+        """Class to produce the actual KML output. precision is the number of decimals of all coordinates in the
+        document, None meaning full precision. If a Stats instance stats is given, the time and bytes of rendering
+        and serialization are recorded per top-level shape. If cache is True, the XML of every placemark and folder
+        is kept after rendering, so only modified ones are rendered again by the next call of getAsString or write.
+        Every call still walks all coordinates to find the modified placemarks.
         """
         super(KMLdata, self).__init__()
         self.styles = styles or StyleData()
+        self.precision = precision
+        self.stats = stats
+        self.cache = cache
         self.settings = {
             'name': name,
             'open': 0,
@@ -196,14 +648,100 @@ class KMLdata(ShapeInterface):
             'description': description,
         }
 
-    def getAsString(self):
+    def _renderDocument(self):
         root = ElementTree.Element(prefixedTag('kml'))
         document = ElementTree.SubElement(root, prefixedTag('Document'))
         _renderDict(document, self.settings)
         self.styles.renderStyles(document)
-        self.render(document)
-        return '<?xml version="1.0" encoding="UTF-8"?>\n' + \
+        return root, document
+
+    def getAsString(self, processes=None):
+        """Return the KML document as string. If processes is given, the shapes are rendered by a pool of processes
+        worker processes, which yields the same output.
+        """
+        if processes is not None or self.cache:
+            chunks = []
+            self._write(chunks.append, processes)
+            return ''.join(chunks)
+        lap = lapTimer(self.stats)
+        root, document = self._renderDocument()
+        lap('document')
+        for shape in self.shapes:
+            shape.render(document, self.precision)
+            if self.stats is not None:
+                lap('render', count=_countShapes(shape), series=_seriesName(shape))
+        kml = '<?xml version="1.0" encoding="UTF-8"?>\n' + \
             ElementTree.tostring(root, encoding='utf-8')
+        lap('serialize', bytes=len(kml))
+        return kml
+
+    def write(self, fileobj, processes=None):
+        """Write the KML document to the file-like object fileobj. The output equals the one of getAsString(), but
+        the shapes are serialized one after another, so no element tree of the whole document is built. If processes
+        is given, the shapes are rendered by a pool of processes worker processes.
+        """
+        self._write(fileobj.write, processes)
+
+    def _write(self, write, processes=None):
+        lap = lapTimer(self.stats)
+        written = [0]
+        if self.stats is not None:
+            def write(data, write=write):
+                written[0] += len(data)
+                write(data)
+        root, document = self._renderDocument()
+        head, tail = _splitAtPlaceholder(root, document)
+        write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        write(head)
+        lap('document', bytes=written[0])
+        if processes is None:
+            for shape in self.shapes:
+                before = written[0]
+                if self.cache:
+                    shape.streamCached(write, self.precision)
+                else:
+                    shape.stream(write, self.precision)
+                if self.stats is not None:
+                    lap('stream', count=_countShapes(shape), bytes=written[0] - before, series=_seriesName(shape))
+        else:
+            before = written[0]
+            for fragment in self._renderParallel(processes):
+                write(fragment)
+            if self.stats is not None:
+                lap('parallel', count=sum(_countShapes(shape) for shape in self.shapes), bytes=written[0] - before)
+        write(tail)
+        lap('document', bytes=len(tail))
+
+    def _renderParallel(self, processes, chunksPerProcess=4):
+        """Generator of the XML of all shapes, rendered in chunks by a process pool. The children of every top-level
+        shape are split into chunks, the start and end tags of the top-level shapes are rendered here.
+        """
+        pieces = []     # strings, chunks of shapes and lazy folders in document order
+        for shape in self.shapes:
+            if isinstance(shape, LazyFolder):
+                pieces.append(shape)    # its factory can neither be pickled nor be split, so it is rendered here
+                continue
+            if len(shape.shapes) == 0:
+                pieces.append([shape])
+                continue
+            head, tail = _splitAtPlaceholder(shape.renderElement(self.precision))
+            chunkSize = max(1, -(-len(shape.shapes) // (processes * chunksPerProcess)))
+            pieces.append(head)
+            pieces.extend(shape.shapes[i:i + chunkSize] for i in xrange(0, len(shape.shapes), chunkSize))
+            pieces.append(tail)
+        pool = multiprocessing.Pool(processes)
+        try:
+            fragments = pool.imap(_renderShapes, [(piece, self.precision) for piece in pieces
+                                                  if isinstance(piece, list)])
+            for piece in pieces:
+                if isinstance(piece, LazyFolder):
+                    for fragment in piece.fragments(self.precision):
+                        yield fragment
+                else:
+                    yield fragments.next() if isinstance(piece, list) else piece
+        finally:
+            pool.terminate()
+            pool.join()
 
 #===============================================================================
 # <?xml version="1.0" encoding="UTF-8"?>
@@ -249,14 +787,65 @@ def _generateStruct(name, *args, **kwargs):
     def initializer(self, **kwargs):
         for name, value in kwargs.iteritems():
             setattr(self, name, value)
-    elements.update({
+    def shared(cls, **kwargs):
+        """Return the shared immutable instance with the field values kwargs. It is validated only when requested
+        for the first time, later calls with the same values return the same instance.
+        """
+        key = tuple(sorted(kwargs.iteritems()))
+        instance = cls._shared.get(key)
+        if instance is None:
+            instance = object.__new__(cls._frozen)
+            for field, value in kwargs.iteritems():
+                validator(instance, field, value)
+            object.__setattr__(instance, '_xml', None)
+            object.__setattr__(instance, '_sharedKey', key)
+            instance = cls._shared.setdefault(key, instance)
+        return instance
+    # The fields are stored in slots, as their names may not be identifiers, e.g. gx:outerColor
+    slots = dict((field, '_' + field.replace(':', '_')) for field in elements)
+    struct = type(name, (), {
+        '__slots__': tuple(slots.itervalues()),
         '_keys': elements.keys(),
+        '_shared': {},
         '__setattr__': validator,
         '__init__': initializer,
         '__setitem__': validator,
         '__getitem__': object.__getattribute__,
+        'shared': classmethod(shared),
     })
-    return type(name, (), elements)
+    for field, default in elements.iteritems():
+        setattr(struct, field, _slotField(struct.__dict__[slots[field]], default))
+    struct._frozen = type(name, (_SharedStruct, struct), {'__slots__': ('_xml', '_sharedKey'), '_struct': struct})
+    return struct
+
+
+def _slotField(slot, default):
+    """Return the property of a struct field stored in the member descriptor slot, which is default until set.
+    """
+    def get(self):
+        try:
+            return slot.__get__(self)
+        except AttributeError:
+            return default
+    return property(get, slot.__set__)
+
+
+class _SharedStruct(object):
+    """Base class of the immutable instances returned by the method shared of the generated structs.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise TypeError('Shared %s instances are immutable.' % self.__class__.__name__)
+
+    __setitem__ = __setattr__
+
+    def __reduce__(self):
+        return _sharedStruct, (self._struct, self._sharedKey)
+
+
+def _sharedStruct(struct, key):
+    return struct.shared(**dict(key))
 
 
 def _validatorStr(minLen=None, maxLen=None, exactLen=None):
@@ -334,24 +923,214 @@ def _simpleStyleRenderer(xmlNode, style, fields=[]):
             ElementTree.SubElement(xmlNode, field).text = str(style[field])
 
 
+_styleRenderers = {
+    'PolyStyle': _simpleStyleRenderer,
+    'BalloonStyle': _simpleStyleRenderer,
+    'LineStyle': _simpleStyleRenderer,
+}
+
+
 def _styleRenderer(xmlParent, style, styleID=None):
+    shared = isinstance(style, _SharedStruct) and styleID is None
+    if shared and style._xml is not None:
+        xmlParent.append(style._xml)    # rendered XML of shared styles is reused, as they cannot change
+        return
+
     attrib = {}
     if styleID is not None:
         attrib['id'] = styleID
     xmlNode = ElementTree.Element(style.__class__.__name__, attrib)
 
     try:
-        {
-            'PolyStyle': _simpleStyleRenderer,
-            'BalloonStyle': _simpleStyleRenderer,
-            'LineStyle': _simpleStyleRenderer,
-        }[style.__class__.__name__](xmlNode, style)
+        renderer = _styleRenderers[style.__class__.__name__]
     except KeyError as e:
         raise TypeError('Invalid style class: ' + e.message);
+    renderer(xmlNode, style)
 
+    if shared:
+        object.__setattr__(style, '_xml', xmlNode)
     xmlParent.append(xmlNode)
 
 
+_trailingZeros = re.compile(r'\.?0+(?=[ ,]|$)')
+_pointFormats = {}
+
+
+def encodeCoordinates(coordinates, precision=None):
+    """Return the text of a coordinates element for a sequence of coordinate tuples. With precision None, all values
+    are written with full precision, otherwise with precision decimals and without trailing zeros.
+    """
+    dimensions = set(len(tup) for tup in coordinates)
+    if len(dimensions) > 1:
+        return ' '.join([encodeCoordinates((tup,), precision) for tup in coordinates])
+    return encodeFlatCoordinates([value for tup in coordinates for value in tup], dimensions.pop() if dimensions else 1,
+                                 precision)
+
+
+def encodeFlatCoordinates(values, dimensions, precision):
+    """Bulk version of encodeCoordinates for a flat sequence of coordinate values with dimensions values per point,
+    e.g. [lon1, lat1, alt1, lon2, lat2, alt2, ...], formatting all values with a single format operation.
+    """
+    key = (dimensions, precision)
+    pointFormat = _pointFormats.get(key)
+    if pointFormat is None:
+        valueFormat = '%s' if precision is None else '%%.%df' % precision
+        pointFormat = _pointFormats[key] = ','.join([valueFormat] * dimensions)
+    text = ' '.join([pointFormat] * (len(values) // dimensions)) % tuple(values)
+    if precision:
+        text = _trailingZeros.sub('', text)
+    return text
+
+
+def region(west, south, east, north, minLodPixels=128, maxLodPixels=-1):
+    """Return the dictionary of a Region element to be used as setting or for a NetworkLink. The region is active if
+    the box (west, south, east, north) is displayed with at least minLodPixels and at most maxLodPixels (-1 meaning
+    infinite) pixels.
+    """
+    return OrderedDict((
+        ('LatLonAltBox', OrderedDict((('north', north), ('south', south), ('east', east), ('west', west)))),
+        ('Lod', OrderedDict((('minLodPixels', minLodPixels), ('maxLodPixels', maxLodPixels)))),
+    ))
+
+
+def timeSpan(begin=None, end=None):
+    """Return the dictionary of a TimeSpan element to be used as setting of a feature, which is then only shown
+    between begin and end. Both may be datetime or date objects or strings in the KML dateTime format; None means an
+    open end.
+    """
+    return OrderedDict((
+        ('begin', begin.isoformat() if hasattr(begin, 'isoformat') else begin),
+        ('end', end.isoformat() if hasattr(end, 'isoformat') else end),
+    ))
+
+
+def _unionBounds(boundsList):
+    union = None
+    for bounds in boundsList:
+        if bounds is None:
+            continue
+        if union is None:
+            union = bounds
+        else:
+            union = (min(union[0], bounds[0]), min(union[1], bounds[1]), max(union[2], bounds[2]),
+                     max(union[3], bounds[3]))
+    return union
+
+
+_internedSettings = {}
+
+
+def _intern(values):
+    """Return a shared instance of the tuple values to keep the setting values of many shapes compact.
+    """
+    return _internedSettings.setdefault(values, values)
+
+
+def _typecode(values):
+    """Return the typecode of an array holding the coordinate values without changing their text, 'd' for floats
+    and 'l' for integers, or None if the values are of mixed or other types.
+    """
+    types = set(map(type, values))
+    if all(issubclass(valueType, float) for valueType in types):
+        return 'd'
+    if all(issubclass(valueType, (int, long)) and valueType is not bool for valueType in types):
+        return 'l'
+    return None
+
+
+def _seriesName(shape):
+    """Return the name of a top-level shape to identify its series in the statistics.
+    """
+    return shape.settings.get('name') if isinstance(shape, AbstractShape) else None
+
+
+def _countShapes(shape):
+    return len(shape._shapes or ()) or 1
+
+
+def _renderShapes(args):
+    """Return the XML of a list of shapes including their children. Used by the worker processes of KMLdata.
+    """
+    shapes, precision = args
+    return ''.join([shape.toString(precision) for shape in shapes])
+
+
+def _splitAtPlaceholder(root, xmlParent=None):
+    """Serialize root with a placeholder appended to xmlParent (default: root) and return the XML before and
+    after the placeholder.
+    """
+    ElementTree.SubElement(root if xmlParent is None else xmlParent, _PLACEHOLDER)
+    head, tail = ElementTree.tostring(root, encoding='utf-8').split('<%s />' % _PLACEHOLDER)
+    return head, tail
+
+
+def _digest(key):
+    """Return the SHA-1 digest of the content key key, which identifies cached XML without keeping the key.
+    """
+    return hashlib.sha1(repr(key)).digest()
+
+
+def _styleValues(styles):
+    """Return the class names and field values of the list of styles styles as tuple, which is equal for lists of
+    styles with the same content and can be stored, e.g. to name shared styles by their content.
+    """
+    return tuple((style.__class__.__name__, tuple((field, style[field]) for field in sorted(style._keys)))
+                 for style in styles or ())
+
+
+def _styleKey(style):
+    """Return a hashable summary of the style URL or list of styles style. Shared styles are immutable, the others
+    are summarized by their fields.
+    """
+    if not isinstance(style, (list, tuple)):
+        return style
+    return tuple(item if isinstance(item, _SharedStruct) else
+                 (item.__class__, tuple(item[field] for field in item._keys)) for item in style)
+
+
+class _SettingsDict(dict):
+    """Settings of a shape, which drop the cached XML of the shape when modified.
+    """
+    __slots__ = ('_shape',)
+
+    def __init__(self, shape, *args):
+        dict.__init__(self, *args)
+        self._shape = shape
+
+    def _invalidate(self):
+        shape = getattr(self, '_shape', None)     # not set yet while unpickling
+        if shape is not None:
+            shape._invalidate()
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._invalidate()
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._invalidate()
+
+    def clear(self):
+        dict.clear(self)
+        self._invalidate()
+
+    def pop(self, *args):
+        self._invalidate()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._invalidate()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._invalidate()
+        return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._invalidate()
+
+
 def _renderDict(xmlParent, aDict):
     for key, value in aDict.iteritems():
         if value is None:
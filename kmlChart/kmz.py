@@ -0,0 +1,137 @@
+"""
+Module to write KMZ files, i.e. zip archives of a KML document and the files it references.
+"""
+import struct
+import time
+import zlib
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_LOCAL_EXTRA64 = struct.Struct('<HHQQ')
+_DATA_DESCRIPTOR = struct.Struct('<IIII')
+_DATA_DESCRIPTOR64 = struct.Struct('<IIQQ')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_OF_CENTRAL_DIRECTORY = struct.Struct('<IHHHHIIH')
+_END_OF_CENTRAL_DIRECTORY64 = struct.Struct('<IQHHIIQQQQ')
+_END_OF_CENTRAL_DIRECTORY64_LOCATOR = struct.Struct('<IIQI')
+_DATA_DESCRIPTOR_FLAG = 0x08    # sizes and checksum follow the data
+_DEFLATED = 8
+_VERSION = 20
+_VERSION64 = 45
+_ZIP64_LIMIT = 0xffffffff   # sizes and offsets from this one on need ZIP64 records
+_ZIP64_COUNT_LIMIT = 0xffff
+
+
+class KMZWriter(object):
+    """Writes a zip archive into the file object fileobj, which only needs a write method. The entries are compressed
+    with the zlib compression level compresslevel (0-9) while they are written, so neither the entries nor the
+    archive are ever held in memory as a whole. The document is expected as first entry named doc.kml. Archives of
+    4 GB and more and entries opened with zip64=True are written in the ZIP64 format.
+    """
+    def __init__(self, fileobj, compresslevel=6):
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self._offset = 0
+        self._entries = []  # central directory records
+        self._entry = None
+
+    def open(self, name, zip64=False):
+        """Start the entry name and return it. The entry must be closed before the next one is opened. Entries that
+        may reach 4 GB, compressed or not, must be opened with zip64=True, as their local header is written before
+        their size is known. Otherwise closing such an entry raises a ValueError.
+        """
+        if self._entry is not None:
+            raise ValueError('Entry %s is still open.' % self._entry.name)
+        self._entry = _Entry(self, name, zip64)
+        return self._entry
+
+    def writestr(self, name, data):
+        """Add the entry name with the content data.
+        """
+        entry = self.open(name, zip64=len(data) * 1.05 >= _ZIP64_LIMIT)  # allowing for compression overhead
+        entry.write(data)
+        entry.close()
+
+    def close(self):
+        """Write the central directory. The file object is not closed.
+        """
+        if self._entry is not None:
+            self._entry.close()
+        start = self._offset
+        for record in self._entries:
+            self._write(record)
+        count, size = len(self._entries), self._offset - start
+        if count >= _ZIP64_COUNT_LIMIT or size >= _ZIP64_LIMIT or start >= _ZIP64_LIMIT:
+            end = self._offset
+            self._write(_END_OF_CENTRAL_DIRECTORY64.pack(0x06064b50, _END_OF_CENTRAL_DIRECTORY64.size - 12,
+                                                         _VERSION64, _VERSION64, 0, 0, count, count, size, start))
+            self._write(_END_OF_CENTRAL_DIRECTORY64_LOCATOR.pack(0x07064b50, 0, end, 1))
+            count = min(count, 0xffff)
+            size, start = (0xffffffff if value >= _ZIP64_LIMIT else value for value in (size, start))
+        self._write(_END_OF_CENTRAL_DIRECTORY.pack(0x06054b50, 0, 0, count, count, size, start, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType is None:
+            self.close()
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self._offset += len(data)
+
+
+class _Entry(object):
+    """Entry of a KMZWriter being written.
+    """
+    def __init__(self, archive, name, zip64=False):
+        self.archive = archive
+        self.name = name.encode('utf-8') if isinstance(name, unicode) else name
+        self.zip64 = zip64
+        self.offset = archive._offset
+        self.crc = 0
+        self.size = 0
+        self.compressedSize = 0
+        self._compressor = zlib.compressobj(archive.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        now = time.localtime()
+        self._time = (now.tm_hour << 11) | (now.tm_min << 5) | (now.tm_sec // 2)
+        self._date = ((now.tm_year - 1980) << 9) | (now.tm_mon << 5) | now.tm_mday
+        # The ZIP64 extra field with zero sizes tells readers that the data descriptor has 8 byte sizes
+        extra = _LOCAL_EXTRA64.pack(0x0001, 16, 0, 0) if zip64 else ''
+        archive._write(_LOCAL_HEADER.pack(0x04034b50, _VERSION64 if zip64 else _VERSION, _DATA_DESCRIPTOR_FLAG,
+                                          _DEFLATED, self._time, self._date, 0, 0, 0, len(self.name), len(extra)) +
+                       self.name + extra)
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self._writeCompressed(self._compressor.compress(data))
+
+    def close(self):
+        if self.archive._entry is not self:
+            return
+        self._writeCompressed(self._compressor.flush())
+        crc = self.crc & 0xffffffff
+        if self.zip64:
+            self.archive._write(_DATA_DESCRIPTOR64.pack(0x08074b50, crc, self.compressedSize, self.size))
+        elif self.compressedSize >= _ZIP64_LIMIT or self.size >= _ZIP64_LIMIT:
+            raise ValueError('Entry %s reached 4 GB, open it with zip64=True.' % self.name)
+        else:
+            self.archive._write(_DATA_DESCRIPTOR.pack(0x08074b50, crc, self.compressedSize, self.size))
+        # Values too large for the header are replaced by 0xffffffff and given in the ZIP64 extra field instead
+        values = (self.size, self.compressedSize, self.offset)
+        large = [value for value in values if value >= _ZIP64_LIMIT]
+        extra = struct.pack('<HH%dQ' % len(large), 0x0001, 8 * len(large), *large) if large else ''
+        size, compressedSize, offset = (0xffffffff if value >= _ZIP64_LIMIT else value for value in values)
+        version = _VERSION64 if large or self.zip64 else _VERSION
+        self.archive._entries.append(_CENTRAL_HEADER.pack(
+            0x02014b50, version, version, _DATA_DESCRIPTOR_FLAG, _DEFLATED, self._time, self._date, crc,
+            compressedSize, size, len(self.name), len(extra), 0, 0, 0, 0644 << 16, offset) + self.name + extra)
+        self.archive._entry = None
+
+    def _writeCompressed(self, data):
+        if data:
+            self.compressedSize += len(data)
+            self.archive._write(data)
@@ -1,17 +1,39 @@
 """
 Module to create image legends.
 """
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
 import os.path
-from kmlChart.colorBars import jet
+from StringIO import StringIO
+import numpy
+from kmlChart.colorMap import ColorMap
 from math import log, floor, ceil
 
 
 class legend(object):
-    def __init__(self, caxis, colorbar):
-        self.caxis = (min(caxis), max(caxis))
+    def __init__(self, caxis, colorbar, scale='linear', breakpoints=None):
+        """Legend of the colors colorbar on the color axis caxis with the scale 'linear' or 'log', or of the colors
+        of the bins between the breakpoints, see ColorMap. Every color gets the same height.
+        """
+        self.edges = ColorMap(colorbar, caxis, scale, breakpoints).edges()
+        self.caxis = (self.edges[0], self.edges[-1])
         self.colorbar = colorbar
-        self._generateTicks()
+        self.scale = scale if breakpoints is None else 'linear'    # between the breakpoints
+        if breakpoints is not None:
+            step = (len(self.edges) + 9) // 10    # at most ten labels
+            self.ticks = [(value, '%g' % value) for value in self.edges[::step]]
+        elif scale == 'log' and numpy.floor(numpy.log10(self.caxis[1])) > numpy.ceil(numpy.log10(self.caxis[0])):
+            powers = numpy.arange(numpy.ceil(numpy.log10(self.caxis[0])), numpy.floor(numpy.log10(self.caxis[1])) + 1)
+            self.ticks = [(10.0 ** power, '%g' % 10.0 ** power) for power in powers]    # one per decade
+        else:
+            self._generateTicks()
+
+    def position(self, value):
+        """Return the position of value along the color strip, from 0 at the first to 1 at the last color.
+        """
+        edges = self.edges
+        if self.scale == 'log':
+            edges, value = numpy.log10(edges), numpy.log10(value)
+        return numpy.interp(value, edges, numpy.linspace(0, 1, len(edges)))
 
     def _generateTicks(self):
         self.ticks = []
@@ -25,29 +47,75 @@ class legend(object):
 
 
 class pngLegend(legend):
-    def __init__(self, caxis, colorbar):
-        super(pngLegend, self).__init__(caxis, colorbar)
-        self._image = Image.new('RGBA', (200, 400), (0,0,0,0))
-        self._font = ImageFont.truetype(os.path.join(os.path.dirname(__file__), '__data__', 'HELR45W.ttf'), 16)
+    def __init__(self, caxis, colorbar, size=(200, 400), scale='linear', breakpoints=None):
+        """Legend image of size (width, height) pixels. The layout is scaled from the default size.
+        """
+        super(pngLegend, self).__init__(caxis, colorbar, scale, breakpoints)
+        self.size = tuple(size)
+        self._image = Image.new('RGBA', self.size, (0,0,0,0))
+        self._font = _font(max(6, int(round(16 * min(self.size[0] / 200.0, self.size[1] / 400.0)))))
         self._drawLegend()
 
     def _drawLegend(self):
+        width, height = self.size
+        left, right = int(round(width * 0.05)), int(round(width * 0.3))
+        top, bottom = int(round(height * 0.025)), height - int(round(height * 0.025))
         canvas = ImageDraw.Draw(self._image)
-        canvas.rectangle(((10, 10), (60, 390)), outline=(0xff, 0xff, 0xff, 0xff))
-        colorbar = self.colorbar
-        tile = float(389-10) / len(colorbar)
-        for i in xrange(len(colorbar)):
-            canvas.rectangle(((11, 389-int((i+1) * tile)+1), (59, 389-int(i * tile))), fill=colorbar[i] + (0xff,))
+        canvas.rectangle(((left, top), (right, bottom)), outline=(0xff, 0xff, 0xff, 0xff))
+        # Color strip inside the outline, the first color at the bottom
+        rows = bottom - top - 1
+        indices = (numpy.arange(rows)[::-1] * len(self.colorbar)) // rows
+        strip = numpy.empty((rows, right - left - 1, 4), dtype=numpy.uint8)
+        strip[:, :, :3] = numpy.array(self.colorbar, dtype=numpy.uint8)[indices][:, None, :]
+        strip[:, :, 3] = 0xff
+        self._image.paste(Image.fromarray(strip, 'RGBA'), (left + 1, top + 1))
+        tickEnd, textOffset = right + int(round(width * 0.05)), self._font.size * 5 // 8
+        labels = Image.new('L', self.size, 0)
+        labelCanvas = ImageDraw.Draw(labels)
         for tick in self.ticks:
-            y = int(float(tick[0] - self.caxis[0]) / (self.caxis[1]- self.caxis[0]) * (390-10))
-            canvas.line(((60, 390-y), (70, 390-y)), fill=(0xff, 0xff, 0xff, 0xff))
-            canvas.text((80-1, 390-y-10), tick[1], font=self._font, fill=(0x00, 0x00, 0x00, 0xff))   # RGBA
-            canvas.text((80, 390-y-10-1), tick[1], font=self._font, fill=(0x00, 0x00, 0x00, 0xff))   # RGBA
-            canvas.text((80, 390-y-10+1), tick[1], font=self._font, fill=(0x00, 0x00, 0x00, 0xff))   # RGBA
-            canvas.text((80+1, 390-y-10), tick[1], font=self._font, fill=(0x00, 0x00, 0x00, 0xff))   # RGBA
-            canvas.text((80, 390-y-10), tick[1], font=self._font, fill=(0xff, 0xff, 0xff, 0xff))   # RGBA
-
+            y = bottom - int(self.position(tick[0]) * (bottom - top))
+            canvas.line(((right, y), (tickEnd, y)), fill=(0xff, 0xff, 0xff, 0xff))
+            labelCanvas.text((tickEnd + int(round(width * 0.05)), y - textOffset), tick[1], font=self._font, fill=0xff)
+        # The labels are drawn once and outlined by widening them by a pixel
+        box = (0, 0) + self.size
+        self._image.paste((0x00, 0x00, 0x00, 0xff), box, labels.filter(ImageFilter.MaxFilter(3)))   # RGBA
+        self._image.paste((0xff, 0xff, 0xff, 0xff), box, labels)   # RGBA
 
     def save(self, filename):
-        with open(filename, 'w') as f:
+        with open(filename, 'wb') as f:
             self._image.save(f, format='PNG')
+
+    def getAsString(self):
+        """Return the legend as PNG image.
+        """
+        f = StringIO()
+        self._image.save(f, format='PNG')
+        return f.getvalue()
+
+
+_fonts = {}
+
+
+def _font(size):
+    """Return the legend font of size size, loaded only once per process.
+    """
+    font = _fonts.get(size)
+    if font is None:
+        font = _fonts[size] = ImageFont.truetype(os.path.join(os.path.dirname(__file__), '__data__', 'HELR45W.ttf'),
+                                                 size)
+    return font
+
+
+_legends = {}
+
+
+def legendPNG(caxis, colorbar, size=(200, 400), scale='linear', breakpoints=None):
+    """Return the PNG image of a pngLegend as string. The images are cached per process, so identical legends of
+    many charts are only drawn once.
+    """
+    key = ((min(caxis), max(caxis)), tuple(tuple(color) for color in colorbar), tuple(size), scale,
+           None if breakpoints is None else tuple(breakpoints))
+    png = _legends.get(key)
+    if png is None:
+        png = _legends[key] = pngLegend(caxis, colorbar, size, scale, breakpoints).getAsString()
+    return png
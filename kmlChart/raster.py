@@ -0,0 +1,89 @@
+"""
+Module to render values on regular grids as images, e.g. for GroundOverlays, optionally split into a pyramid of tiles.
+"""
+from __future__ import absolute_import
+from StringIO import StringIO
+from math import ceil, log
+import numpy
+from PIL import Image
+
+
+def pixelGrid(lon_edges, lat_edges, cells, maxRefinement=8):
+    """Return the cells of a grid resampled to equally sized pixels in image order, i.e. the first row in the north
+    and the first column in the west, and the box (west, south, east, north) of the image. lon_edges are the C+1 and
+    lat_edges the R+1 monotonic cell edges, cells is an array of shape (R, C). Grids with unevenly spaced edges are
+    sampled at the smallest spacing, but with at most maxRefinement times as many pixels as cells along each axis.
+    """
+    lon_edges = numpy.asarray(lon_edges, dtype=float)
+    lat_edges = numpy.asarray(lat_edges, dtype=float)
+    cells = numpy.asarray(cells)
+    if cells.ndim != 2 or cells.shape != (len(lat_edges) - 1, len(lon_edges) - 1):
+        raise ValueError('Cells must be of shape (len(lat_edges) - 1, len(lon_edges) - 1).')
+    columns = _pixelCells(lon_edges, maxRefinement)
+    rows = _pixelCells(lat_edges, maxRefinement)[::-1]   # north first
+    box = (lon_edges.min(), lat_edges.min(), lon_edges.max(), lat_edges.max())
+    return cells[numpy.ix_(rows, columns)], box
+
+
+def _pixelCells(edges, maxRefinement):
+    """Return the index of the cell of every pixel along an axis with the cell edges edges, from the lowest to the
+    highest coordinate.
+    """
+    steps = numpy.diff(edges)
+    if len(steps) == 0 or not ((steps > 0).all() or (steps < 0).all()):
+        raise ValueError('Cell edges must be strictly monotonic.')
+    indices = numpy.arange(len(steps))
+    if steps[0] < 0:
+        edges, indices = edges[::-1], indices[::-1]
+        steps = -steps[::-1]
+    if numpy.allclose(steps, steps[0], rtol=1e-6, atol=0):
+        return indices
+    count = min(int(ceil((edges[-1] - edges[0]) / steps.min())), maxRefinement * len(steps))
+    centers = edges[0] + (numpy.arange(count) + 0.5) * (edges[-1] - edges[0]) / count
+    return indices[numpy.clip(numpy.searchsorted(edges, centers, side='right') - 1, 0, len(steps) - 1)]
+
+
+def colorImage(indices, colors, opacity=0xff):
+    """Return the RGBA image of the array indices of color indices into the list of (r, g, b) colors colors, each
+    pixel getting the opacity opacity. Pixels with negative index are transparent.
+    """
+    table = numpy.zeros((len(colors) + 1, 4), dtype=numpy.uint8)
+    table[:-1, :3] = colors
+    table[:-1, 3] = opacity
+    return Image.fromarray(table[indices], 'RGBA')     # index -1 picks the last, transparent entry
+
+
+def pngString(image):
+    """Return the image as PNG file content.
+    """
+    f = StringIO()
+    image.save(f, format='PNG', optimize=True)
+    return f.getvalue()
+
+
+def pyramid(pixels, box, tileSize=256):
+    """Generator of the tiles of a pyramid of the array pixels in image order covering the box (west, south, east,
+    north), see pixelGrid. Level 0 is a single tile of at most tileSize pixels square, every further level doubles the
+    resolution until the last level has the full resolution. Yields tuples (level, row, column, tile, tileBox, leaf),
+    tile being the sub-sampled array of the tile, tileBox its box and leaf whether it is on the last level. Tiles
+    only containing negative values are skipped.
+    """
+    height, width = pixels.shape
+    west, south, east, north = box
+    pixelWidth, pixelHeight = float(east - west) / width, float(north - south) / height
+    levels = max(0, int(ceil(log(max(height, width) / float(tileSize), 2) - 1e-9)))
+    for level in xrange(levels + 1):
+        step = 2 ** (levels - level)
+        span = tileSize * step  # pixels of the full resolution per tile
+        for top in xrange(0, height, span):
+            bottom = min(top + span, height)
+            rows = numpy.minimum(numpy.arange(top, bottom, step) + step // 2, bottom - 1)
+            for left in xrange(0, width, span):
+                right = min(left + span, width)
+                columns = numpy.minimum(numpy.arange(left, right, step) + step // 2, right - 1)
+                tile = pixels[numpy.ix_(rows, columns)]
+                if (tile < 0).all():
+                    continue
+                tileBox = (west + left * pixelWidth, north - bottom * pixelHeight, west + right * pixelWidth,
+                           north - top * pixelHeight)
+                yield level, top // span, left // span, tile, tileBox, level == levels
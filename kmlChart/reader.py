@@ -0,0 +1,422 @@
+"""
+Module to read KML files, e.g. written by KMLdata, back into the objects of kmlInterface, and to merge and restyle
+them without the data the charts have been made of.
+
+The files are parsed incrementally and every placemark is dropped from the parsed tree when it has been read, so
+files of any size are processed in bounded memory as long as the placemarks are not kept.
+"""
+from __future__ import absolute_import
+from xml.etree import ElementTree
+from collections import OrderedDict
+from itertools import chain
+import numpy
+from .kmlInterface import KMLdata, StyleData, ShapeInterface, Placemark, Folder, Polygon, LineString, LinearRing, \
+    MultiGeometry, PolyStyle, LineStyle, BalloonStyle, _splitAtPlaceholder, _styleValues
+from .colorBars import jet
+from .colorMap import ColorMap
+from .chart import chart, _colormap
+
+_FEATURES = ('Placemark', 'Folder', 'Document', 'NetworkLink', 'ScreenOverlay', 'GroundOverlay', 'PhotoOverlay')
+_FEATURE_SETTINGS = ('name', 'visibility', 'open', 'description')
+_STYLES = dict((cls.__name__, cls) for cls in (PolyStyle, LineStyle, BalloonStyle))
+
+
+def iterPlacemarks(source, settings=None, styles=None):
+    """Generator of the placemarks of the KML file source (a filename or file object) as tuples (folder, placemark).
+    folder is the Folder the placemark belongs to, the same instance for all its placemarks but without children,
+    or None for placemarks outside of folders. The placemarks have their geometry (Polygon, LineString, LinearRing or
+    MultiGeometry), their name, visibility, open and description settings and either a style URL or a list of
+    inline styles. Other elements are skipped. If the dictionary settings or the StyleData styles are given, the
+    settings and shared styles of the document are added to them in the same pass, see readHead.
+    """
+    stack = []
+    folders = {}    # id of Folder element -> Folder
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
+            continue
+        stack.pop()
+        tag = _localTag(element.tag)
+        if len(stack) == 2:     # kml/Document/element
+            if styles is not None and tag == 'Style' and element.get('id') is not None:
+                styles.addStyle(element.get('id'), _readStyles(element))
+            elif settings is not None and tag in _FEATURE_SETTINGS:
+                settings[tag] = _setting(tag, element.text)
+        if tag == 'Placemark':
+            parent = stack[-1] if stack else None
+            folder = None
+            if parent is not None and _localTag(parent.tag) == 'Folder':
+                folder = folders.get(id(parent))
+                if folder is None:
+                    folder = folders[id(parent)] = _readFeature(Folder(), parent)
+            yield folder, _readPlacemark(element)
+        if tag in _FEATURES:
+            element.clear()
+            if stack and stack[-1][-1] is element:
+                del stack[-1][-1]   # drop the read feature from the tree
+            folders.pop(id(element), None)
+
+
+def readHead(source):
+    """Return the settings (name, visibility, open and description) and the StyleData with the shared styles of the
+    document in the KML file source. Only the part of the file before the first feature is parsed, which is where
+    KMLdata writes them.
+    """
+    settings, styles = {}, StyleData()
+    depth = 0
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        tag = _localTag(element.tag)
+        if event == 'start':
+            depth += 1
+            if tag in _FEATURES and tag != 'Document':
+                break
+            continue
+        depth -= 1
+        if depth == 2 and tag == 'Style' and element.get('id') is not None:    # kml/Document/Style
+            styles.addStyle(element.get('id'), _readStyles(element))
+        elif depth == 2 and tag in _FEATURE_SETTINGS:
+            settings[tag] = _setting(tag, element.text)
+    return settings, styles
+
+
+def read(source):
+    """Read the KML file source (a filename or file object) into a KMLdata with its shared styles, folders and
+    placemarks, see iterPlacemarks.
+    """
+    settings, styles = {}, StyleData()
+    placemarks = iterPlacemarks(source, settings, styles)
+    first = next(placemarks, None)  # the settings and styles of the document are written before the placemarks
+    kml = _document(styles, settings)
+    added = set()
+    for folder, placemark in chain([first] if first is not None else [], placemarks):
+        if folder is None:
+            kml.add(placemark)
+            continue
+        if id(folder) not in added:
+            added.add(id(folder))
+            kml.add(folder)
+        folder.add(placemark)
+    return kml
+
+
+def merge(sources, filename, name=None):
+    """Write the folders and placemarks of all KML files sources into the KML file filename, one after another.
+    Shared styles with the same id but different content in several files are renamed. The document gets the name
+    name, by default the one of the first file. The sources must be filenames, as the styles of all of them are read
+    before their placemarks.
+    """
+    _checkFilenames(sources)
+    styles, renamed = StyleData(), []
+    settings = None
+    for number, source in enumerate(sources):
+        sourceSettings, sourceStyles = readHead(source)
+        if settings is None:
+            settings = sourceSettings
+        renames = {}
+        for styleID, styleList in sourceStyles.styles.iteritems():
+            if styleID in styles.styles and _styleValues(styles.styles[styleID]) != _styleValues(styleList):
+                renames['#' + styleID] = '#%s_%d' % (styleID, number)
+                styleID = '%s_%d' % (styleID, number)
+            styles.addStyle(styleID, styleList)
+        renamed.append(renames)
+
+    def placemarks():
+        for source, renames in zip(sources, renamed):
+            for folder, placemark in iterPlacemarks(source):
+                if isinstance(placemark.style, basestring) and placemark.style in renames:
+                    placemark.style = renames[placemark.style]
+                yield folder, placemark
+
+    kml = _document(styles, settings or {}, name)
+    kml.add(_PlacemarkStream(placemarks))
+    with open(filename, 'w') as f:
+        kml.write(f)
+
+
+def altitude(placemark, styles):
+    """Return the highest altitude of the geometry of placemark, i.e. the value of a bar of Bar3D.
+    """
+    altitudes = list(_altitudes(placemark))
+    return max(altitudes) if altitudes else None
+
+
+def colorValue(colormap):
+    """Return a function mapping a placemark with the list of styles styles to the value in the middle of the color
+    of its PolyStyle in the ColorMap colormap, e.g. to restyle a Surface saved with this color map.
+    """
+    colors = dict((color[2:], i) for i, color in enumerate(colormap.kmlColors()))
+    low, high = colormap.caxis
+    if colormap.breakpoints is not None:
+        centers = (colormap.breakpoints[:-1] + colormap.breakpoints[1:]) / 2
+    elif colormap.scale == 'log':
+        centers = 10 ** numpy.linspace(numpy.log10(low), numpy.log10(high), 2 * len(colormap.colors) + 1)[1::2]
+    else:
+        centers = numpy.linspace(low, high, 2 * len(colormap.colors) + 1)[1::2]
+
+    def value(placemark, styles):
+        for style in styles or ():
+            if isinstance(style, PolyStyle) and style.color is not None and style.color[2:] in colors:
+                return centers[colors[style.color[2:]]]
+        return None
+    return value
+
+
+def restyle(source, filename, colorbar=jet, caxis=None, value=altitude, name=None):
+    """Write the KML file source with new colors into the KML file filename. The color of every placemark is taken
+    from the color bar or ColorMap colorbar by its value, which is returned by the function value(placemark, styles)
+    given the placemark and its list of styles. The default value is the altitude of bars of Bar3D, see colorValue to
+    recolor surfaces. The color axis caxis defaults to the range of the values. Placemarks without value keep their
+    style. The opacity and all other style settings are kept, the new styles are shared. source must be a filename,
+    as it is read twice, for the range of the values and for writing.
+    """
+    _checkFilenames([source])
+    settings, styles = {}, StyleData()
+    scale = colorbar.scale if isinstance(colorbar, ColorMap) else 'linear'
+
+    def resolveStyles(placemark):
+        if isinstance(placemark.style, basestring):
+            return styles.styles.get(placemark.style.lstrip('#'))
+        return placemark.style
+
+    # First pass: range of the values and combinations of styles to be recolored
+    templates = OrderedDict()
+    low, high = numpy.inf, -numpy.inf
+    for folder, placemark in iterPlacemarks(source, settings, styles):
+        placemarkStyles = resolveStyles(placemark)
+        placemarkValue = value(placemark, placemarkStyles)
+        if placemarkValue is None or not numpy.isfinite(placemarkValue):
+            continue
+        if scale != 'log' or placemarkValue > 0:
+            low, high = min(low, placemarkValue), max(high, placemarkValue)
+        template = _template(placemarkStyles)
+        templates.setdefault(_styleValues(template), template)
+    if caxis is None and not (isinstance(colorbar, ColorMap) and colorbar.caxis is not None):
+        if low > high:
+            raise ValueError('Color axis cannot be determined, please specify one.')
+        caxis = (low, high)
+    colormap = _colormap(colorbar, caxis, ())
+
+    result = chart(settings.get('name') if name is None else name, settings.get('description'))
+    for styleID, styleList in styles.styles.iteritems():
+        result.kml.styles.addStyle(styleID, styleList)  # for placemarks keeping their style
+    urls = {}
+    for key, template in templates.iteritems():
+        for index, color in enumerate(colormap.kmlColors()):
+            urls[key, index] = result._style(_recolor(template, color[2:]), True)
+
+    def placemarks():
+        for folder, placemark in iterPlacemarks(source):
+            placemarkStyles = resolveStyles(placemark)
+            placemarkValue = value(placemark, placemarkStyles)
+            if placemarkValue is not None and numpy.isfinite(placemarkValue):
+                index = colormap.indices([placemarkValue])[0]
+                placemark.style = urls[_styleValues(_template(placemarkStyles)), index]
+            yield folder, placemark
+
+    result.kml.add(_PlacemarkStream(placemarks))
+    result.save(filename, streaming=True)
+
+
+class _PlacemarkStream(ShapeInterface):
+    """Top-level shape writing the (folder, placemark) tuples returned by the callable factory, see iterPlacemarks.
+    """
+    __slots__ = ('factory',)
+
+    def __init__(self, factory):
+        ShapeInterface.__init__(self)
+        self.factory = factory
+
+    def render(self, xmlParent, precision=None):
+        current = None
+        for folder, placemark in self.factory():
+            if folder is None:
+                placemark.render(xmlParent, precision)
+                continue
+            if folder is not current:
+                current = folder
+                xmlFolder = folder.renderElement(precision)
+                xmlParent.append(xmlFolder)
+            placemark.render(xmlFolder, precision)
+
+    def stream(self, write, precision=None):
+        current, tail = None, None
+        for folder, placemark in self.factory():
+            if folder is not current:
+                if tail is not None:
+                    write(tail)
+                    tail = None
+                current = folder
+                if folder is not None:
+                    head, tail = _splitAtPlaceholder(folder.renderElement(precision))
+                    write(head)
+            write(placemark.toString(precision))
+        if tail is not None:
+            write(tail)
+
+    def streamCached(self, write, precision=None):
+        self.stream(write, precision)
+
+
+def _document(styles, settings, name=None):
+    """Return a KMLdata with the shared styles styles and the document settings, the name replaced by name if given.
+    """
+    kml = KMLdata(styles, settings.get('name') if name is None else name, settings.get('description'),
+                  settings.get('visibility', 1))
+    kml.settings['open'] = settings.get('open', 0)
+    return kml
+
+
+def _checkFilenames(sources):
+    for source in sources:
+        if not isinstance(source, basestring):
+            raise TypeError('Source %r is no filename.' % (source,))
+
+
+def _localTag(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _value(text):
+    """Return the text of an element as int or float if possible.
+    """
+    if text is None:
+        return None
+    for cls in (int, float):
+        try:
+            return cls(text)
+        except ValueError:
+            pass
+    return text
+
+
+def _setting(tag, text):
+    """Return the text of the feature setting tag, as int or float for visibility and open. Names and descriptions
+    are kept as written, e.g. '007'.
+    """
+    return _value(text) if tag in ('visibility', 'open') else text
+
+
+def _children(element):
+    return dict((_localTag(child.tag), child) for child in element)
+
+
+def _readFeature(feature, element):
+    """Set the name, visibility, open and description of feature from the XML element and return feature.
+    """
+    for child in element:
+        tag = _localTag(child.tag)
+        if tag in _FEATURE_SETTINGS:
+            feature.settings[tag] = _setting(tag, child.text)
+    return feature
+
+
+def _readPlacemark(element):
+    placemark = _readFeature(Placemark(), element)
+    for child in element:
+        tag = _localTag(child.tag)
+        if tag == 'styleUrl':
+            placemark.style = child.text
+        elif tag == 'Style':
+            placemark.style = _readStyles(child)
+        else:
+            geometry = _readGeometry(child)
+            if geometry is not None:
+                placemark.add(geometry)
+    return placemark
+
+
+def _readStyles(element):
+    """Return the list of styles of a Style element.
+    """
+    styles = []
+    for child in element:
+        cls = _STYLES.get(_localTag(child.tag))
+        if cls is not None:
+            fields = {}
+            for field in child:
+                tag = _localTag(field.tag)
+                if tag not in cls._keys:
+                    continue
+                fields[tag] = field.text if tag.lower().endswith('color') or tag == 'text' else _value(field.text)
+            styles.append(cls.shared(**fields))
+    return styles
+
+
+def _readCoordinates(element):
+    """Return the coordinates of a LineString or LinearRing element as array of shape (N, 2) or (N, 3).
+    """
+    text = (_children(element)['coordinates'].text or '').strip()
+    dimensions = text.split(None, 1)[0].count(',') + 1 if text else 2
+    return numpy.array(text.replace(',', ' ').split(), dtype=float).reshape((-1, dimensions))
+
+
+def _readGeometry(element):
+    tag = _localTag(element.tag)
+    children = _children(element)
+    if tag in ('LineString', 'LinearRing'):
+        tessellate = _value(children['tessellate'].text) if 'tessellate' in children else 0
+        return (LineString if tag == 'LineString' else LinearRing)(_readCoordinates(element), tessellate=tessellate,
+                                                                   validate=False)
+    if tag == 'Polygon':
+        outer = _children(children['outerBoundaryIs'])['LinearRing']
+        polygon = Polygon(_readCoordinates(outer),
+                          altitudeMode=children['altitudeMode'].text if 'altitudeMode' in children else None,
+                          extrude=_value(children['extrude'].text) if 'extrude' in children else False,
+                          validate=False)
+        for child in element:
+            if _localTag(child.tag) == 'innerBoundaryIs':
+                polygon.addInnerBoundary(_readCoordinates(_children(child)['LinearRing']), validate=False)
+        return polygon
+    if tag == 'MultiGeometry':
+        multiGeometry = MultiGeometry()
+        for child in element:
+            geometry = _readGeometry(child)
+            if geometry is not None:
+                multiGeometry.add(geometry)
+        return multiGeometry
+    return None
+
+
+def _altitudes(shape):
+    """Generator of the altitudes of all coordinates of a shape.
+    """
+    if isinstance(shape, LineString):
+        for point in shape.coordinates:
+            if len(point) > 2:
+                yield point[2]
+    elif isinstance(shape, Polygon):
+        for altitude in _altitudes(shape.outerBoundaryIs):
+            yield altitude
+    else:
+        for child in shape.shapes:
+            for altitude in _altitudes(child):
+                yield altitude
+
+
+def _template(styles):
+    """Return the list of styles with the color of the PolyStyle reduced to its opacity, see _recolor.
+    """
+    styles = list(styles or ())
+    for i, style in enumerate(styles):
+        if isinstance(style, PolyStyle):
+            fields = _fields(style)
+            fields['color'] = (style.color or 'ff')[:2] + '000000'
+            styles[i] = PolyStyle.shared(**fields)
+            return styles
+    return styles + [PolyStyle.shared(color='ff000000')]
+
+
+def _recolor(template, color):
+    """Return the list of styles template with the color bbggrr of its PolyStyle.
+    """
+    styles = list(template)
+    for i, style in enumerate(styles):
+        if isinstance(style, PolyStyle):
+            fields = _fields(style)
+            fields['color'] = style.color[:2] + color
+            styles[i] = PolyStyle.shared(**fields)
+    return styles
+
+
+def _fields(style):
+    return dict((field, style[field]) for field in style._keys if style[field] is not None)
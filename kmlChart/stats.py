@@ -0,0 +1,70 @@
+"""
+Module to record statistics about the phases of chart building and rendering.
+"""
+from collections import OrderedDict
+import time
+
+
+class Stats(object):
+    """Records the time, element count and bytes of every phase (e.g. geometry, colors, construction, render,
+    serialize) per series. Pass an instance as stats to a chart or KMLdata. If callback is given, it is called as
+    callback(phase, series, seconds, count, bytes) for every record, e.g. to feed a metrics system.
+    """
+    def __init__(self, callback=None):
+        self.records = OrderedDict()     # (phase, series) -> [seconds, count, bytes]
+        self.callback = callback
+
+    def record(self, phase, series=None, seconds=0.0, count=0, bytes=0):
+        """Add seconds, count and bytes to the totals of phase and series.
+        """
+        totals = self.records.get((phase, series))
+        if totals is None:
+            totals = self.records[(phase, series)] = [0.0, 0, 0]
+        totals[0] += seconds
+        totals[1] += count
+        totals[2] += bytes
+        if self.callback is not None:
+            self.callback(phase, series, seconds, count, bytes)
+
+    def phases(self):
+        """Return the totals [seconds, count, bytes] per phase summed over all series.
+        """
+        phases = OrderedDict()
+        for (phase, series), totals in self.records.iteritems():
+            phaseTotals = phases.setdefault(phase, [0.0, 0, 0])
+            for i in xrange(3):
+                phaseTotals[i] += totals[i]
+        return phases
+
+    def asList(self):
+        """Return all records as list of dictionaries.
+        """
+        return [{'phase': phase, 'series': series, 'seconds': seconds, 'count': count, 'bytes': bytes}
+                for (phase, series), (seconds, count, bytes) in self.records.iteritems()]
+
+    def report(self):
+        """Return a text table of all records.
+        """
+        lines = ['%-14s %-24s %10s %10s %12s' % ('phase', 'series', 'seconds', 'count', 'bytes')]
+        for (phase, series), (seconds, count, bytes) in self.records.iteritems():
+            lines.append('%-14s %-24s %10.3f %10d %12d' % (phase, series if series is not None else '-', seconds,
+                                                           count, bytes))
+        return '\n'.join(lines)
+
+
+def lapTimer(stats, series=None):
+    """Return a function lap(phase, count=0, bytes=0, series=series) recording the time since the previous lap (or
+    the creation of the timer) as phase in stats. If stats is None, the function does nothing.
+    """
+    if stats is None:
+        return _noLap
+    last = [time.time()]
+    def lap(phase, count=0, bytes=0, series=series):
+        now = time.time()
+        stats.record(phase, series, now - last[0], count, bytes)
+        last[0] = now
+    return lap
+
+
+def _noLap(phase, count=0, bytes=0, series=None):
+    pass
@@ -0,0 +1,92 @@
+"""
+Module to split large KML documents into a quadtree of tiles, which are loaded by Google Earth only when needed.
+"""
+from __future__ import absolute_import
+import os.path
+import numpy
+from .kmlInterface import KMLdata, Folder, LazyFolder, Fragment, NetworkLink, region
+
+
+def saveTiled(kml, filename, maxPlacemarks=1000, minLodPixels=128, maxLevel=16):
+    """Save the document kml as quadtree. The placemarks of all folders are split by their center into tiles of at
+    most maxPlacemarks placemarks, down to a depth of maxLevel levels. Every tile is written into a KML file of its
+    own with a Region of at least minLodPixels pixels. filename is the root document with the NetworkLinks to the
+    tiles, which are placed in a directory next to it. Top-level shapes without coordinates stay in the root document.
+    The children of LazyFolders are created once and all kept in memory while the tiles are written. Series loaded
+    from a cache are split by the byte ranges of their placemarks.
+    """
+    directory = os.path.splitext(filename)[0] + '_tiles'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # Collect the placemarks of all folders with their folder index and bounds
+    folders, placemarks, bounds, root = [], [], [], KMLdata(kml.styles, precision=kml.precision)
+    root.settings = dict(kml.settings)
+    for index, shape in enumerate(kml.shapes):
+        if isinstance(shape, LazyFolder):
+            children = shape.factory()
+        elif isinstance(shape, Folder):
+            children = shape.shapes
+        elif isinstance(shape, Fragment) and shape.children is not None:
+            children = shape.children
+        else:
+            children = [shape]
+        for child in children:
+            childBounds = child.getBounds()
+            if childBounds is None:
+                if child is shape:
+                    root.add(shape)
+                continue
+            folders.append(index)
+            placemarks.append(child)
+            bounds.append(childBounds)
+    if len(placemarks) == 0:
+        with open(filename, 'w') as f:
+            root.write(f)
+        return
+    bounds = numpy.array(bounds, dtype=float)
+    centers = numpy.column_stack(((bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2))
+    folders = numpy.array(folders)
+    box = (centers[:, 0].min(), centers[:, 1].min(), centers[:, 0].max(), centers[:, 1].max())
+
+    def writeTile(quadkey, box, indices, level):
+        tileBounds = bounds[indices]
+        tileRegion = region(min(box[0], tileBounds[:, 0].min()), min(box[1], tileBounds[:, 1].min()),
+                            max(box[2], tileBounds[:, 2].max()), max(box[3], tileBounds[:, 3].max()),
+                            minLodPixels=minLodPixels)
+        tile = KMLdata(kml.styles, name=quadkey, precision=kml.precision)
+        tile.settings['Region'] = tileRegion
+        if len(indices) <= maxPlacemarks or level >= maxLevel:
+            for folderIndex in numpy.unique(folders[indices]):
+                source = kml.shapes[folderIndex]
+                if isinstance(source, Folder):
+                    folder = Folder()
+                    folder.settings = dict(source.settings)
+                    for i in indices[folders[indices] == folderIndex]:
+                        folder.add(placemarks[i])
+                    tile.add(folder)
+                elif isinstance(source, Fragment) and source.children is not None:
+                    tile.add(source.subset([placemarks[i] for i in indices[folders[indices] == folderIndex]]))
+                else:
+                    tile.add(source)
+        else:
+            west, south, east, north = box
+            lon, lat = (west + east) / 2, (south + north) / 2
+            quadrants = 2 * (centers[indices, 1] <= lat) + (centers[indices, 0] > lon)     # 0 1 / 2 3
+            childBoxes = ((west, lat, lon, north), (lon, lat, east, north), (west, south, lon, lat),
+                          (lon, south, east, lat))
+            for quadrant, childBox in enumerate(childBoxes):
+                childIndices = indices[quadrants == quadrant]
+                if len(childIndices) == 0:
+                    continue
+                childKey = quadkey + str(quadrant)
+                childRegion = writeTile(childKey, childBox, childIndices, level + 1)
+                tile.add(NetworkLink(childKey + '.kml', name=childKey, region=childRegion))
+        with open(os.path.join(directory, quadkey + '.kml'), 'w') as f:
+            tile.write(f)
+        return tileRegion
+
+    writeTile('t', box, numpy.arange(len(placemarks)), 0)
+    root.add(NetworkLink(os.path.basename(directory) + '/t.kml', name='Tiles'))
+    with open(filename, 'w') as f:
+        root.write(f)
@@ -40,7 +40,8 @@ setup(
 
     # Dependent packages (distributions)
     install_requires = [
-        'Pillow'
+        'Pillow',
+        'numpy',
     ],
 
     # Entry points
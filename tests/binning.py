@@ -0,0 +1,54 @@
+"""
+Unit test cases to cover the module binning.
+"""
+from __future__ import print_function
+import unittest
+import numpy
+from kmlChart.binning import *
+
+
+class BinningTest(unittest.TestCase):
+    def test_gridBins(self):
+        column, row, x, y = gridBins(numpy.array([0.5, 1.5, -0.5]), numpy.array([0.5, 0.5, 2.5]), 1.0)
+        self.assertEqual(column.tolist(), [0, 1, -1])
+        self.assertEqual(row.tolist(), [0, 0, 2])
+        self.assertEqual(x.tolist(), [0.5, 1.5, -0.5])
+        self.assertEqual(y.tolist(), [0.5, 0.5, 2.5])
+
+    def test_hexBins(self):
+        x, y = numpy.random.RandomState(0).uniform(-5, 5, (2, 10000))
+        column, row, centerX, centerY = hexBins(x, y, 1.0)
+        distances = numpy.hypot(x - centerX, y - centerY)
+        # Every point lies within the hexagon around its center, i.e. not farther than its corners
+        self.assertLessEqual(distances.max(), 1 / numpy.sqrt(3) + 1e-9)
+        self.assertTrue(numpy.allclose(centerY, row * numpy.sqrt(3) / 2))
+        # No center of a neighbouring hexagon is nearer
+        for dx, dy in ((1, 0), (-1, 0), (0.5, numpy.sqrt(3) / 2), (-0.5, numpy.sqrt(3) / 2),
+                       (0.5, -numpy.sqrt(3) / 2), (-0.5, -numpy.sqrt(3) / 2)):
+            self.assertTrue((distances <= numpy.hypot(x - centerX - dx, y - centerY - dy) + 1e-9).all())
+
+    def test_aggregate(self):
+        groups = numpy.array([1, 0, 1, 1, 0, 2])
+        values = numpy.array([3.0, 1.0, 1.0, 2.0, 5.0, 7.0])
+        self.assertEqual(aggregate(groups, values, 'count').tolist(), [2, 3, 1])
+        self.assertEqual(aggregate(groups, values, 'sum').tolist(), [6, 6, 7])
+        self.assertEqual(aggregate(groups, values, 'mean').tolist(), [3, 2, 7])
+        self.assertEqual(aggregate(groups, values, 'median').tolist(), [3, 2, 7])
+        self.assertEqual(aggregate(groups, values, 'min').tolist(), [1, 1, 7])
+        self.assertEqual(aggregate(groups, values, 'max').tolist(), [5, 3, 7])
+        self.assertEqual(aggregate(groups, values, 75).tolist(), [4, 2.5, 7])
+        self.assertRaises(ValueError, aggregate, groups, values, 'mode')
+        self.assertRaises(ValueError, aggregate, groups, values, 101)
+
+    def test_binPoints(self):
+        lon = [10.001, 10.002, 10.031, None, 10.032]
+        lat = [51.001, 51.002, 51.001, 51.0, float('nan')]
+        lon, lat, values, counts = binPoints(lon, lat, [1, 2, 3, 4, 5], 0.01, 'grid', 'max')
+        self.assertEqual(values.tolist(), [2, 3])
+        self.assertEqual(counts.tolist(), [2, 1])
+        self.assertTrue(numpy.allclose(lat, [51.005, 51.005]))
+        self.assertTrue(((lon > 10) & (lon < 10.04)).all())
+        self.assertEqual(binPoints([10, 10], [51, 51], None, 0.01, reducer='count')[2].tolist(), [2])
+        self.assertRaises(ValueError, binPoints, [10], [51], None, 0.01)
+        self.assertRaises(ValueError, binPoints, [10], [51], [1], 0.01, 'triangle')
+        self.assertEqual(len(binPoints([], [], [], 0.01)[0]), 0)
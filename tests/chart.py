@@ -4,7 +4,16 @@ Test module for chart module.
 from __future__ import print_function
 import unittest
 from kmlChart.chart import *
-from kmlChart.colorBars import jet2
+from kmlChart.colorBars import jet, jet2
+from kmlChart.colorMap import ColorMap
+from kmlChart.legend import legendPNG
+from kmlChart.stats import Stats
+from math import cos
+import numpy
+import os
+import shutil
+import warnings
+import zipfile
 
 
 class chartTests(unittest.TestCase):
@@ -31,3 +40,376 @@ class chartTests(unittest.TestCase):
             display_name='Transparent surface plot',
         )
         chart.save('chart2.kml')
+
+    def test_streamingSave(self):
+        chart = Bar3D('TestStreamingChart')
+        num = 20
+        chart.add([10]*num, [51 + i*0.01 for i in xrange(num)], [500 + i*100 for i in xrange(num)], radius=0.005*0.8)
+        chart.save('chart_streaming.kml', streaming=True)
+        with open('chart_streaming.kml') as f:
+            self.assertEqual(f.read(), chart.kml.getAsString())
+        chart.save('chart_parallel.kml', processes=2)
+        with open('chart_parallel.kml') as f:
+            self.assertEqual(f.read(), chart.kml.getAsString())
+
+    def test_sharedStyles(self):
+        chart = Bar3D('TestSharedStyles')
+        num = 200
+        chart.add([10]*num, [51 + i*0.01 for i in xrange(num)], [500 + i*100 for i in xrange(num)], radius=0.005*0.8,
+                  shared_styles=True)
+        kml = chart.kml.getAsString()
+        self.assertEqual(kml.count('<styleUrl>'), num)
+        self.assertEqual(kml.count('<Style id='), len(jet))
+
+        chart = Surface('TestSharedSurfaceStyles')
+        c = ((-0.005, -0.005), (+0.005, -0.005), (+0.005, +0.005), (-0.005, +0.005), (-0.005, -0.005), )
+        polygons = tuple(tuple((i[0] + 10.04, i[1] + (51 + lat*0.01)) for i in c) for lat in xrange(num))
+        chart.add(polygons, tuple(i for i in xrange(num)), shared_styles=True)
+        chart.add(polygons, tuple(i for i in xrange(num)), border_color=(0x00, 0x00, 0xff), shared_styles=True)
+        kml = chart.kml.getAsString()
+        self.assertEqual(kml.count('<styleUrl>'), 2*num)
+        self.assertEqual(kml.count('<Style id='), 2*len(jet))
+        chart.save('chart_shared.kml')
+
+    def test_numpyBars(self):
+        lat = numpy.linspace(51, 52, 100)
+        z = numpy.arange(100, dtype=float)
+        z[10] = numpy.nan
+        chart = Bar3D('TestNumpyBars')
+        chart.add(numpy.full(100, 10.0), lat, z, radius=0.004)
+        chart.add([10.02]*100, list(lat), [None if i == 10 else i for i in xrange(100)], radius=0.004)
+        folders = chart.kml.shapes
+        self.assertEqual(len(folders[0].shapes), 99)
+        self.assertEqual(len(folders[1].shapes), 99)
+        outline = folders[0].shapes[0].shapes[0].outerBoundaryIs.coordinates
+        reference = circle(center=(10.0, 51.0), radius=(0.004 / cos(numpy.radians(51.0)), 0.004))
+        self.assertEqual(len(outline), len(reference))
+        for point, ref in zip(outline, reference):
+            self.assertAlmostEqual(point[0], ref[0])
+            self.assertAlmostEqual(point[1], ref[1])
+            self.assertEqual(point[2], 0)
+
+    def test_numpySurface(self):
+        num = 50
+        c = numpy.array(((-0.005, -0.005), (+0.005, -0.005), (+0.005, +0.005), (-0.005, +0.005), (-0.005, -0.005)))
+        corners = c[None, :, :] + numpy.column_stack((numpy.full(num, 10.04), 51 + numpy.arange(num) * 0.01))[:, None, :]
+        values = numpy.ma.masked_array(numpy.arange(num, dtype=float))
+        values[3] = numpy.ma.masked
+        values[4] = numpy.nan
+        corners[5, 2, 0] = numpy.nan
+        chart = Surface('TestNumpySurface')
+        chart.add(corners, values, border_color=(0xff, 0xff, 0xff))
+        chart.add(tuple(tuple(tuple(point) for point in polygon) for polygon in corners[:3]), [0, 1, 2])
+        placemarks = chart.kml.shapes[0].shapes
+        self.assertEqual(len(placemarks), num - 3)
+        self.assertEqual(placemarks[0].shapes[0].outerBoundaryIs.coordinates, [tuple(point) for point in corners[0]])
+        self.assertEqual(placemarks[0].style[0].color, 'ff800000')
+        self.assertEqual(placemarks[-1].style[0].color, 'ff000080')
+        self.assertRaises(ValueError, chart.add, corners[:, :, 0], values)
+        chart.save('chart_numpy_surface.kml')
+
+    def test_colorMap(self):
+        chart = Bar3D('TestColorMap')
+        chart.add([10, 10.01, 10.02], [51, 51, 51], [1, 100, 1e6], colorbar=ColorMap(jet2, scale='log'))
+        chart.add([10, 10.01, 10.02], [51, 51, 51], [1, 100, 1e6], caxis=(0, 1e3))
+        self.assertEqual([p.style[0].color for p in chart.kml.shapes[0].shapes], ['ff800000', 'ffd4ff00', 'ff000080'])
+        self.assertEqual([p.style[0].color for p in chart.kml.shapes[1].shapes], ['ff800000', 'ffe00000', 'ff000080'])
+
+    def test_tiledSave(self):
+        if os.path.isdir('chart_tiled_cache'):
+            shutil.rmtree('chart_tiled_cache')
+        num = 1000
+        lon, lat = numpy.meshgrid(10 + numpy.arange(40) * 0.01, 51 + numpy.arange(25) * 0.01)
+        outputs = []
+        for run in xrange(2):   # the second run tiles the series loaded from the cache
+            chart = Bar3D('TestTiledChart', cache_dir='chart_tiled_cache')
+            chart.add(lon.ravel(), lat.ravel(), numpy.arange(num, dtype=float), radius=0.004, shared_styles=True)
+            self.assertIsInstance(chart.kml.shapes[0], Fragment if run else Folder)
+            if os.path.isdir('chart_tiled_tiles'):
+                shutil.rmtree('chart_tiled_tiles')
+            chart.save('chart_tiled.kml', tile_size=100)
+            placemarks = 0
+            tiles = {}
+            for name in os.listdir('chart_tiled_tiles'):
+                with open(os.path.join('chart_tiled_tiles', name)) as f:
+                    kml = tiles[name] = f.read()
+                self.assertEqual(kml.count('<Style id='), len(jet))
+                if '<NetworkLink>' in kml:
+                    self.assertIn('<viewRefreshMode>onRegion</viewRefreshMode>', kml)
+                else:
+                    self.assertLessEqual(kml.count('<Placemark>'), 100)
+                    self.assertIn('<Region>', kml)   # of the tile itself
+                placemarks += kml.count('<Placemark>')
+            self.assertEqual(placemarks, num)
+            with open('chart_tiled.kml') as f:
+                self.assertIn('<href>chart_tiled_tiles/t.kml</href>', f.read())
+            outputs.append(tiles)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_cacheDir(self):
+        if os.path.isdir('chart_cache'):
+            shutil.rmtree('chart_cache')
+        lat = numpy.linspace(51, 52, 100)
+        outputs = []
+        for run in xrange(2):
+            chart = Bar3D('TestCachedChart', cache_dir='chart_cache')
+            chart.add(numpy.full(100, 10.0), lat, numpy.arange(100.0), radius=0.004, shared_styles=True)
+            chart.add(numpy.full(100, 10.02), lat, numpy.arange(100.0), radius=0.004, display_name='Inline')
+            chart.add_legend(href='chart_cached_legend.png')
+            self.assertEqual(chart.colormap.caxis, (0, 99))
+            chart.save('chart_cached.kml')
+            with open('chart_cached.kml') as f:
+                outputs.append(f.read())
+            with open('chart_cached_legend.png', 'rb') as f:
+                outputs.append(f.read())
+        self.assertEqual(len(os.listdir('chart_cache')), 4)
+        self.assertTrue(all(isinstance(shape, Fragment) for shape in chart.kml.shapes[:2]))
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertEqual(outputs[1], outputs[3])
+        chart = Bar3D('TestCachedChart', cache_dir='chart_cache')
+        chart.add(numpy.full(100, 10.0), lat, numpy.arange(100.0) + 1, radius=0.004, shared_styles=True)
+        self.assertIsInstance(chart.kml.shapes[0], Folder)
+        # Series are stored without saving the chart
+        self.assertEqual(len(os.listdir('chart_cache')), 6)
+        chart = Bar3D('TestCachedChart', cache_dir='chart_cache')
+        chart.add(numpy.full(100, 10.0), lat, numpy.arange(100.0) + 1, radius=0.004, shared_styles=True)
+        self.assertIsInstance(chart.kml.shapes[0], Fragment)
+
+    def test_gridSurface(self):
+        lon_edges = 10 + numpy.arange(101) * 0.01
+        lat_edges = 51 + numpy.arange(81) * 0.01
+        lon, lat = numpy.meshgrid(lon_edges[:-1], lat_edges[:-1])
+        values = numpy.ma.masked_array(numpy.hypot(lon - 10.5, lat - 51.4))
+        values[0, 0] = numpy.ma.masked
+        chart = Surface('TestGridSurface')
+        chart.add_grid(lon_edges, lat_edges, values, display_name='Cells')
+        chart.add_grid(lon_edges, lat_edges, values, colorbar=ColorMap(jet, breakpoints=(0, 0.1, 0.2, 0.3, 0.4, 1)),
+                       display_name='Merged', merge=True, shared_styles=True)
+        cells, merged = chart.kml.shapes
+        self.assertEqual(len(cells.shapes), values.size - 1)
+        self.assertEqual(len(merged.shapes), 6)     # the ring of the fourth bin is cut by the edges of the grid
+        self.assertEqual(len(set(placemark.style for placemark in merged.shapes)), 5)
+        self.assertEqual(sum(len(placemark.shapes[0].innerBoundaryIs) for placemark in merged.shapes), 3)
+        self.assertRaises(ValueError, chart.add_grid, lon_edges, lat_edges, values.T)
+        chart.save('chart_grid.kml')
+
+    def test_batchedBars(self):
+        num = 1000
+        lon, lat = numpy.meshgrid(10 + numpy.arange(40) * 0.01, 51 + numpy.arange(25) * 0.01)
+        labels = [None] * num
+        labels[5] = 'Labelled bar'
+        chart = Bar3D('TestBatchedBars')
+        chart.add(lon.ravel(), lat.ravel(), numpy.arange(num, dtype=float), radius=0.004, batch=True,
+                  shared_styles=True)
+        chart.add(lon.ravel(), lat.ravel(), numpy.arange(num, dtype=float), radius=0.004, batch=True, label=labels)
+        batched, labelled = chart.kml.shapes
+        self.assertEqual(len(batched.shapes), len(jet))
+        self.assertEqual(sum(len(placemark.shapes[0].shapes) for placemark in batched.shapes), num)
+        self.assertEqual(len(labelled.shapes), len(jet) + 1)
+        self.assertEqual([placemark.settings['name'] for placemark in labelled.shapes].count('Labelled bar'), 1)
+        kml = chart.kml.getAsString()
+        self.assertEqual(kml.count('<Placemark>'), 2 * len(jet) + 1)
+        self.assertEqual(kml.count('<Polygon>'), 2 * num)
+        chart.save('chart_batched.kml')
+
+    def test_adaptiveCorners(self):
+        self.assertEqual(cornerCount(2, 1), 6)
+        self.assertEqual(cornerCount(10, 1), 10)
+        self.assertEqual(cornerCount(1000, 1), 32)
+        self.assertEqual(cornerCount(1, 5), 6)
+        chart = Bar3D('TestAdaptiveCorners')
+        lat = numpy.linspace(51, 52, 10)
+        chart.add(numpy.full(10, 10.0), lat, numpy.arange(10.0), radius=0.001, view_resolution=50)
+        chart.add(numpy.full(10, 10.0), lat, numpy.arange(10.0), radius=0.001, corners=12)
+        chart.add(numpy.full(10, 10.0), lat, numpy.arange(10.0), radius=0.001, view_resolution=0.01)
+        lengths = [len(folder.shapes[0].shapes[0].outerBoundaryIs.coordinates) for folder in chart.kml.shapes]
+        self.assertEqual(lengths, [7, 13, 33])
+
+    def test_streamedBars(self):
+        num = 250
+        lon, lat = numpy.meshgrid(10 + numpy.arange(25) * 0.01, 51 + numpy.arange(10) * 0.01)
+        z = numpy.arange(num, dtype=float)
+        z[7] = numpy.nan
+        labels = ['Bar %d' % i for i in xrange(num)]
+        records = zip(lon.ravel(), lat.ravel(), z, labels)
+        reference = Bar3D('TestStreamedBars')
+        reference.add(lon.ravel(), lat.ravel(), z, label=labels)
+        chart = Bar3D('TestStreamedBars')
+        chart.add_stream(records, chunk_size=16)    # color axis and radius from a first pass
+        self.assertEqual(chart.kml.getAsString(), reference.kml.getAsString())
+        chart.save('chart_stream.kml', streaming=True)
+        with open('chart_stream.kml') as f:
+            self.assertEqual(f.read(), reference.kml.getAsString())
+        chart.save('chart_stream.kml', processes=2)
+        with open('chart_stream.kml') as f:
+            self.assertEqual(f.read(), reference.kml.getAsString())
+
+        chart.save('chart_stream_tiled.kml', tile_size=100)
+        placemarks = 0
+        for name in os.listdir('chart_stream_tiled_tiles'):
+            with open(os.path.join('chart_stream_tiled_tiles', name)) as f:
+                placemarks += f.read().count('<Placemark>')
+        self.assertEqual(placemarks, num - 1)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            chart.add_stream(records[:10] + [(numpy.nan, 51, 1)] + records[10:])
+        chart = Bar3D('TestStreamedBars')
+        self.assertRaises(ValueError, chart.add_stream, iter(records))
+        chart.add_stream(iter(records), caxis=(0, 300), radius=0.004, shared_styles=True)
+        chart.save('chart_stream.kml', streaming=True)
+        with open('chart_stream.kml') as f:
+            self.assertEqual(f.read().count('<Placemark>'), num - 1)
+
+    def test_timeSeries(self):
+        lon, lat = numpy.meshgrid(10 + numpy.arange(10) * 0.01, 51 + numpy.arange(10) * 0.01)
+        chart = TimeSeries('TestTimeSeries')
+        for hour in xrange(4):
+            chart.add_frame('2016-05-01T%02d:00:00Z' % hour, '2016-05-01T%02d:00:00Z' % (hour + 1),
+                            lon.ravel(), lat.ravel(), numpy.arange(100.0) * (hour + 1), radius=0.004)
+        chart.save('chart_time.kml', processes=2)
+        with open('chart_time.kml') as f:
+            kml = f.read()
+        self.assertEqual(kml.count('<NetworkLink>'), 4)
+        self.assertEqual(kml.count('<TimeSpan>'), 4)
+        self.assertIn('<href>chart_time_frames/frame00003.kml</href>', kml)
+        with open('chart_time_frames/frame00000.kml') as f:
+            first = f.read()
+        with open('chart_time_frames/frame00003.kml') as f:
+            last = f.read()
+        self.assertIn('<begin>2016-05-01T00:00:00Z</begin>', first)
+        self.assertEqual(first.count('<Placemark>'), 100)
+        # shared color axis from 0 to 396: the first frame stays in the lower part of the color bar
+        self.assertNotIn('<color>ff000080</color>', first)
+        self.assertIn('<color>ff000080</color>', last)
+
+        chart = TimeSeries('TestSurfaceTimeSeries', chart_class=Surface, caxis=(0, 10))
+        c = numpy.array(((-0.005, -0.005), (+0.005, -0.005), (+0.005, +0.005), (-0.005, +0.005), (-0.005, -0.005)))
+        chart.add_frame(None, '2016-05-01', c[None, :, :] + (10, 51), [5])
+        chart.save('chart_time.kml')
+        with open('chart_time_frames/frame00000.kml') as f:
+            self.assertEqual(f.read().count('<Polygon>'), 1)
+
+    def test_kmzSave(self):
+        chart = Bar3D('TestKMZ')
+        num = 200
+        chart.add([10]*num, [51 + i*0.01 for i in xrange(num)], [500 + i*100 for i in xrange(num)], radius=0.004)
+        self.assertRaises(ValueError, Surface().add_legend)
+        chart.add_legend()
+        chart.save('chart.kmz', compresslevel=9)
+        chart.save('chart_legend.kml')
+        with zipfile.ZipFile('chart.kmz') as z:
+            self.assertEqual(z.namelist(), ['doc.kml', 'legend.png'])
+            kml = z.read('doc.kml')
+            self.assertEqual(z.read('legend.png')[:4], '\x89PNG')
+            self.assertLess(z.getinfo('doc.kml').compress_size * 5, len(kml))
+        self.assertEqual(kml, chart.kml.getAsString())
+        self.assertIn('<ScreenOverlay><name>Legend</name><Icon><href>legend.png</href></Icon>', kml)
+        self.assertTrue(os.path.isfile('legend.png'))
+        chart.add_legend(colorbar=jet2, href='legend_jet2.png')
+        self.assertNotEqual(chart.resources['legend_jet2.png'], chart.resources['legend.png'])
+        chart.add([10, 10.01, 10.02], [51, 51, 51], [1, 100, 1e4], radius=0.004, colorbar=ColorMap(jet, scale='log'))
+        chart.add_legend(href='legend_log.png')
+        self.assertEqual(chart.resources['legend_log.png'], legendPNG((1, 1e4), jet, scale='log'))
+
+    def test_rasterSurface(self):
+        lon_edges = 10 + numpy.arange(601) * 0.001
+        lat_edges = 51 + numpy.arange(401) * 0.001
+        lon, lat = numpy.meshgrid(lon_edges[:-1], lat_edges[:-1])
+        values = numpy.sin(lon * 50) + numpy.cos(lat * 50)
+        values[:10, :10] = numpy.nan
+        chart = Surface('TestRasterSurface')
+        chart.add_raster(lon_edges, lat_edges, values, opacity=0x80, display_name='Raster')
+        chart.add_raster(lon_edges, lat_edges, values, display_name='Tiles', tile_size=128)
+        chart.add_legend()
+        chart.save('chart_raster.kmz')
+        self.assertEqual(list(chart.resources)[:2], ['raster0.png', 'raster1/0_0_0.png'])
+        overlay = chart.kml.shapes[0].shapes[0]
+        self.assertEqual(overlay.box, (10, 51, lon_edges[-1], lat_edges[-1]))
+        with zipfile.ZipFile('chart_raster.kmz') as z:
+            from PIL import Image
+            from StringIO import StringIO
+            image = Image.open(StringIO(z.read('raster0.png')))
+            self.assertEqual(image.size, (600, 400))
+            self.assertEqual(image.getpixel((0, 399)), (0, 0, 0, 0))     # south west corner is NaN
+            self.assertEqual(image.getpixel((0, 0))[3], 0x80)
+            self.assertIn('<GroundOverlay><Icon><href>raster0.png</href></Icon><LatLonBox><north>51.4</north>', z.read('doc.kml'))
+        # 600 x 400 pixels need a pyramid of 4 levels of 1, 2 x 1, 3 x 2 and 5 x 4 tiles
+        levels = [overlay.drawOrder for overlay in chart.kml.shapes[1].shapes]
+        self.assertEqual([levels.count(level) for level in xrange(4)], [1, 2, 6, 20])
+        leaves = [overlay for overlay in chart.kml.shapes[1].shapes if overlay.drawOrder == 3]
+        self.assertEqual([leaf.region['Lod']['maxLodPixels'] for leaf in leaves], [-1] * 20)
+        self.assertAlmostEqual(sum((leaf.box[2] - leaf.box[0]) * (leaf.box[3] - leaf.box[1]) for leaf in leaves),
+                               0.6 * 0.4)
+        chart.save('chart_raster.kml')
+        self.assertTrue(os.path.isfile('raster1/3_3_4.png'))
+
+    def test_binnedBars(self):
+        random = numpy.random.RandomState(1)
+        lon, lat = 10 + random.uniform(0, 0.2, 100000), 51 + random.uniform(0, 0.1, 100000)
+        z = 100 * numpy.hypot(lon - 10.1, lat - 51.05)
+        chart = Bar3D('TestBinnedBars')
+        chart.add_binned(lon, lat, z, 0.01, display_name='Mean', shared_styles=True)
+        chart.add_binned(lon, lat, None, 0.01, shape='grid', reducer='count', display_name='Count')
+        chart.add_binned(lon, lat, z, 0.01, reducer=90, display_name='P90')
+        chart.save('chart_binned.kml')
+        # About 0.2 * cos(51 deg) / 0.01 by 0.1 / (0.01 * sqrt(3) / 2) hexagons instead of 100000 bars
+        self.assertLess(len(chart.kml.shapes[0].shapes), 200)
+        # 0.2 degrees of longitude at a scale of cos(51 deg) touch 14 columns of squares
+        self.assertEqual(len(chart.kml.shapes[1].shapes), 14 * 10)
+        outline = chart.kml.shapes[0].shapes[0].shapes[0].outerBoundaryIs.coordinates
+        self.assertAlmostEqual(max(point[1] for point in outline) - min(point[1] for point in outline), 0.009)
+        center = numpy.mean(outline[:-1], axis=0)
+        self.assertAlmostEqual(max(point[0] for point in outline) - min(point[0] for point in outline),
+                               0.009 / numpy.cos(numpy.radians(center[1])), delta=0.0002)
+        self.assertGreater(chart.colormap.caxis[1], 5)
+        chart.add_binned([10, 10.5], [33, 33], [1, 2], 0.01, display_name='South')
+        outline = chart.kml.shapes[3].shapes[0].shapes[0].outerBoundaryIs.coordinates
+        self.assertAlmostEqual(max(point[0] for point in outline) - min(point[0] for point in outline),
+                               0.009 / numpy.cos(numpy.radians(33)), delta=0.0002)
+
+    def test_contourSurface(self):
+        lon = 10 + numpy.arange(300) * 0.001
+        lat = 51 + numpy.arange(200) * 0.001
+        lonGrid, latGrid = numpy.meshgrid(lon, lat)
+        values = numpy.sin((lonGrid - 10) * 50) * numpy.cos((latGrid - 51) * 40)
+        chart = Surface('TestContourSurface')
+        chart.add_contours(lon, lat, values, display_name='Bands', shared_styles=True)
+        chart.add_contours(lon, lat, values, levels=(0, 0.5, 1), display_name='Levels', border_color=(0, 0, 0))
+        chart.save('chart_contours.kml')
+        self.assertLess(len(chart.kml.shapes[0].shapes), values.size / 100)
+        self.assertLess(len(chart.kml.shapes[1].shapes), 20)
+        self.assertEqual(len(chart.colormap.colors), 2)
+        bounds = chart.kml.shapes[0].getBounds()
+        self.assertTrue(numpy.allclose(bounds, (10, 51, lon[-1], lat[-1])))
+        self.assertEqual(len(chart.kml.styles.styles),
+                         len(set(placemark.style for placemark in chart.kml.shapes[0].shapes)))
+        self.assertRaises(ValueError, chart.add_contours, lon, lat, values.T)
+
+    def test_simplifiedSurface(self):
+        lon = 10 + numpy.arange(300) * 0.001
+        lat = 51 + numpy.arange(200) * 0.001
+        lonGrid, latGrid = numpy.meshgrid(lon, lat)
+        values = numpy.sin((lonGrid - 10) * 50) * numpy.cos((latGrid - 51) * 40)
+        chart = Surface('TestSimplifiedSurface', stats=Stats())
+        chart.add_contours(lon, lat, values, display_name='Full')
+        chart.add_contours(lon, lat, values, display_name='Simplified', simplify=20, simplify_unit='meters')
+        chart.add_grid(lon[::10], lat[::10], values[:-10:10, :-10:10], display_name='Grid', merge=True,
+                       simplify=0.001)
+        chart.save('chart_simplified.kml')
+        full, simplified = [sum(len(placemark.shapes[0].outerBoundaryIs.coordinates) for placemark in folder.shapes)
+                            for folder in chart.kml.shapes[:2]]
+        self.assertEqual(len(chart.kml.shapes[0].shapes), len(chart.kml.shapes[1].shapes))
+        self.assertLess(simplified, full / 4)
+        self.assertGreaterEqual(chart.stats.records[('simplify', 'Simplified')][1], full - simplified)
+        self.assertIn(('simplify', 'Grid'), chart.stats.records)
+        self.assertRaises(ValueError, chart.add, [((0, 0), (1, 0), (1, 1), (0, 0))], [1], simplify=1,
+                          simplify_unit='feet')
+        # Open polygons keep all their corners
+        chart.add([((0, 0), (1, 0), (1, 1), (0, 1)), ((1, 0), (2, 0), (2, 1), (1, 1))], [1, 2], display_name='Open',
+                  simplify=1e-9)
+        self.assertEqual([len(placemark.shapes[0].outerBoundaryIs.coordinates)
+                          for placemark in chart.kml.shapes[3].shapes], [5, 5])
+        self.assertEqual(set(chart.kml.shapes[3].shapes[0].shapes[0].outerBoundaryIs.coordinates),
+                         set(((0, 0), (1, 0), (1, 1), (0, 1))))
+        self.assertEqual(chart.stats.records[('simplify', 'Open')][1], 0)
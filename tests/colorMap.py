@@ -0,0 +1,37 @@
+"""
+Unit test cases to cover the module colorMap.
+"""
+from __future__ import print_function
+import unittest
+import numpy
+from kmlChart.colorMap import *
+from kmlChart.colorBars import jet
+
+
+class ColorMapTest(unittest.TestCase):
+    def test_linear(self):
+        colormap = ColorMap(jet).fit([0, None, 64])
+        self.assertEqual(colormap.caxis, (0, 64))
+        self.assertEqual(list(colormap.indices([-1, 0, 0.9, 1, 63.5, 64, 100, numpy.nan])), [0, 0, 0, 1, 63, 63, 63, 0])
+        self.assertEqual(colormap.kmlColors()[0], 'ff800000')
+        self.assertEqual(colormap.kmlColors(0x80)[-1], '80000080')
+
+    def test_log(self):
+        colormap = ColorMap(jet, caxis=(1, 1e4), scale='log')
+        self.assertEqual(list(colormap.indices([0, 1, 10, 100, 1e4])), [0, 0, 16, 32, 63])
+        self.assertRaises(ValueError, ColorMap, jet, (0, 10), 'log')
+
+    def test_breakpoints(self):
+        colormap = ColorMap(jet, breakpoints=(0, 10, 100, 1000))
+        self.assertEqual(len(colormap.colors), 3)
+        self.assertEqual(colormap.colors[0], jet[0])
+        self.assertEqual(colormap.colors[-1], jet[-1])
+        self.assertEqual(list(colormap.indices([-5, 5, 10, 500, 5000])), [0, 0, 1, 2, 2])
+
+    def test_edges(self):
+        colormap = ColorMap(jet, caxis=(0, 64))
+        self.assertEqual(colormap.edges().tolist(), range(65))
+        self.assertEqual(list(colormap.indices(colormap.edges()[:-1])), range(64))
+        self.assertTrue(numpy.allclose(ColorMap(jet, (1, 10.0 ** 64), 'log').edges(), 10.0 ** numpy.arange(65)))
+        self.assertEqual(ColorMap(jet, breakpoints=(0, 10, 100)).edges().tolist(), [0, 10, 100])
+        self.assertRaises(ValueError, ColorMap(jet).edges)
@@ -0,0 +1,105 @@
+"""
+Unit test cases to cover the module geometry.
+"""
+from __future__ import print_function
+import unittest
+import numpy
+from kmlChart.geometry import *
+
+
+class GeometryTest(unittest.TestCase):
+    def test_labelRegions(self):
+        labels = labelRegions([[0, 0, 1], [1, 0, 1], [1, -1, 0]])
+        self.assertEqual(labels.tolist(), [[0, 0, 1], [2, 0, 1], [2, -1, 3]])
+
+    def test_mergeCells(self):
+        bins = numpy.zeros((5, 5), dtype=int)
+        bins[1:4, 1:4] = 1
+        bins[2, 2] = 2
+        regions = mergeCells(bins)
+        self.assertEqual([region[0] for region in regions], [0, 1, 2])
+        self.assertEqual(regions[1][1].tolist(), [[1, 1], [4, 1], [4, 4], [1, 4], [1, 1]])
+        self.assertEqual([hole.tolist() for hole in regions[1][2]], [[[2, 2], [2, 3], [3, 3], [3, 2], [2, 2]]])
+        self.assertEqual(len(regions[0][2]), 1)
+        for bin, outer, holes in regions:
+            self.assertGreater(ringArea(outer), 0)
+            area = ringArea(outer) + sum(ringArea(hole) for hole in holes)
+            self.assertEqual(area, (bins == bin).sum())
+
+    def test_cornerTouching(self):
+        regions = mergeCells([[1, 0], [0, 1]])
+        self.assertEqual(len(regions), 4)
+        self.assertTrue(all(len(outer) == 5 and not holes for bin, outer, holes in regions))
+
+    def test_randomGrid(self):
+        bins = numpy.random.RandomState(0).randint(-1, 3, (40, 50))
+        area = sum(ringArea(outer) + sum(ringArea(hole) for hole in holes) for bin, outer, holes in mergeCells(bins))
+        self.assertEqual(area, (bins >= 0).sum())
+
+    def test_pointInRing(self):
+        ring = numpy.array(((0, 0), (2, 0), (2, 2), (0, 2), (0, 0)))
+        self.assertTrue(pointInRing((1, 1), ring))
+        self.assertFalse(pointInRing((3, 1), ring))
+
+    def test_isobands(self):
+        # A cone with a gap in a corner
+        row, column = numpy.mgrid[0:41, 0:61]
+        values = numpy.hypot(column - 30, row - 20)
+        values[:5, :5] = numpy.nan
+        levels = [-numpy.inf, 5, 10, 15, numpy.inf]
+        bands = isobands(values, levels)
+        self.assertEqual([band[0] for band in bands], [0, 1, 2, 3])
+        self.assertEqual([len(band[2]) for band in bands], [0, 1, 1, 1])
+        for band, outer, holes in bands:
+            self.assertGreater(ringArea(outer), 0)
+            self.assertTrue(all(ringArea(hole) < 0 for hole in holes))
+        # The bands are bounded by circles, except for the outermost one
+        for radius, band in ((5, 0), (10, 1), (15, 2)):
+            outer = bands[band][1]
+            self.assertTrue(numpy.allclose(numpy.hypot(outer[:, 0] - 30, outer[:, 1] - 20), radius, atol=0.2))
+        area = sum(ringArea(outer) + sum(ringArea(hole) for hole in holes) for band, outer, holes in bands)
+        self.assertAlmostEqual(area, 40 * 60 - 5 * 5)
+        self.assertAlmostEqual(ringArea(bands[0][1]), numpy.pi * 5 ** 2, delta=1)
+
+    def test_simplifyLine(self):
+        points = numpy.column_stack((numpy.arange(5.0), (0, 0.1, 0, 2, 0)))
+        self.assertEqual(simplifyLine(points, 0.5).tolist(), [True, False, True, True, True])
+        self.assertEqual(simplifyLine(points, 3).tolist(), [True, False, False, False, True])
+
+    def test_simplifyRings(self):
+        # Two squares sharing a wavy edge, which must stay the same in both
+        t = numpy.linspace(0, 1, 101)
+        edge = numpy.column_stack((t, 1 + 0.001 * numpy.sin(t * 20)))
+        lower = numpy.vstack(([[0, 0], [1, 0]], edge[::-1], [[0, 0]]))
+        upper = numpy.vstack((edge, [[1, 2], [0, 2], [0, 1]]))
+        simplifiedLower, simplifiedUpper = simplifyRings([lower, upper], 0.01)
+        self.assertEqual((len(simplifiedLower), len(simplifiedUpper)), (5, 5))
+        self.assertEqual(set(map(tuple, simplifiedLower)) & set(map(tuple, simplifiedUpper)),
+                         set(((0.0, 1.0), tuple(edge[-1]))))
+        self.assertEqual(len(simplifyRings([lower, upper], 1e-9)[0]), len(lower))
+        # Rings which would collapse are kept, also where they touch their neighbours
+        below = numpy.array(((0, 0), (2, 0), (2, 1), (1.1, 1), (0.9, 1), (0, 1), (0, 0)))
+        above = numpy.array(((0, 1), (0.9, 1), (1, 1.001), (1.1, 1), (2, 1), (2, 2), (0, 2), (0, 1)))
+        sliver = numpy.array(((0.9, 1), (1.1, 1), (1, 1.001)))
+        simplifiedBelow, simplifiedAbove, simplifiedSliver = simplifyRings([below, above, sliver], 0.01)
+        self.assertEqual(simplifiedSliver.tolist(), numpy.vstack((sliver, sliver[:1])).tolist())
+        self.assertIn([1, 1.001], simplifiedAbove.tolist())
+        self.assertEqual(len(simplifiedBelow), len(below))
+        triangle = numpy.array(((0, 0, 5), (1, 0, 5), (0.5, 0.001, 5), (0, 0, 5)))
+        self.assertEqual(simplifyRings([triangle], 0.01)[0].tolist(), triangle.tolist())
+        # Open rings are closed
+        square = numpy.array(((0, 0), (1, 0), (1, 1), (0, 1)))
+        self.assertEqual(simplifyRings([square], 1e-9)[0].tolist(), square[[0, 1, 2, 3, 0]].tolist())
+
+    def test_saddle(self):
+        # The diagonal of the cell separates the corners of value 1
+        bands = isobands([[0, 1], [1, 0]], [0.5, 2])
+        self.assertEqual([ringArea(outer) for band, outer, holes in bands], [0.125, 0.125])
+        # Islands of a band within a hole of the same band
+        values = numpy.zeros((9, 9))
+        values[1:8, 1:8] = 2
+        values[3:6, 3:6] = 0
+        values[4, 4] = 2
+        bands = isobands(values, [1, 3])
+        self.assertEqual([len(holes) for band, outer, holes in bands], [1, 0])
+        self.assertGreater(ringArea(bands[0][1]), ringArea(bands[1][1]))
@@ -6,7 +6,11 @@ from __future__ import print_function
 import unittest
 from kmlChart.kmlInterface import *
 from kmlChart.kmlInterface import _renderer
+from kmlChart import kmlInterface
 from math import sin, pi, cos
+from StringIO import StringIO
+import pickle
+import numpy
 
 
 class InterfaceTest( unittest.TestCase ):
@@ -55,9 +59,137 @@ class InterfaceTest( unittest.TestCase ):
             .add(Placemark('TestPlacemark2', description='TestDescription2', style='#myStyle')
                  .add(Polygon((i + (1000,) for i in c2), extrude=True, altitudeMode='relativeToGround')))
         )
+        self.assertEqual(kml.getAsString().count('<styleUrl>#myStyle</styleUrl>'), 2)
         #with open('test.kml', 'w') as f:
         #    f.write(kml.getAsString())
 
+    def test_precision(self):
+        coordinates = ((10.123456789, 50.5, 1000), (-0.1000001, 0.0, 100.25))
+        self.assertEqual(encodeCoordinates(coordinates), '10.123456789,50.5,1000 -0.1000001,0.0,100.25')
+        self.assertEqual(encodeCoordinates(coordinates, 3), '10.123,50.5,1000 -0.1,0,100.25')
+        self.assertEqual(encodeCoordinates(coordinates, 0), '10,50,1000 -0,0,100')
+        self.assertEqual(encodeCoordinates(((1.23456, 2), (3, 4, 5))), '1.23456,2 3,4,5')
+        self.assertEqual(encodeCoordinates(((1.23456, 2), (3, 4, 5)), 2), '1.23,2 3,4,5')
+        for length in range(1, 50):
+            encodeFlatCoordinates(range(2 * length), 2, 3)
+        self.assertEqual(encodeFlatCoordinates(range(6), 2, 3), '0,1 2,3 4,5')
+        self.assertLessEqual(len(kmlInterface._pointFormats), 8)
+        self.kmlData.precision = 2
+        self.kmlData.add(Placemark().add(Polygon(coordinates)))
+        self.kmlData.add(Placemark().add(Polygon(coordinates, precision=4)))
+        kml = self.kmlData.getAsString()
+        self.assertIn('<coordinates>10.12,50.5,1000 -0.1,0,100.25</coordinates>', kml)
+        self.assertIn('<coordinates>10.1235,50.5,1000 -0.1,0,100.25</coordinates>', kml)
+        f = StringIO()
+        self.kmlData.write(f)
+        self.assertEqual(f.getvalue(), kml)
+
+    def test_compactShapes(self):
+        placemark = Placemark('TestPlacemark').add(Polygon(((1.5, 1.0, 3.0), (2.0, 2.0, 3.0), (3.0, 3.5, 3.0))))
+        self.assertFalse(hasattr(placemark, '__dict__'))
+        self.assertIsNone(placemark._settings)
+        self.assertEqual(placemark.settings['name'], 'TestPlacemark')
+        placemark.settings['name'] = 'Renamed'
+        self.kmlData.add(placemark)
+        self.assertIn('<name>Renamed</name>', self.kmlData.getAsString())
+        ring = placemark.shapes[0].outerBoundaryIs
+        self.assertEqual(ring.coordinates, [(1.5, 1.0, 3.0), (2.0, 2.0, 3.0), (3.0, 3.5, 3.0)])
+        ring.coordinates = ((0, 0), (1, 1))
+        self.assertEqual(ring.coordinates, [(0, 0), (1, 1)])
+
+    def test_shapeLists(self):
+        # Integer coordinates and the lists of children stay as in the uncompacted shapes
+        polygon = Polygon(((1, 1), (2, 2), (3, 3)))
+        self.assertEqual(polygon.outerBoundaryIs.coordinates, [(1, 1), (2, 2), (3, 3)])
+        self.assertIsInstance(polygon.outerBoundaryIs.coordinates[0][0], int)
+        self.assertEqual(polygon.innerBoundaryIs, [])
+        placemark = Placemark()
+        placemark.shapes.append(polygon)
+        self.kmlData.shapes.append(placemark)
+        self.assertIn('<coordinates>1,1 2,2 3,3</coordinates>', self.kmlData.getAsString())
+        self.assertIn('<coordinates>1.5,2 3,4.25</coordinates>', LineString(((1.5, 2), (3, 4.25))).toString())
+        self.assertIn('<coordinates>1,2 3,4</coordinates>', LineString(numpy.array([[1, 2], [3, 4]])).toString())
+
+    def test_networkLink(self):
+        self.kmlData.add(NetworkLink('tile.kml', name='Tile', region=region(10, 50, 11, 51)))
+        kml = self.kmlData.getAsString()
+        self.assertIn('<Region><LatLonAltBox><north>51</north><south>50</south><east>11</east><west>10</west></LatLonAltBox>'
+                      '<Lod><minLodPixels>128</minLodPixels><maxLodPixels>-1</maxLodPixels></Lod></Region>'
+                      '<Link><href>tile.kml</href><viewRefreshMode>onRegion</viewRefreshMode></Link>', kml)
+        placemark = Placemark().add(Polygon(((1, 2), (3, -4), (0, 5))))
+        self.assertEqual(placemark.getBounds(), (0, -4, 3, 5))
+        self.assertEqual(Folder().add(placemark).add(Placemark()).getBounds(), (0, -4, 3, 5))
+
+    def test_streaming(self):
+        c = circle(center=(10,50), radius=(0.01 / cos(50.0/180*pi), 0.01))
+        self.kmlData.styles.addStyle('myStyle', PolyStyle(color='ffff0000', outline=0))
+        self.kmlData.add(Folder(name='Empty & unnamed'))
+        self.kmlData.add(Folder(name='TestFolder')
+            .add(Placemark('TestPlacemark', style=[PolyStyle(color='ff00ff00')])
+                 .add(Polygon((i + (1000,) for i in c), extrude=True, altitudeMode='relativeToGround')))
+            .add(Placemark('TestPlacemark2'))
+        )
+        f = StringIO()
+        self.kmlData.write(f)
+        self.assertEqual(f.getvalue(), self.kmlData.getAsString())
+
+    def test_parallel(self):
+        folder = Folder(name='TestFolder')
+        for i in xrange(100):
+            folder.add(Placemark('Placemark %d' % i, style=[PolyStyle(color='ff00ff%02x' % i)])
+                       .add(Polygon(((10 + i, 50), (11 + i, 50), (11 + i, 51), (10 + i, 50)))))
+        self.kmlData.add(folder)
+        self.kmlData.add(Folder(name='Empty'))
+        self.kmlData.add(Placemark('TopLevelPlacemark'))
+        self.assertEqual(self.kmlData.getAsString(processes=3), self.kmlData.getAsString())
+
+    def test_sharedStyles(self):
+        style = PolyStyle.shared(color='ff00ff00', outline=0)
+        self.assertIs(PolyStyle.shared(outline=0, color='ff00ff00'), style)
+        self.assertIsInstance(style, PolyStyle)
+        self.assertEqual((style.color, style['outline'], style.fill), ('ff00ff00', 0, 1))
+        self.assertRaises(TypeError, setattr, style, 'color', 'ff0000ff')
+        self.assertRaises(ValueError, PolyStyle.shared, color='green')
+        self.assertIs(pickle.loads(pickle.dumps(style, 2)), style)
+        self.assertFalse(hasattr(style, '__dict__'))
+        self.assertFalse(hasattr(PolyStyle(), '__dict__'))
+        lineStyle = LineStyle.shared(**{'gx:outerColor': 'ff0000ff'})
+        self.assertEqual((lineStyle['gx:outerColor'], lineStyle.width, lineStyle.color), ('ff0000ff', 1, None))
+        for styles in ([PolyStyle(color='ff00ff00', outline=0)], [style], [style]):
+            self.kmlData.add(Placemark('TestPlacemark', style=styles))
+        placemarks = [xml.split('</Placemark>')[0] for xml in self.kmlData.getAsString().split('<Placemark>')[1:]]
+        self.assertEqual(placemarks[1], placemarks[0])
+        self.assertEqual(placemarks[2], placemarks[0])
+
+    def test_cache(self):
+        cached = KMLdata(cache=True)
+        style = PolyStyle(color='ff00ff00')
+        placemark = Placemark('TestPlacemark', style=[style]).add(Polygon(((10, 50), (11, 50), (11, 51), (10, 50))))
+        folder = Folder(name='TestFolder').add(placemark)
+        for kml in (self.kmlData, cached):
+            kml.add(folder)
+        self.assertEqual(cached.getAsString(), self.kmlData.getAsString())
+        self.assertIsNotNone(placemark._fragment)
+        self.assertIsNotNone(folder._fragment)
+        self.assertFalse(hasattr(placemark.shapes[0].outerBoundaryIs, '_fragment'))
+        placemark.shapes[0].outerBoundaryIs.coordinates = ((12, 50), (13, 50), (13, 51), (12, 50))
+        self.assertEqual(cached.getAsString(), self.kmlData.getAsString())
+        self.assertEqual(len(placemark._fragment[1]), 20)     # SHA-1 digest of the content
+        placemark.shapes[0].outerBoundaryIs.coordinates = ((12.0, 50.0), (13.0, 50.0), (13.0, 51.0), (12.0, 50.0))
+        self.assertIn('12.0,50.0', cached.getAsString())
+        placemark.shapes[0].outerBoundaryIs.coordinates = ((12, 50), (13, 50), (13, 51), (12, 50))
+        self.assertEqual(cached.getAsString(), self.kmlData.getAsString())
+        placemark.shapes[0].addInnerBoundary(((12.2, 50.2), (12.4, 50.2), (12.4, 50.4), (12.2, 50.2)))
+        self.assertEqual(cached.getAsString(), self.kmlData.getAsString())
+        placemark.settings['name'] = 'Renamed'
+        self.assertIsNone(placemark._fragment)
+        self.assertIn('Renamed', cached.getAsString())
+        folder.add(Placemark('Added'))
+        self.assertIn('Added', cached.getAsString())
+        style.color = 'ff0000ff'
+        self.assertEqual(cached.getAsString(), self.kmlData.getAsString())
+        placemark.style = [PolyStyle(color='ff00ff00')]
+        self.assertEqual(cached.getAsString(), self.kmlData.getAsString())
 
 def circle(corners=32, center=(0,0), radius=(1,1)):
     circle = []
@@ -0,0 +1,65 @@
+"""
+Unit test cases to cover the module kmz.
+"""
+from __future__ import print_function
+import unittest
+import struct
+import zipfile
+from StringIO import StringIO
+from kmlChart.kmz import *
+import kmlChart.kmz
+
+
+class KMZTest(unittest.TestCase):
+    def test_archive(self):
+        f = StringIO()
+        archive = KMZWriter(f, compresslevel=9)
+        entry = archive.open('doc.kml')
+        self.assertRaises(ValueError, archive.open, 'other.kml')
+        for i in xrange(1000):
+            entry.write('<Placemark><name>%d</name></Placemark>' % i)
+        entry.close()
+        archive.writestr(u'files/legend.png', '\x89PNG' + '\x00' * 100)
+        archive.writestr('empty.txt', '')
+        archive.close()
+        self.assertLess(len(f.getvalue()), 39000 / 10)
+        with zipfile.ZipFile(StringIO(f.getvalue())) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(z.namelist(), ['doc.kml', 'files/legend.png', 'empty.txt'])
+            self.assertEqual(z.read('doc.kml'), ''.join('<Placemark><name>%d</name></Placemark>' % i
+                                                        for i in xrange(1000)))
+            self.assertEqual(z.read('files/legend.png'), '\x89PNG' + '\x00' * 100)
+            self.assertEqual(z.read('empty.txt'), '')
+
+    def test_zip64(self):
+        # Pretend that everything beyond 100 bytes is large
+        limits = kmlChart.kmz._ZIP64_LIMIT, kmlChart.kmz._ZIP64_COUNT_LIMIT
+        kmlChart.kmz._ZIP64_LIMIT, kmlChart.kmz._ZIP64_COUNT_LIMIT = 100, 3
+        try:
+            f = StringIO()
+            archive = KMZWriter(f, compresslevel=0)
+            archive.writestr('doc.kml', 'x' * 1000)
+            archive.writestr('a.txt', 'a')
+            entry = archive.open('b.txt', zip64=True)
+            entry.write('b' * 200)
+            entry.close()
+            archive.close()
+            entry = KMZWriter(StringIO(), compresslevel=0).open('c.txt')
+            entry.write('c' * 200)
+            self.assertRaises(ValueError, entry.close)
+        finally:
+            kmlChart.kmz._ZIP64_LIMIT, kmlChart.kmz._ZIP64_COUNT_LIMIT = limits
+        self.assertIn('PK\x06\x06', f.getvalue())    # ZIP64 end of central directory
+        # Local headers of streamed ZIP64 entries have the extra field with zero sizes
+        data = f.getvalue()
+        for name in ('doc.kml', 'b.txt'):
+            start = data.rindex('PK\x03\x04', 0, data.index(name))
+            header = struct.unpack('<IHHHHHIIIHH', data[start:start + 30])
+            self.assertEqual((header[1], header[-1]), (45, 20))
+            extra = data[start + 30 + len(name):start + 50 + len(name)]
+            self.assertEqual(struct.unpack('<HHQQ', extra), (1, 16, 0, 0))
+        with zipfile.ZipFile(StringIO(f.getvalue())) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(z.namelist(), ['doc.kml', 'a.txt', 'b.txt'])
+            self.assertEqual(z.getinfo('doc.kml').file_size, 1000)
+            self.assertEqual(z.read('b.txt'), 'b' * 200)
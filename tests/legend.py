@@ -11,3 +11,31 @@ class LegendTest(unittest.TestCase):
     def test_image(self):
         p = pngLegend((3, 4.5), jet)
         p.save('test.png')
+
+    def test_strip(self):
+        p = pngLegend((0, 1), jet)
+        image = p._image
+        self.assertEqual(image.getpixel((30, 388)), jet[0] + (0xff,))
+        self.assertEqual(image.getpixel((30, 11)), jet[-1] + (0xff,))
+        self.assertEqual(image.getpixel((10, 200)), (0xff, 0xff, 0xff, 0xff))     # outline
+        small = pngLegend((0, 1), jet, size=(100, 200))
+        self.assertEqual(small._image.size, (100, 200))
+        self.assertEqual(small._font.size, 8)
+        self.assertIs(pngLegend((5, 6), jet)._font, p._font)
+
+    def test_legendPNG(self):
+        png = legendPNG((3, 4.5), jet)
+        self.assertEqual(png[:4], '\x89PNG')
+        self.assertIs(legendPNG([4.5, 3], list(jet)), png)
+        self.assertIsNot(legendPNG((3, 4.5), jet, size=(100, 200)), png)
+        self.assertIsNot(legendPNG((3, 4.5), jet, scale='log'), png)
+
+    def test_scales(self):
+        p = pngLegend((1, 1000), jet, scale='log')
+        self.assertEqual([label for value, label in p.ticks], ['1', '10', '100', '1000'])
+        self.assertAlmostEqual(p.position(10), 1 / 3.0)
+        self.assertEqual(p._image.getpixel((30, 388)), jet[0] + (0xff,))
+        p = pngLegend(None, jet[:3], breakpoints=(0, 1, 10, 100))
+        self.assertEqual([label for value, label in p.ticks], ['0', '1', '10', '100'])
+        self.assertAlmostEqual(p.position(10), 2 / 3.0)
+        self.assertEqual(p._image.getpixel((30, 200)), jet[1] + (0xff,))
@@ -0,0 +1,43 @@
+"""
+Unit test cases to cover the module raster.
+"""
+from __future__ import print_function
+import unittest
+import numpy
+from kmlChart.raster import *
+
+
+class RasterTest(unittest.TestCase):
+    def test_pixelGrid(self):
+        cells = numpy.arange(6).reshape((2, 3))
+        pixels, box = pixelGrid([0, 1, 2, 3], [50, 51, 52], cells)
+        self.assertEqual(pixels.tolist(), [[3, 4, 5], [0, 1, 2]])
+        self.assertEqual(box, (0, 50, 3, 52))
+        pixels, box = pixelGrid([3, 2, 1, 0], [52, 51, 50], cells)
+        self.assertEqual(pixels.tolist(), [[2, 1, 0], [5, 4, 3]])
+        # Uneven edges are sampled at the smallest spacing
+        pixels, box = pixelGrid([0, 1, 3, 4], [50, 51, 52], cells)
+        self.assertEqual(pixels.tolist(), [[3, 4, 4, 5], [0, 1, 1, 2]])
+        self.assertRaises(ValueError, pixelGrid, [0, 1, 1, 2], [50, 51, 52], cells)
+        self.assertRaises(ValueError, pixelGrid, [0, 1, 2], [50, 51, 52], cells)
+
+    def test_colorImage(self):
+        image = colorImage(numpy.array([[0, 1], [-1, 1]]), [(255, 0, 0), (0, 0, 255)], 0x80)
+        self.assertEqual(image.size, (2, 2))
+        self.assertEqual(list(image.getdata()), [(255, 0, 0, 0x80), (0, 0, 255, 0x80), (0, 0, 0, 0),
+                                                 (0, 0, 255, 0x80)])
+        self.assertEqual(pngString(image)[:4], '\x89PNG')
+
+    def test_pyramid(self):
+        pixels = numpy.zeros((300, 500), dtype=int)
+        pixels[:, 384:] = -1
+        tiles = list(pyramid(pixels, (0, 0, 5, 3), 128))
+        self.assertEqual([tile[:3] for tile in tiles if tile[0] < 2], [(0, 0, 0), (1, 0, 0), (1, 0, 1), (1, 1, 0),
+                                                                       (1, 1, 1)])
+        self.assertEqual(tiles[0][3].shape, (75, 125))
+        self.assertEqual(tiles[0][4], (0, 0, 5, 3))
+        # The transparent last column of tiles is left out
+        leaves = [tile for tile in tiles if tile[5]]
+        self.assertEqual(len(leaves), 3 * 3)
+        self.assertEqual(leaves[-1][3].shape, (44, 128))
+        self.assertEqual(leaves[0][4], (0, 3 - 1.28, 1.28, 3))
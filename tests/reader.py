@@ -0,0 +1,107 @@
+"""
+Unit test cases to cover the module reader.
+"""
+from __future__ import print_function
+import unittest
+from StringIO import StringIO
+import numpy
+from kmlChart.reader import *
+from kmlChart.chart import Bar3D, Surface
+from kmlChart.colorBars import jet, jet2
+from kmlChart.colorMap import ColorMap
+from kmlChart.kmlInterface import KMLdata, Folder, Placemark, Polygon, PolyStyle
+
+
+class ReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.chart = Bar3D('TestReader', description='Bars & more')
+        lat = 51 + numpy.arange(50) * 0.01
+        self.chart.add(numpy.full(50, 10.0), lat, numpy.arange(50.0), radius=0.004, display_name='Inline')
+        self.chart.add(numpy.full(50, 10.02), lat, numpy.arange(50.0), radius=0.004, display_name='Shared',
+                       label=['Bar %d' % i for i in xrange(50)], shared_styles=True)
+        self.chart.add(numpy.full(50, 10.04), lat, numpy.arange(50.0), radius=0.004, display_name='Batched',
+                       batch=True)
+        self.chart.save('reader.kml')
+
+    def test_read(self):
+        kml = read('reader.kml')
+        self.assertEqual(kml.getAsString(), self.chart.kml.getAsString())
+        self.assertEqual([len(folder.shapes) for folder in kml.shapes], [50, 50, len(self.chart.kml.shapes[2].shapes)])
+        settings, styles = readHead('reader.kml')
+        self.assertEqual(settings['name'], 'TestReader')
+        self.assertEqual(settings['description'], 'Bars & more')
+        self.assertEqual(len(styles.styles), len(self.chart.kml.styles.styles))
+
+    def test_readFileObject(self):
+        with open('reader.kml') as f:
+            kml = read(f)
+        self.assertEqual(kml.getAsString(), self.chart.kml.getAsString())
+        self.assertEqual(read(StringIO(KMLdata(name='Empty').getAsString())).settings['name'], 'Empty')
+        with open('reader.kml') as f:
+            self.assertRaises(TypeError, merge, [f], 'reader_merged.kml')
+            self.assertRaises(TypeError, restyle, f, 'reader_restyled.kml')
+
+    def test_iterPlacemarks(self):
+        pairs = list(iterPlacemarks('reader.kml'))
+        self.assertEqual(len(pairs), 100 + len(self.chart.kml.shapes[2].shapes))
+        self.assertIs(pairs[0][0], pairs[49][0])
+        self.assertIsNot(pairs[0][0], pairs[50][0])
+        self.assertEqual(pairs[50][0].settings['name'], 'Shared')
+        self.assertEqual(pairs[50][1].settings['name'], 'Bar 0')
+        self.assertEqual(altitude(pairs[49][1], None), 49)
+
+    def test_labels(self):
+        labels = ['007', '0042', '1.50', '1e3']
+        chart = Bar3D('007', description='1.50')
+        chart.add([10] * 4, [51] * 4, numpy.arange(4.0), radius=0.004, label=labels, description=labels[::-1])
+        chart.save('reader_labels.kml')
+        merge(['reader_labels.kml'], 'reader_labels_merged.kml')
+        restyle('reader_labels.kml', 'reader_labels_restyled.kml', jet2)
+        for filename in ('reader_labels.kml', 'reader_labels_merged.kml', 'reader_labels_restyled.kml'):
+            kml = read(filename)
+            self.assertEqual((kml.settings['name'], kml.settings['description']), ('007', '1.50'))
+            self.assertEqual([placemark.settings['name'] for placemark in kml.shapes[0].shapes], labels)
+            self.assertEqual([placemark.settings['description'] for placemark in kml.shapes[0].shapes], labels[::-1])
+        self.assertEqual(read('reader_labels.kml').getAsString(), chart.kml.getAsString())
+
+    def test_merge(self):
+        first = KMLdata(name='First')
+        first.styles.addStyle('myStyle', PolyStyle(color='ff0000ff'))
+        first.add(Folder(name='A').add(Placemark('a', style='#myStyle').add(Polygon(((0, 0), (1, 0), (1, 1), (0, 0))))))
+        second = KMLdata(name='Second')
+        second.styles.addStyle('myStyle', PolyStyle(color='ff00ff00'))
+        second.add(Placemark('b', style='#myStyle').add(Polygon(((0, 0), (1, 0), (1, 1), (0, 0)))))
+        for kml, filename in ((first, 'reader_first.kml'), (second, 'reader_second.kml')):
+            with open(filename, 'w') as f:
+                kml.write(f)
+        merge(['reader_first.kml', 'reader_second.kml', 'reader.kml'], 'reader_merged.kml')
+        merged = read('reader_merged.kml')
+        self.assertEqual(merged.settings['name'], 'First')
+        self.assertEqual(len(merged.shapes), 5)
+        self.assertEqual(merged.shapes[1].style, '#myStyle_1')
+        self.assertEqual(merged.styles.styles['myStyle_1'][0].color, 'ff00ff00')
+        self.assertEqual(len(merged.styles.styles), len(self.chart.kml.styles.styles) + 2)
+
+    def test_restyle(self):
+        restyle('reader.kml', 'reader_restyled.kml', jet2)
+        reference = Bar3D()
+        reference.add([10] * 50, [51] * 50, numpy.arange(50.0), radius=0.004, colorbar=jet2)
+        colors = [placemark.style[0].color for placemark in reference.kml.shapes[0].shapes]
+        restyled = read('reader_restyled.kml')
+        for folder in restyled.shapes[:2]:
+            self.assertEqual([restyled.styles.styles[placemark.style[1:]][0].color for placemark in folder.shapes],
+                             colors)
+
+        surface = Surface('TestRestyleSurface')
+        c = numpy.array(((-0.005, -0.005), (+0.005, -0.005), (+0.005, +0.005), (-0.005, +0.005), (-0.005, -0.005)))
+        corners = c[None, :, :] + numpy.column_stack((numpy.full(10, 10.0), 51 + numpy.arange(10) * 0.01))[:, None, :]
+        surface.add(corners, numpy.arange(10.0), opacity=0x80, caxis=(0, 10))
+        surface.save('reader_surface.kml')
+        restyle('reader_surface.kml', 'reader_surface_restyled.kml', ColorMap(jet, caxis=(0, 20)),
+                value=colorValue(ColorMap(jet, caxis=(0, 10))))
+        restyled = read('reader_surface_restyled.kml')
+        colors = [restyled.styles.styles[placemark.style[1:]][0].color for placemark in restyled.shapes[0].shapes]
+        original = ColorMap(jet, caxis=(0, 10))
+        centers = numpy.linspace(0, 10, 2 * len(jet) + 1)[1::2][original.indices(numpy.arange(10.0))]
+        target = ColorMap(jet, caxis=(0, 20))
+        self.assertEqual(colors, ['80' + target.kmlColors()[i][2:] for i in target.indices(centers)])
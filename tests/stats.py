@@ -0,0 +1,41 @@
+"""
+Unit test cases to cover the module stats.
+"""
+from __future__ import print_function
+import unittest
+from StringIO import StringIO
+import numpy
+from kmlChart.stats import *
+from kmlChart.chart import Bar3D
+
+
+class StatsTest(unittest.TestCase):
+    def test_record(self):
+        calls = []
+        stats = Stats(callback=lambda *args: calls.append(args))
+        stats.record('render', 'a', 1.0, 10, 100)
+        stats.record('render', 'a', 0.5, 5, 50)
+        stats.record('render', 'b', 0.5, 1, 1)
+        self.assertEqual(stats.records[('render', 'a')], [1.5, 15, 150])
+        self.assertEqual(stats.phases()['render'], [2.0, 16, 151])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(stats.asList()), 2)
+        lapTimer(None)('nothing')
+
+    def test_chart(self):
+        stats = Stats()
+        chart = Bar3D('TestStats', stats=stats)
+        chart.add(numpy.full(10, 10.0), numpy.linspace(50, 51, 10), numpy.arange(10.0), radius=1e-3,
+                  display_name='Bars')
+        chart.add(numpy.full(5, 10.0), numpy.linspace(50, 51, 5), numpy.arange(5.0), radius=1e-3,
+                  display_name='Other bars')
+        kml = chart.kml.getAsString()
+        f = StringIO()
+        chart.kml.write(f)
+        print(stats.report())
+        for phase in ('validation', 'colors', 'geometry', 'construction', 'render', 'stream'):
+            self.assertEqual(stats.records[(phase, 'Bars')][1], 10)
+            self.assertEqual(stats.records[(phase, 'Other bars')][1], 5)
+        self.assertEqual(stats.records[('serialize', None)][2], len(kml))
+        self.assertEqual(sum(totals[2] for (phase, series), totals in stats.records.iteritems()
+                             if phase in ('document', 'stream')), len(f.getvalue()))